@@ -1,15 +1,31 @@
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import seaborn as sns
-from datetime import datetime
+from tkinter import ttk, filedialog, messagebox, simpledialog
 import os
 import threading
-import numpy as np
 from tkcalendar import DateEntry
 
+# Only what the window needs is imported before it is shown. The pipeline
+# modules pull in pandas and numpy: they are imported on first use or by
+# the warm-up job started behind the window. matplotlib waits for the
+# first chart.
+from cdr_defaults import DEFAULT_BURST_MINUTES, DEFAULT_MEETING_MINUTES
+from cdr_jobs import JobScheduler
+from cdr_profile import PROFILER, format_record, stage
+from cdr_startup import LazyModule, import_modules
+
+cdr_core = LazyModule('cdr_core')
+cdr_cache = LazyModule('cdr_cache')
+cdr_dataset = LazyModule('cdr_dataset')
+cdr_dtypes = LazyModule('cdr_dtypes')
+cdr_ingest = LazyModule('cdr_ingest')
+cdr_mappings = LazyModule('cdr_mappings')
+cdr_store = LazyModule('cdr_store')
+cdr_table = LazyModule('cdr_table')
+cdr_client = LazyModule('cdr_client')
+
+# Appended to load errors shown to the user
+LOAD_ERROR_HINTS = "\n\nPlease ensure:\n1. File is not open in another program\n2. File format is correct\n3. File is not corrupted\n4. Try saving as Excel (.xlsx) if CSV fails"
+
 class CDRAnalyzerApp:
     def __init__(self, root):
         self.root = root
@@ -18,11 +34,28 @@ class CDRAnalyzerApp:
         self.root.configure(bg="#f0f0f0")
        
         self.df = None
-        self.filtered_df = None
+        self.dataset = None
+        self.analyzed_rows = 0
+        self.pending_paths = None
+        self.pending_preview = None
+        self.pending_load = None
+        self.load_out_of_core = False
+        self.load_server = None
         self.results = {}
         self.current_figure = None
+        self.chart = None
         self.canvas = None
         self.column_mappings = {}
+        self._cache = None
+        self._profiles = None
+       
+        # Loads, appends and analyses run as background jobs; outcomes and
+        # progress are handed back to the Tk loop
+        self.jobs = JobScheduler(lambda callback: self.root.after(0, callback))
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.source_key = None
+        self.source_path = None
+        self.load_errors = {}
        
         # Create a style
         self.style = ttk.Style()
@@ -45,6 +78,39 @@ class CDRAnalyzerApp:
         self.status_bar = ttk.Label(self.root, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
        
+        # Last finished pipeline stage, kept after the status moves on
+        self.timing_var = tk.StringVar()
+        ttk.Label(self.status_bar, textvariable=self.timing_var, anchor=tk.E).pack(side=tk.RIGHT, padx=5)
+        PROFILER.add_listener(self._report_stage)
+       
+        # Once the window has been drawn, the data stack is imported in the
+        # background so the first load does not wait for it
+        self.root.after_idle(self._warm_imports)
+       
+    @property
+    def cache(self):
+        # Created on first use: cdr_cache imports pandas and pyarrow
+        if self._cache is None:
+            self._cache = cdr_cache.DatasetCache()
+        return self._cache
+       
+    @property
+    def profiles(self):
+        if self._profiles is None:
+            self._profiles = cdr_mappings.MappingProfiles()
+        return self._profiles
+       
+    def _warm_imports(self):
+        self.jobs.submit('imports', import_modules, on_done=self._on_imports_done, on_cancel=self._on_job_cancelled,
+                         on_error=self._on_job_error("Failed to load the analysis modules", "Analysis modules unavailable"))
+       
+    def _on_imports_done(self, _):
+        # Widgets that need the data stack are completed now
+        if not self.cache.available:
+            self.use_cache_var.set(False)
+            self.cache_check.state(['disabled'])
+        self._create_results_table()
+       
     def create_frames(self):
         # Main container with padding
         self.main_frame = ttk.Frame(self.root, padding="10")
@@ -81,6 +147,7 @@ class CDRAnalyzerApp:
         ttk.Entry(file_frame, textvariable=self.file_path_var, width=50).pack(side=tk.LEFT, padx=(0, 5), fill=tk.X, expand=True)
        
         ttk.Button(file_frame, text="Browse...", command=self.browse_file).pack(side=tk.LEFT)
+        ttk.Button(file_frame, text="Browse Folder...", command=self.browse_folder).pack(side=tk.LEFT, padx=(5, 0))
        
         # Date range row
         date_frame = ttk.Frame(self.input_frame)
@@ -97,8 +164,37 @@ class CDRAnalyzerApp:
         ttk.Label(date_frame, text="To:").pack(side=tk.LEFT, padx=(10, 5))
         DateEntry(date_frame, width=12, textvariable=self.end_date_var, date_pattern='y-mm-dd').pack(side=tk.LEFT)
        
-        # Load data button
-        ttk.Button(self.input_frame, text="Load Data", command=self.load_data).pack(pady=10)
+        # Cache option row
+        # Disabled once the imports show pyarrow is missing
+        self.use_cache_var = tk.BooleanVar(value=True)
+        self.cache_check = ttk.Checkbutton(self.input_frame, text="Reuse cached dataset when available", variable=self.use_cache_var)
+        self.cache_check.pack(anchor=tk.W, pady=5)
+           
+        # Profiling option row
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.input_frame, text="Profile load and analysis runs (cProfile report in ~/.cdr_analyser/logs/profiles)",
+                        variable=self.profile_var).pack(anchor=tk.W, pady=5)
+           
+        # Out-of-core option row
+        self.out_of_core_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.input_frame, text="Out-of-core mode (keep records on disk for files larger than memory)",
+                        variable=self.out_of_core_var).pack(anchor=tk.W, pady=5)
+           
+        # Analysis server row; with an address the case is loaded and
+        # analysed by a running cdr_server shared with other investigators
+        server_frame = ttk.Frame(self.input_frame)
+        server_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(server_frame, text="Analysis Server (optional):").pack(side=tk.LEFT, padx=(0, 5))
+        self.server_url_var = tk.StringVar()
+        ttk.Entry(server_frame, textvariable=self.server_url_var, width=40).pack(side=tk.LEFT)
+        ttk.Label(server_frame, text="e.g. http://127.0.0.1:8765").pack(side=tk.LEFT, padx=5)
+       
+        # Load / append buttons
+        load_frame = ttk.Frame(self.input_frame)
+        load_frame.pack(pady=10)
+        ttk.Button(load_frame, text="Load Data", command=self.load_data).pack(side=tk.LEFT, padx=5)
+        ttk.Button(load_frame, text="Append File...", command=self.append_data).pack(side=tk.LEFT, padx=5)
+        ttk.Button(load_frame, text="Cancel", command=self.cancel_jobs).pack(side=tk.LEFT, padx=5)
        
     def create_analysis_widgets(self):
         # Analysis options
@@ -129,31 +225,75 @@ class CDRAnalyzerApp:
         ttk.Radiobutton(analysis_type_frame, text="Location Analysis", variable=self.analysis_type_var, value="location").pack(side=tk.LEFT, padx=5)
         ttk.Radiobutton(analysis_type_frame, text="Called Numbers", variable=self.analysis_type_var, value="numbers").pack(side=tk.LEFT, padx=5)
         ttk.Radiobutton(analysis_type_frame, text="Call Volume by Date", variable=self.analysis_type_var, value="date").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(analysis_type_frame, text="Common Contacts", variable=self.analysis_type_var, value="common").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(analysis_type_frame, text="Contact Network", variable=self.analysis_type_var, value="network").pack(side=tk.LEFT, padx=5)
+       
+        temporal_type_frame = ttk.Frame(self.analysis_frame)
+        temporal_type_frame.pack(fill=tk.X, pady=5)
+       
+        ttk.Label(temporal_type_frame, text="Activity Patterns:").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Radiobutton(temporal_type_frame, text="Day/Hour Heatmap", variable=self.analysis_type_var, value="heatmap").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(temporal_type_frame, text="Active Hours", variable=self.analysis_type_var, value="hours").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(temporal_type_frame, text="Call Bursts", variable=self.analysis_type_var, value="bursts").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(temporal_type_frame, text="Co-presence Events", variable=self.analysis_type_var, value="copresence").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(temporal_type_frame, text="Meetings", variable=self.analysis_type_var, value="meetings").pack(side=tk.LEFT, padx=5)
+        ttk.Label(temporal_type_frame, text="Burst Window (min):").pack(side=tk.LEFT, padx=(10, 5))
+        self.burst_minutes_var = tk.StringVar(value=str(DEFAULT_BURST_MINUTES))
+        ttk.Combobox(temporal_type_frame, textvariable=self.burst_minutes_var, values=["5", "15", "30", "60", "120"], width=5).pack(side=tk.LEFT)
+       
+        talk_type_frame = ttk.Frame(self.analysis_frame)
+        talk_type_frame.pack(fill=tk.X, pady=5)
+       
+        ttk.Label(talk_type_frame, text="Talk Time:").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Radiobutton(talk_type_frame, text="By Number", variable=self.analysis_type_var, value="talk_numbers").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(talk_type_frame, text="By Location", variable=self.analysis_type_var, value="talk_locations").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(talk_type_frame, text="By Date", variable=self.analysis_type_var, value="talk_dates").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(talk_type_frame, text="Longest Calls", variable=self.analysis_type_var, value="longest").pack(side=tk.LEFT, padx=5)
+       
+        # Suspects for the contact analyses
+        suspects_frame = ttk.Frame(self.analysis_frame)
+        suspects_frame.pack(fill=tk.X, pady=5)
+       
+        ttk.Label(suspects_frame, text="Suspect Numbers (comma separated):").pack(side=tk.LEFT, padx=(0, 5))
+        self.suspects_var = tk.StringVar()
+        ttk.Entry(suspects_frame, textvariable=self.suspects_var, width=50).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Label(suspects_frame, text="Hops:").pack(side=tk.LEFT, padx=(0, 5))
+        self.hops_var = tk.StringVar(value="1")
+        ttk.Spinbox(suspects_frame, from_=1, to=3, increment=1, textvariable=self.hops_var, width=3).pack(side=tk.LEFT)
+        ttk.Label(suspects_frame, text="Meeting Window (min):").pack(side=tk.LEFT, padx=(10, 5))
+        self.meeting_minutes_var = tk.StringVar(value=str(DEFAULT_MEETING_MINUTES))
+        ttk.Spinbox(suspects_frame, from_=5, to=240, increment=5, textvariable=self.meeting_minutes_var, width=5).pack(side=tk.LEFT)
        
         # Analyze button
         ttk.Button(self.analysis_frame, text="Analyze Data", command=self.analyze_data).pack(pady=10)
        
     def create_results_widgets(self):
-        # Results list
-        self.results_listbox = tk.Listbox(self.results_controls_frame, width=30, height=20)
-        self.results_listbox.pack(side=tk.TOP, fill=tk.BOTH, expand=True, pady=5)
+        # The results grid is added above the buttons once pandas is loaded
+        self.results_table = None
        
         # Export results button
-        export_frame = ttk.Frame(self.results_controls_frame)
-        export_frame.pack(fill=tk.X, pady=5)
+        self.export_frame = ttk.Frame(self.results_controls_frame)
+        self.export_frame.pack(fill=tk.X, pady=5)
        
-        ttk.Button(export_frame, text="Export Results", command=self.export_results).pack(side=tk.LEFT, padx=5)
-        ttk.Button(export_frame, text="Export Chart", command=self.export_chart).pack(side=tk.LEFT, padx=5)
+        ttk.Button(self.export_frame, text="Export Results", command=self.export_results).pack(side=tk.LEFT, padx=5)
+        ttk.Button(self.export_frame, text="Export Chart", command=self.export_chart).pack(side=tk.LEFT, padx=5)
        
         # Placeholder for chart
         self.fig_placeholder = ttk.Label(self.visualization_frame, text="Analysis results will appear here")
         self.fig_placeholder.pack(fill=tk.BOTH, expand=True)
        
+    def _create_results_table(self):
+        # Results grid; only the rows on screen are drawn, and clicking a
+        # heading sorts by that column
+        if self.results_table is None:
+            self.results_table = cdr_table.VirtualTable(self.results_controls_frame, height=20, column_width=100)
+            self.results_table.pack(side=tk.TOP, fill=tk.BOTH, expand=True, pady=5, before=self.export_frame)
+       
     def browse_file(self):
         file_path = filedialog.askopenfilename(
             title="Select CDR Data File",
             filetypes=[
-                ("Excel files", "*.xlsx;*.xls"),
+                ("Excel files", "*.xlsx;*.xlsm;*.xls;*.xlsb;*.ods"),
                 ("CSV files", "*.csv"),
                 ("All files", "*.*")
             ]
@@ -161,78 +301,239 @@ class CDRAnalyzerApp:
         if file_path:
             self.file_path_var.set(file_path)
            
+    def browse_folder(self):
+        # A case folder holds one CDR file per suspect or operator
+        folder = filedialog.askdirectory(title="Select Folder of CDR Files")
+        if folder:
+            self.file_path_var.set(folder)
+           
     def load_data(self):
         file_path = self.file_path_var.get()
         if not file_path:
             messagebox.showerror("Error", "Please select a file first")
             return
            
-        if not os.path.exists(file_path):
-            messagebox.showerror("Error", "Selected file does not exist")
+        # A single file, a folder or a glob pattern such as cases/*.csv
+        paths = cdr_ingest.expand_sources(file_path)
+        if not paths:
+            if os.path.isdir(file_path):
+                messagebox.showerror("Error", "No CDR files found in the selected folder")
+            else:
+                messagebox.showerror("Error", "Selected file does not exist")
             return
            
-        try:
-            self.status_var.set("Loading data...")
-            self.root.update_idletasks()
+        out_of_core = self.out_of_core_var.get()
+        server_url = self.server_url_var.get().strip() or None
+        if server_url and out_of_core:
+            messagebox.showerror("Error", "Out-of-core mode is not available with an analysis server")
+            return
            
-            # Start in a separate thread to prevent UI freezing
-            threading.Thread(target=self._load_data_thread, args=(file_path,), daemon=True).start()
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load data: {str(e)}")
-            self.status_var.set("Ready")
+        self.status_var.set("Loading data...")
+           
+        # A new load replaces any load, append or store build still running;
+        # the server keeps its own loaded copy, so the local cache is skipped
+        self.jobs.submit(
+            'load', self._run_profiled, 'load', self._load_data_thread, paths, out_of_core,
+            self.use_cache_var.get() and not server_url,
+            on_done=lambda result: self._update_ui_after_load(file_path, paths, out_of_core, server_url, *result),
+            on_error=self._on_job_error("Error loading data", "Failed to load", LOAD_ERROR_HINTS),
+            on_cancel=self._on_job_cancelled, on_progress=self.status_var.set,
+            exclusive=True, supersede=True
+        )
            
-    def _load_data_thread(self, file_path):
-        try:
-            # Determine file type and load accordingly
-            file_ext = os.path.splitext(file_path)[1].lower()
-            
-            if file_ext in ['.xlsx', '.xls']:
-                # Load Excel file
-                self.df = pd.read_excel(file_path)
-            elif file_ext == '.csv':
-                # Load CSV file - try multiple encodings
-                encodings = ['utf-8', 'latin-1', 'iso-8859-1', 'cp1252', 'utf-16']
-                loaded = False
-                
-                for encoding in encodings:
-                    try:
-                        self.df = pd.read_csv(file_path, sep=None, engine='python', encoding=encoding, encoding_errors='replace')
-                        loaded = True
-                        break
-                    except (UnicodeDecodeError, Exception):
-                        continue
-                
-                if not loaded:
-                    raise ValueError("Could not decode file with any standard encoding")
+    def cancel_jobs(self):
+        # Running jobs stop at their next chunk; queued ones never start
+        if not self.jobs.busy():
+            return
+        self.jobs.cancel()
+        self.status_var.set("Cancelling...")
+           
+    def _on_job_cancelled(self):
+        self.status_var.set("Cancelled")
+           
+    def _on_job_error(self, prefix, status, hint=""):
+        # on_error handler for a job: show the error and leave a status
+        def show(error):
+            self._show_error(f"{prefix}: {str(error)}{hint}" if prefix else str(error))
+            self.status_var.set(status)
+        return show
+           
+    def _on_close(self):
+        # Stop background jobs at their next chunk instead of waiting for them
+        self.jobs.shutdown()
+        self.root.destroy()
+           
+    def _run_profiled(self, job, label, func, *args):
+        # Job entry; with profiling on, the whole run is captured
+        if not self.profile_var.get():
+            return func(job, *args)
+        with PROFILER.capture(label) as report_path:
+            result = func(job, *args)
+        message = f"Profile written to {report_path}"
+        self.root.after(0, lambda: self.timing_var.set(message))
+        return result
+           
+    def _report_stage(self, event, record):
+        # Profiler listener: running stages go to the status bar, finished
+        # ones to the timing label. Worker threads hand the update to the Tk
+        # loop; on the Tk thread it is applied at once so it keeps its order.
+        if event == 'start':
+            var, message = self.status_var, f"Running {record['stage']}..."
+        else:
+            var, message = self.timing_var, format_record(record)
+        if threading.current_thread() is threading.main_thread():
+            var.set(message)
+        else:
+            self.root.after(0, lambda: var.set(message))
+           
+    def _load_data_thread(self, job, paths, out_of_core, use_cache):
+        # Returns (cache key, cached dataset or None, preview frame or None)
+        source_key = None
+        if use_cache and self.cache.available and not out_of_core:
+            # Reopening a known export skips parsing and column mapping
+            job.report("Checking dataset cache...")
+            source_key = cdr_cache.files_digest(paths)
+            cached = self.cache.load(source_key)
+            if cached is not None:
+                return source_key, cdr_dataset.CDRDataset(cached.df, cached.mapping, cached.phone_table), None
+           
+        # Only the header and a sample are read now, so the mapping dialog
+        # opens at once; the mapped columns are loaded after confirmation
+        job.check()
+        return source_key, None, cdr_ingest.read_preview(paths[0])
+           
+    def append_data(self):
+        # New batches from the operator are added to the loaded case with
+        # the same column mapping instead of reloading everything
+        if not isinstance(self.dataset, cdr_dataset.CDRDataset):
+            if self.dataset is None:
+                messagebox.showerror("Error", "Please load data and map columns first")
+            elif self.load_server:
+                messagebox.showerror("Error", "Appending is not available with an analysis server")
             else:
-                # Try CSV as default with multiple encodings
-                encodings = ['utf-8', 'latin-1', 'iso-8859-1', 'cp1252', 'utf-16']
-                loaded = False
-                
-                for encoding in encodings:
-                    try:
-                        self.df = pd.read_csv(file_path, sep=None, engine='python', encoding=encoding, encoding_errors='replace')
-                        loaded = True
-                        break
-                    except (UnicodeDecodeError, Exception):
-                        continue
-                
-                if not loaded:
-                    raise ValueError("Could not decode file with any standard encoding")
-           
-            # Update UI in the main thread
-            self.root.after(0, self._update_ui_after_load)
+                messagebox.showerror("Error", "Appending is not available in out-of-core mode")
+            return
+           
+        file_path = filedialog.askopenfilename(
+            title="Select CDR File to Append",
+            filetypes=[("CSV files", "*.csv"), ("Excel files", "*.xlsx *.xlsm *.xls *.xlsb *.ods"), ("All files", "*.*")]
+        )
+        if not file_path:
+            return
+           
+        self.status_var.set("Appending data...")
+        self.jobs.submit(
+            'load', self._append_data_thread, self.dataset, file_path, self.source_key,
+            on_done=lambda result: self._update_ui_after_append(*result),
+            on_error=self._on_job_error("Error appending data", "Failed to append"),
+            on_cancel=self._on_job_cancelled, on_progress=self.status_var.set,
+            exclusive=True
+        )
+           
+    def _append_data_thread(self, job, dataset, file_path, source_key):
+        # read_cdr_file checks the mapped columns exist in the new file
+        new_df = cdr_ingest.read_cdr_file(file_path, progress=self._load_progress(job),
+                               usecols=cdr_core.mapped_columns(dataset.mapping),
+                               dtypes=cdr_dtypes.read_dtypes(dataset.mapping))
+        job.check()
+        added, duplicates, failed_rows = dataset.append(new_df)
+           
+        if source_key and not added.empty:
+            try:
+                self.cache.append(source_key, added, dataset.phone_table, digest=cdr_cache.files_digest([file_path]))
+            except Exception as e:
+                job.report(f"Could not write dataset cache: {str(e)}")
+        return len(added), duplicates, failed_rows
+           
+    def _update_ui_after_append(self, added, duplicates, failed_rows):
+        self.df = self.dataset.df
+        message = f"Appended {added} new records ({duplicates} duplicates skipped)\n\nDate range: {self.dataset.min_datetime} to {self.dataset.max_datetime}"
+        if failed_rows:
+            message += f"\n\n{failed_rows} rows had dates that could not be parsed and will be ignored"
+        messagebox.showinfo("Success", message)
+        self.status_var.set(f"Loaded {len(self.dataset)} records")
+           
+    def _load_progress(self, job):
+        # Progress callback for the readers; reporting is also where a
+        # cancelled job stops, between two chunks
+        def report(fraction, rows):
+            job.report(f"Loading data... {fraction:.0%} ({rows:,} rows)")
+        return report
+           
+    def _batch_progress(self, job):
+        def report(done, total, path, error):
+            state = "failed" if error else "loaded"
+            job.report(f"Loading files... {done}/{total} ({os.path.basename(path)} {state})")
+        return report
+           
+    def _set_source(self, file_path, source_key, out_of_core, server_url):
+        # Where the installed case came from and how it is held
+        self.source_key = source_key
+        self.source_path = file_path
+        self.load_errors = {}
+        self.load_out_of_core = out_of_core
+        self.load_server = server_url
+           
+    def _set_dataset(self, dataset, mapping):
+        self.dataset = dataset
+        self.column_mappings = mapping
+        self.df = dataset.df if isinstance(dataset, cdr_dataset.CDRDataset) else None
+        self.results = {}
+        if isinstance(dataset, cdr_dataset.CDRDataset):
+            self._start_cube_build(dataset)
+           
+    def _update_ui_after_cache_load(self):
+        self.status_var.set(f"Loaded {len(self.df)} records from cache")
+        messagebox.showinfo("Success", f"Loaded {len(self.df)} records from cache\n\nDate range: {self.dataset.min_datetime} to {self.dataset.max_datetime}")
+           
+    def _start_cube_build(self, dataset):
+        # Analyses scan the raw slice until the daily aggregates are ready
+        self.jobs.submit(
+            'cube', self._build_cube, dataset,
+            on_error=lambda e: self.status_var.set(f"Could not pre-aggregate dataset: {str(e)}"),
+            supersede=True
+        )
+           
+    def _build_cube(self, job, dataset):
+        dataset.build_cube()
+           
+    def _build_store_thread(self, job, paths, mapping):
+        job.report("Building out-of-core store...")
+        return cdr_store.OutOfCoreDataset.open_or_build(paths, mapping, progress=self._load_progress(job))
+           
+    def _update_ui_after_store(self, load, mapping, dataset, failed_rows):
+        self._set_source(*load)
+        self._set_dataset(dataset, mapping)
+        message = f"Stored {len(self.dataset)} records on disk\n\nDate range: {self.dataset.min_datetime} to {self.dataset.max_datetime}"
+        if failed_rows:
+            message += f"\n\n{failed_rows} rows had dates that could not be parsed and will be ignored"
+        messagebox.showinfo("Success", message)
+        self.status_var.set(f"Loaded {len(self.dataset)} records (out-of-core)")
+           
+    def _store_in_cache(self, job, key, dataset, source_path):
+        try:
+            self.cache.store(key, dataset.df, dict(dataset.mapping), dataset.phone_table, source_path=source_path)
         except Exception as e:
-            # Capture exception message before passing to lambda
-            error_msg = f"Error loading data: {str(e)}\n\nPlease ensure:\n1. File is not open in another program\n2. File format is correct\n3. File is not corrupted\n4. Try saving as Excel (.xlsx) if CSV fails"
-            self.root.after(0, lambda msg=error_msg: self._show_error(msg))
-            self.root.after(0, lambda: self.status_var.set("Failed to load"))
+            # A failed cache write must never break the session
+            job.report(f"Could not write dataset cache: {str(e)}")
+           
+    def _update_ui_after_load(self, file_path, paths, out_of_core, server_url, source_key, dataset, preview):
+        load = (file_path, source_key, out_of_core, server_url)
+        if dataset is not None:
+            self._set_source(*load)
+            self._set_dataset(dataset, dataset.mapping)
+            self._update_ui_after_cache_load()
+            return
            
-    def _update_ui_after_load(self):
-        if self.df is not None and not self.df.empty:
+        # The previous case stays loaded and analysable until the new one
+        # is mapped and has loaded in full
+        self.pending_preview = preview
+        self.pending_paths = paths
+        self.pending_load = load
+        if preview is not None and not preview.empty:
             try:
                 # Show column mapping dialog
-                self.root.after(0, self._show_column_mapping_dialog)
+                self._show_column_mapping_dialog()
             except Exception as e:
                 error_msg = f"Error processing data: {str(e)}"
                 self._show_error(error_msg)
@@ -250,17 +551,17 @@ class CDRAnalyzerApp:
         mapping_dialog.grab_set()
        
         # Required column mappings
-        required_fields = [
-            ("Date Column", "date_col"),
-            ("Time Column (optional)", "time_col"),
-            ("Phone Number (B Party) Column", "phone_col"),
-            ("Main Location Column", "main_loc_col"),
-            ("Sub Location Column (optional)", "sub_loc_col"),
-            ("Cell ID/Address Column (optional)", "cell_id_col")
-        ]
+        required_fields = cdr_core.MAPPING_FIELDS
        
         # Store the mapping variables
         self.column_mapping = {}
+        self.extra_columns = {}
+       
+        # A saved profile for this format wins over guessing the mapping
+        # from header names and sampled values
+        profile = self.profiles.match(self.pending_preview.columns)
+        suggested = profile['mapping'] if profile else cdr_core.suggest_mapping(self.pending_preview)
+        keep = profile['extra_columns'] if profile else []
        
         # Create frame with scrollbar
         main_frame = ttk.Frame(mapping_dialog)
@@ -281,19 +582,30 @@ class CDRAnalyzerApp:
         canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
        
-        # Add column detection info
-        ttk.Label(scroll_frame, text="Detected Columns:", font=("Arial", 12, "bold")).grid(row=0, column=0, columnspan=2, sticky="w", pady=(0, 10))
+        # Add column detection info; only mapped columns are loaded unless
+        # an unmapped one is ticked here
+        ttk.Label(scroll_frame, text="Detected Columns (tick unmapped ones to load as well):", font=("Arial", 12, "bold")).grid(row=0, column=0, columnspan=2, sticky="w", pady=(0, 10))
        
-        for i, col in enumerate(self.df.columns):
-            ttk.Label(scroll_frame, text=f"{i+1}. {col}", anchor="w").grid(row=i+1, column=0, columnspan=2, sticky="w", padx=5)
+        for i, col in enumerate(self.pending_preview.columns):
+            keep_var = tk.BooleanVar(value=col in keep)
+            ttk.Checkbutton(scroll_frame, text=f"{i+1}. {col}", variable=keep_var).grid(row=i+1, column=0, columnspan=2, sticky="w", padx=5)
+            self.extra_columns[col] = keep_var
        
         # Add separator
-        ttk.Separator(scroll_frame, orient="horizontal").grid(row=len(self.df.columns)+1, column=0, columnspan=2, sticky="ew", pady=10)
+        ttk.Separator(scroll_frame, orient="horizontal").grid(row=len(self.pending_preview.columns)+1, column=0, columnspan=2, sticky="ew", pady=10)
        
         # Add mapping fields
-        ttk.Label(scroll_frame, text="Map CDR Fields:", font=("Arial", 12, "bold")).grid(row=len(self.df.columns)+2, column=0, columnspan=2, sticky="w", pady=(0, 10))
+        ttk.Label(scroll_frame, text="Map CDR Fields:", font=("Arial", 12, "bold")).grid(row=len(self.pending_preview.columns)+2, column=0, columnspan=2, sticky="w", pady=(0, 10))
+       
+        # Saved mapping profiles; picking one fills in the fields below
+        ttk.Label(scroll_frame, text="Mapping Profile:", anchor="w").grid(row=len(self.pending_preview.columns)+3, column=0, sticky="w", padx=5, pady=5)
+        profile_var = tk.StringVar(value=profile['name'] if profile else '')
+        profile_combo = ttk.Combobox(scroll_frame, textvariable=profile_var, width=30, state='readonly')
+        profile_combo['values'] = [''] + self.profiles.names()
+        profile_combo.grid(row=len(self.pending_preview.columns)+3, column=1, sticky="ew", padx=5, pady=5)
+        profile_combo.bind("<<ComboboxSelected>>", lambda e: self._apply_mapping_profile(profile_var.get()))
        
-        row_offset = len(self.df.columns) + 3
+        row_offset = len(self.pending_preview.columns) + 4
        
         for i, (label, var_name) in enumerate(required_fields):
             ttk.Label(scroll_frame, text=label + ":", anchor="w").grid(row=row_offset+i, column=0, sticky="w", padx=5, pady=5)
@@ -301,39 +613,10 @@ class CDRAnalyzerApp:
             # Create combobox with column choices
             combo_var = tk.StringVar()
             combo = ttk.Combobox(scroll_frame, textvariable=combo_var, width=30, state='readonly')
-            combo['values'] = [''] + list(self.df.columns)  # Add empty option for optional fields
-           
-            # Try to auto-select appropriate columns based on column name
-            if "date" in var_name:
-                for col in self.df.columns:
-                    if "date" in col.lower():
-                        combo_var.set(col)
-                        break
-            elif "time" in var_name:
-                for col in self.df.columns:
-                    if "time" in col.lower() and "date" not in col.lower():
-                        combo_var.set(col)
-                        break
-            elif "phone" in var_name:
-                for col in self.df.columns:
-                    if any(keyword in col.lower() for keyword in ["party", "number", "b party", "called"]):
-                        combo_var.set(col)
-                        break
-            elif "main_loc" in var_name:
-                for col in self.df.columns:
-                    if "main" in col.lower() and "city" in col.lower():
-                        combo_var.set(col)
-                        break
-            elif "sub_loc" in var_name:
-                for col in self.df.columns:
-                    if "sub" in col.lower() and "city" in col.lower():
-                        combo_var.set(col)
-                        break
-            elif "cell_id" in var_name:
-                for col in self.df.columns:
-                    if "cell" in col.lower() or "address" in col.lower():
-                        combo_var.set(col)
-                        break
+            combo['values'] = [''] + list(self.pending_preview.columns)  # Add empty option for optional fields
+           
+            # Pre-select the suggested column
+            combo_var.set(suggested.get(var_name, ''))
                        
             combo.grid(row=row_offset+i, column=1, sticky="ew", padx=5, pady=5)
             self.column_mapping[var_name] = combo_var
@@ -361,7 +644,7 @@ class CDRAnalyzerApp:
         preview_frame.grid_columnconfigure(0, weight=1)
        
         # Format the preview data
-        preview_str = self.df.head(5).to_string()
+        preview_str = self.pending_preview.head(5).to_string()
         preview_text.insert(tk.END, preview_str)
         preview_text.config(state=tk.DISABLED)
        
@@ -371,245 +654,303 @@ class CDRAnalyzerApp:
        
         ttk.Button(button_frame, text="Cancel", command=mapping_dialog.destroy).pack(side=tk.RIGHT, padx=5)
         ttk.Button(button_frame, text="Confirm Mapping", command=lambda: self._process_column_mapping(mapping_dialog)).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Save as Profile...", command=lambda: self._save_mapping_profile(mapping_dialog, profile_var)).pack(side=tk.LEFT, padx=5)
    
+    def _apply_mapping_profile(self, name):
+        if not name:
+            return
+        try:
+            profile = self.profiles.load(name)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", str(e))
+            return
+           
+        # Columns this file does not have are left unmapped
+        for key, var in self.column_mapping.items():
+            column = profile['mapping'].get(key, '')
+            var.set(column if column in self.pending_preview.columns else '')
+        for col, var in self.extra_columns.items():
+            var.set(col in profile['extra_columns'])
+           
+    def _save_mapping_profile(self, dialog, profile_var):
+        name = simpledialog.askstring("Save Mapping Profile", "Profile name (e.g. the operator):",
+                                      initialvalue=profile_var.get(), parent=dialog)
+        if not name:
+            return
+        mapping = {key: var.get() for key, var in self.column_mapping.items()}
+        try:
+            self.profiles.save(name, mapping, self.pending_preview.columns, self._selected_extra_columns(mapping))
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", str(e), parent=dialog)
+            return
+        profile_var.set(name.strip())
+        self.status_var.set(f"Saved mapping profile {name.strip()}")
+       
+    def _selected_extra_columns(self, mapping):
+        # Ticked columns that are not already mapped
+        return [col for col, var in self.extra_columns.items() if var.get() and col not in mapping.values()]
+       
     def _process_column_mapping(self, dialog):
         # Get values from mapping
         mapping = {key: var.get() for key, var in self.column_mapping.items()}
+        extra_columns = self._selected_extra_columns(mapping)
        
-        # Validate required fields
-        if not mapping['date_col'] or not mapping['phone_col'] or not mapping['main_loc_col']:
-            messagebox.showerror("Error", "Date, Phone Number, and Main Location columns are required")
-            return
-           
+        # Validate required fields against the previewed header
         try:
-            # Process datetime
-            if mapping['time_col'] and mapping['time_col'] != '':
-                # If we have separate date and time columns
-                self.df['DateTime'] = pd.to_datetime(
-                    self.df[mapping['date_col']].astype(str) + ' ' + self.df[mapping['time_col']].astype(str),
-                    errors='coerce'
-                )
-            else:
-                # If date column contains time information or we only have date
-                self.df['DateTime'] = pd.to_datetime(self.df[mapping['date_col']], errors='coerce')
-            
-            # Check if datetime conversion was successful
-            if self.df['DateTime'].isna().all():
-                messagebox.showerror("Error", "Could not parse dates. Please check the date format in your file.")
-                return
-               
-            # Store column mappings for later use
-            self.column_mappings = mapping
-           
-            # Close dialog
-            dialog.destroy()
-           
-            # Update status
-            messagebox.showinfo("Success", f"Successfully loaded {len(self.df)} records\n\nDate range: {self.df['DateTime'].min()} to {self.df['DateTime'].max()}")
-            self.status_var.set(f"Loaded {len(self.df)} records")
+            cdr_core.validate_mapping(mapping, self.pending_preview.columns)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
            
-        except Exception as e:
-            error_msg = f"Error processing dates: {str(e)}"
-            self._show_error(error_msg)
+        paths, load = self.pending_paths, self.pending_load
+        self.pending_paths = self.pending_preview = self.pending_load = None
+        out_of_core, server_url = load[2:]
+        dialog.destroy()
+        if server_url:
+            # The server loads the files, or reuses the copy another
+            # investigator already opened
+            self.jobs.submit(
+                'load', self._open_remote_thread, server_url, paths, mapping,
+                on_done=lambda dataset: self._update_ui_after_remote_load(load, mapping, dataset),
+                on_error=self._on_job_error("Error loading data on the analysis server", "Failed to load"),
+                on_cancel=self._on_job_cancelled, on_progress=self.status_var.set,
+                exclusive=True, supersede=True
+            )
+        elif out_of_core:
+            # Out-of-core: stream every file into the on-disk store
+            self.jobs.submit(
+                'load', self._build_store_thread, paths, mapping,
+                on_done=lambda result: self._update_ui_after_store(load, mapping, *result),
+                on_error=self._on_job_error("Error building out-of-core store", "Failed to load"),
+                on_cancel=self._on_job_cancelled, on_progress=self.status_var.set,
+                exclusive=True, supersede=True
+            )
+        else:
+            self.jobs.submit(
+                'load', self._run_profiled, 'load', self._full_load_thread, paths, mapping, extra_columns,
+                on_done=lambda result: self._update_ui_after_full_load(load, mapping, *result),
+                on_error=self._on_job_error("Error loading data", "Failed to load"),
+                on_cancel=self._on_job_cancelled, on_progress=self.status_var.set,
+                exclusive=True, supersede=True
+            )
+           
+    def _open_remote_thread(self, job, server_url, paths, mapping):
+        job.report("Loading data on the analysis server...")
+        dataset = cdr_client.RemoteDataset.open(server_url, paths, mapping)
+        job.check()
+        return dataset
+           
+    def _update_ui_after_remote_load(self, load, mapping, dataset):
+        self._set_source(*load)
+        self._set_dataset(dataset, mapping)
+        messagebox.showinfo("Success", f"Loaded {len(self.dataset)} records on the analysis server\n\nDate range: {self.dataset.min_datetime} to {self.dataset.max_datetime}")
+        self.status_var.set(f"Loaded {len(self.dataset)} records (analysis server)")
+           
+    def _full_load_thread(self, job, paths, mapping, extra_columns=()):
+        # Returns (dataset, unparseable rows, files that failed to load)
+        # Only the mapped columns and the ticked ones are parsed, with
+        # parser dtypes chosen from the mapping
+        usecols = cdr_core.mapped_columns(mapping, extra_columns)
+        dtypes = cdr_dtypes.read_dtypes(mapping)
+        load_errors = {}
+        job.report("Loading mapped columns...")
+        if len(paths) == 1:
+            # Sniff the format once, then stream the file through the C parser
+            df = cdr_ingest.read_cdr_file(paths[0], progress=self._load_progress(job), usecols=usecols, dtypes=dtypes)
+        else:
+            # One file per core; failures are collected instead of aborting
+            df, load_errors = cdr_ingest.load_many(paths, progress=self._batch_progress(job), usecols=usecols, dtypes=dtypes)
+        if df.empty:
+            raise ValueError("The file appears to be empty or could not be read")
+           
+        # Process datetime, shrink the mapped columns and sort once by
+        # DateTime so date filters become binary searches
+        job.report("Processing dates...")
+        dataset, failed_rows = cdr_dataset.build_dataset(df, mapping)
+        job.check()
+        return dataset, failed_rows, load_errors
+           
+    def _update_ui_after_full_load(self, load, mapping, dataset, failed_rows, load_errors):
+        # Store column mappings for later use
+        self._set_source(*load)
+        self._set_dataset(dataset, mapping)
+        self.load_errors = load_errors
+           
+        # Persist the mapped frame so the next session can skip parsing
+        if self.source_key:
+            self.jobs.submit('cache', self._store_in_cache, self.source_key, dataset, self.source_path,
+                             on_progress=self.status_var.set)
+           
+        if self.load_errors:
+            failed = "\n".join(f"{os.path.basename(path)}: {error}" for path, error in self.load_errors.items())
+            messagebox.showwarning("Warning", f"{len(self.load_errors)} file(s) could not be loaded:\n\n{failed}")
+           
+        message = f"Successfully loaded {len(self.df)} records\n\nDate range: {self.dataset.min_datetime} to {self.dataset.max_datetime}"
+        if failed_rows:
+            message += f"\n\n{failed_rows} rows had dates that could not be parsed and will be ignored"
+        messagebox.showinfo("Success", message)
+        self.status_var.set(f"Loaded {len(self.df)} records ({failed_rows} unparseable dates)" if failed_rows else f"Loaded {len(self.df)} records")
            
     def _show_error(self, message):
         messagebox.showerror("Error", message)
         self.status_var.set("Error")
            
     def analyze_data(self):
-        if self.df is None:
+        if self.df is None and self.dataset is None:
             messagebox.showerror("Error", "Please load data first")
             return
         
-        if not self.column_mappings:
+        if not self.column_mappings or self.dataset is None:
             messagebox.showerror("Error", "Column mappings not set. Please reload the data.")
             return
            
         try:
-            self.status_var.set("Analyzing data...")
-            self.root.update_idletasks()
+            # Options are read here, on the Tk thread, not in the worker
+            options = {
+                'window': (self.start_date_var.get(), self.end_date_var.get()),
+                'analysis_type': self.analysis_type_var.get(),
+                'location_type': self.location_var.get(),
+                'top_n': int(self.top_n_var.get()),
+                'suspects': [number for number in self.suspects_var.get().split(',') if number.strip()],
+                'hops': int(self.hops_var.get()),
+                'burst_minutes': int(self.burst_minutes_var.get()),
+                'meeting_minutes': int(self.meeting_minutes_var.get()),
+            }
+        except ValueError as e:
+            messagebox.showerror("Error", f"Analysis failed: {str(e)}")
+            return
            
-            # Start analysis in a separate thread to prevent UI freezing
-            threading.Thread(target=self._analyze_data_thread, daemon=True).start()
-        except Exception as e:
-            error_msg = f"Analysis failed: {str(e)}"
-            messagebox.showerror("Error", error_msg)
-            self.status_var.set("Ready")
+        self.status_var.set("Analyzing data...")
            
-    def _analyze_data_thread(self):
-        try:
-            # Get date range
-            start_date = self.start_date_var.get()
-            end_date = self.end_date_var.get()
+        # A newer analysis replaces one still running; its result is dropped
+        self.jobs.submit(
+            'analysis', self._run_profiled, 'analysis', self._analyze_data_thread, self.dataset, options,
+            on_done=lambda result: self._update_ui_after_analysis(*result),
+            on_error=self._on_job_error(None, "Analysis failed"),
+            on_cancel=self._on_job_cancelled, on_progress=self.status_var.set,
+            supersede=True
+        )
            
-            # Filter data for the specified date range
-            self.filtered_df = self.df[(self.df['DateTime'] >= start_date) & (self.df['DateTime'] <= end_date)].copy()
+    def _analyze_data_thread(self, job, dataset, options):
+        # Returns (records in the date range, results)
+        window = options['window']
+           
+        # Count the records in the date range (a binary search in memory,
+        # an indexed query out-of-core)
+        with stage('filter') as record:
+            analyzed_rows = record['rows'] = dataset.count(*window)
+        if not analyzed_rows:
+            return 0, None
+        job.check()
+           
+        # Perform the analysis
+        analysis_type = options['analysis_type']
+        if analysis_type == "location":
+            results = self._analyze_location(dataset, options['location_type'], options['top_n'], window)
+        elif analysis_type == "numbers":
+            results = self._analyze_numbers(dataset, options['top_n'], window)
+        elif analysis_type in ("common", "network"):
+            results = self._analyze_contacts(dataset, analysis_type, options['suspects'], options['hops'],
+                                             options['top_n'], window)
+        elif analysis_type in ("copresence", "meetings"):
+            results = self._analyze_copresence(dataset, analysis_type, options['location_type'], options['suspects'],
+                                               options['meeting_minutes'], window)
+        elif analysis_type in cdr_core.TALK_TYPES:
+            results = self._analyze_talk_time(dataset, analysis_type, options['location_type'], options['top_n'],
+                                              window)
+        elif analysis_type in cdr_core.TEMPORAL_TYPES:
+            results = self._analyze_activity(dataset, analysis_type, options['top_n'], options['burst_minutes'],
+                                             window)
+        else:  # date analysis
+            results = self._analyze_date_volume(dataset, window)
+        return analyzed_rows, results
            
-            if self.filtered_df.empty:
-                self.root.after(0, lambda: messagebox.showwarning("Warning", f"No data found in the specified date range\n\nAvailable date range: {self.df['DateTime'].min()} to {self.df['DateTime'].max()}"))
-                self.root.after(0, lambda: self.status_var.set("No data in date range"))
-                return
-               
-            # Get analysis type
-            analysis_type = self.analysis_type_var.get()
-            location_type = self.location_var.get()
-            top_n = int(self.top_n_var.get())
-           
-            # Perform the analysis
-            if analysis_type == "location":
-                self._analyze_location(location_type, top_n)
-            elif analysis_type == "numbers":
-                self._analyze_numbers(top_n)
-            else:  # date analysis
-                self._analyze_date_volume()
-               
-            # Update UI in the main thread
-            self.root.after(0, self._update_ui_after_analysis)
+    def _analyze_location(self, dataset, location_type, top_n, window):
+        try:
+            return dataset.analyze("location", *window, location_type=location_type, top_n=top_n)
         except Exception as e:
-            # Capture exception message before passing to lambda
-            error_msg = f"Analysis error: {str(e)}"
-            self.root.after(0, lambda msg=error_msg: self._show_error(msg))
-            self.root.after(0, lambda: self.status_var.set("Analysis failed"))
-           
-    def _analyze_location(self, location_type, top_n):
+            raise RuntimeError(f"Error in location analysis: {str(e)}") from e
+       
+    def _analyze_numbers(self, dataset, top_n, window):
         try:
-            # Map location type to column name
-            if location_type == "main_city":
-                column = self.column_mappings["main_loc_col"]
-            elif location_type == "sub_city":
-                column = self.column_mappings["sub_loc_col"]
-                if not column:
-                    raise ValueError("Sub location column not mapped")
-            elif location_type == "cell_id":
-                column = self.column_mappings["cell_id_col"]
-                if not column:
-                    raise ValueError("Cell ID column not mapped")
-            else:
-                column = self.column_mappings["main_loc_col"]
-           
-            # Calculate location counts
-            location_counts = self.filtered_df[column].value_counts().reset_index()
-            location_counts.columns = ['Location', 'Count']
-           
-            # Store results
-            self.results = {
-                "type": "location",
-                "subtype": location_type,
-                "data": location_counts.head(top_n),
-                "title": f"Top {top_n} Common Locations"
-            }
+            return dataset.analyze("numbers", *window, top_n=top_n)
         except Exception as e:
-            error_msg = f"Error in location analysis: {str(e)}"
-            self.root.after(0, lambda msg=error_msg: self._show_error(msg))
+            raise RuntimeError(f"Error in number analysis: {str(e)}") from e
        
-    def _analyze_numbers(self, top_n):
+    def _analyze_contacts(self, dataset, analysis_type, suspects, hops, top_n, window):
         try:
-            # Use the mapped phone column
-            phone_column = self.column_mappings['phone_col']
-           
-            # Calculate most called numbers
-            number_counts = self.filtered_df[phone_column].value_counts().reset_index()
-            number_counts.columns = ['Phone Number', 'Count']
-           
-            # Store results
-            self.results = {
-                "type": "numbers",
-                "data": number_counts.head(top_n),
-                "title": f"Top {top_n} Most Called Numbers"
-            }
+            return dataset.analyze(analysis_type, *window, top_n=top_n, suspects=suspects, hops=hops)
         except Exception as e:
-            error_msg = f"Error in number analysis: {str(e)}"
-            self.root.after(0, lambda msg=error_msg: self._show_error(msg))
+            raise RuntimeError(f"Error in contact analysis: {str(e)}") from e
        
-    def _analyze_date_volume(self):
+    def _analyze_copresence(self, dataset, analysis_type, location_type, suspects, meeting_minutes, window):
         try:
-            # Create date column
-            self.filtered_df['Date'] = self.filtered_df['DateTime'].dt.date
-           
-            # Calculate call volume by date
-            date_counts = self.filtered_df['Date'].value_counts().sort_index().reset_index()
-            date_counts.columns = ['Date', 'Call Count']
-           
-            # Store results
-            self.results = {
-                "type": "date",
-                "data": date_counts,
-                "title": "Call Volume by Date"
-            }
+            return dataset.analyze(analysis_type, *window, location_type=location_type, suspects=suspects,
+                                   meeting_minutes=meeting_minutes)
+        except Exception as e:
+            raise RuntimeError(f"Error in co-presence analysis: {str(e)}") from e
+       
+    def _analyze_talk_time(self, dataset, analysis_type, location_type, top_n, window):
+        try:
+            return dataset.analyze(analysis_type, *window, location_type=location_type, top_n=top_n)
+        except Exception as e:
+            raise RuntimeError(f"Error in talk time analysis: {str(e)}") from e
+       
+    def _analyze_activity(self, dataset, analysis_type, top_n, burst_minutes, window):
+        try:
+            return dataset.analyze(analysis_type, *window, top_n=top_n, burst_minutes=burst_minutes)
+        except Exception as e:
+            raise RuntimeError(f"Error in activity analysis: {str(e)}") from e
+       
+    def _analyze_date_volume(self, dataset, window):
+        try:
+            return dataset.analyze("date", *window)
         except Exception as e:
-            error_msg = f"Error in date analysis: {str(e)}"
-            self.root.after(0, lambda msg=error_msg: self._show_error(msg))
+            raise RuntimeError(f"Error in date analysis: {str(e)}") from e
        
-    def _update_ui_after_analysis(self):
-        if not self.results or 'data' not in self.results:
+    def _update_ui_after_analysis(self, analyzed_rows, results):
+        if not analyzed_rows:
+            messagebox.showwarning("Warning", f"No data found in the specified date range\n\nAvailable date range: {self.dataset.min_datetime} to {self.dataset.max_datetime}")
+            self.status_var.set("No data in date range")
+            return
+        if not results or 'data' not in results:
             self.status_var.set("Analysis failed")
             return
+        self.analyzed_rows = analyzed_rows
+        self.results = results
            
-        # Update results listbox
-        self.results_listbox.delete(0, tk.END)
-       
+        # Show the result frame as is; the grid formats visible rows only
         data = self.results["data"]
-        if self.results["type"] == "location":
-            for idx, row in data.iterrows():
-                self.results_listbox.insert(tk.END, f"{row['Location']}: {row['Count']} calls")
-        elif self.results["type"] == "numbers":
-            for idx, row in data.iterrows():
-                self.results_listbox.insert(tk.END, f"{row['Phone Number']}: {row['Count']} calls")
-        else:  # date
-            for idx, row in data.iterrows():
-                self.results_listbox.insert(tk.END, f"{row['Date']}: {row['Call Count']} calls")
+        self._create_results_table()
+        self.results_table.set_frame(data)
                
         # Create visualization
-        self._create_visualization()
+        with stage('visualization', rows=len(data)):
+            self._create_visualization()
        
-        self.status_var.set(f"Analyzed {len(self.filtered_df)} records")
+        self.status_var.set(f"Analyzed {self.analyzed_rows} records")
        
     def _create_visualization(self):
-        # Clear previous plot
-        if self.canvas:
-            self.canvas.get_tk_widget().destroy()
-            self.canvas = None
-           
+        # The figure and its Tk canvas are created once; later analyses
+        # only update the chart's artists and redraw
         if self.fig_placeholder:
             self.fig_placeholder.destroy()
             self.fig_placeholder = None
-        
-        if self.current_figure:
-            plt.close(self.current_figure)
-            self.current_figure = None
            
-        # Create new figure
-        fig, ax = plt.subplots(figsize=(10, 6))
-       
-        data = self.results["data"]
-       
-        if self.results["type"] == "location":
-            # For location analysis, use horizontal bar chart
-            y_col = 'Location'
-            x_col = 'Count'
-            sns.barplot(x=x_col, y=y_col, data=data, ax=ax, palette='viridis')
-           
-        elif self.results["type"] == "numbers":
-            # For number analysis, use horizontal bar chart
-            y_col = 'Phone Number'
-            x_col = 'Count'
-            sns.barplot(x=x_col, y=y_col, data=data, ax=ax, palette='viridis')
+        if self.canvas is None:
+            # matplotlib is imported with the first chart
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            from cdr_plot import ChartRenderer
+            self.chart = ChartRenderer()
+            self.canvas = FigureCanvasTkAgg(self.chart.figure, master=self.visualization_frame)
+            self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
            
-        else:  # date analysis
-            # For date analysis, use line chart
-            sns.lineplot(x='Date', y='Call Count', data=data, ax=ax, marker='o')
-            plt.xticks(rotation=45, ha='right')
-           
-        ax.set_title(self.results["title"], fontsize=14, fontweight='bold')
-        plt.tight_layout()
-       
-        # Display in the UI
-        self.canvas = FigureCanvasTkAgg(fig, master=self.visualization_frame)
-        self.canvas.draw()
-        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        # Long series are downsampled to the canvas width before drawing
+        self.chart.render(self.results)
+        self.canvas.draw_idle()
        
         # Store figure for export
-        self.current_figure = fig
+        self.current_figure = self.chart.figure
        
     def export_results(self):
         if not hasattr(self, 'results') or not self.results or 'data' not in self.results:
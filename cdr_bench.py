@@ -0,0 +1,312 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import cdr_core
+from cdr_dataset import build_dataset
+from cdr_dtypes import read_dtypes
+from cdr_ingest import read_cdr_file
+from cdr_profile import PROFILER
+from cdr_sketch import stream_top
+from cdr_startup import STARTUP_BUDGET_SECONDS, measure_startup
+
+# Column names of the synthetic export, spelled like a real operator file
+# so the GUI's auto-detection picks them up
+BENCH_MAPPING = {
+    'date_col': 'Call Date',
+    'time_col': 'Call Time',
+    'phone_col': 'B Party',
+    'a_party_col': 'A Party',
+    'main_loc_col': 'Main City',
+    'sub_loc_col': 'Sub City',
+    'cell_id_col': 'Cell ID',
+    'duration_col': 'Call Duration',
+}
+
+# Rows generated and written per block, bounding the generator's memory
+GENERATE_BLOCK_ROWS = 1_000_000
+
+# Excel sheets stop at 1,048,576 rows including the header
+MAX_XLSX_ROWS = 1_048_575
+
+DEFAULT_ROWS = [1_000_000]
+
+# Part of generated file names; bumped when generate_cdr's columns change
+# so files kept in --data-dir are generated again
+GENERATOR_VERSION = 2
+
+GUI_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CDR-Analyser.py')
+
+# Fresh interpreters started per startup measurement; the fastest counts
+STARTUP_REPEATS = 5
+
+
+def generate_cdr(rows, seed=0, numbers=50_000, cells=2_000, days=30, start='2024-03-01', suspects=20):
+    # Synthetic CDR frame. Call volume is skewed like real exports: a few
+    # B-party numbers and cells take most of the traffic, and the A party
+    # is one of a handful of suspects.
+    rng = np.random.default_rng(seed)
+    b_party = np.minimum(rng.zipf(1.3, rows) - 1, numbers - 1)
+    a_party = rng.integers(0, suspects, rows)
+    cell = np.minimum(rng.zipf(1.2, rows) - 1, cells - 1)
+    seconds = rng.integers(0, days * 86_400, rows)
+    # Mostly short calls with a long tail; drawn last so the other columns
+    # are the same as files generated before durations were added
+    duration = np.minimum(rng.exponential(90, rows), 4 * 3600).astype(np.int64)
+
+    # Text is looked up from small tables of distinct values instead of
+    # formatting every row
+    def table(fmt, n):
+        return np.array([fmt.format(i) for i in range(n)], dtype=object)
+
+    dates = pd.date_range(start, periods=days, freq='D').strftime('%Y-%m-%d').to_numpy(dtype=object)
+    clock = np.array([f"{t // 3600:02d}:{t // 60 % 60:02d}:{t % 60:02d}" for t in range(86_400)], dtype=object)
+
+    return pd.DataFrame({
+        'Call Date': dates[seconds // 86_400],
+        'Call Time': clock[seconds % 86_400],
+        'A Party': table('0310{:07d}', suspects)[a_party],
+        'B Party': table('0300{:07d}', numbers)[b_party],
+        'Main City': table('City {}', max(cells // 100, 1))[cell % max(cells // 100, 1)],
+        'Sub City': table('Area {}', cells // 10 + 1)[cell // 10],
+        'Cell ID': table('CELL-{}', cells)[cell],
+        'Call Duration': duration,
+    })
+
+
+def write_cdr(path, rows, fmt='csv', delimiter=',', encoding='utf-8', seed=0, **options):
+    # Writes the export block by block; block i is generated with seed + i
+    # so a given row count and seed always produce the same file
+    if fmt == 'xlsx':
+        if rows > MAX_XLSX_ROWS:
+            raise ValueError(f"Excel files hold at most {MAX_XLSX_ROWS:,} rows")
+        generate_cdr(rows, seed=seed, **options).to_excel(path, index=False)
+        return path
+
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        for block, offset in enumerate(range(0, rows, GENERATE_BLOCK_ROWS)):
+            df = generate_cdr(min(GENERATE_BLOCK_ROWS, rows - offset), seed=seed + block, **options)
+            df.to_csv(f, sep=delimiter, index=False, header=(block == 0))
+    return path
+
+
+def measure(results, stage, func, track_memory=True):
+    # Runs one stage and records its wall time and peak Python/numpy
+    # allocations. Returns the stage's return value.
+    gc.collect()
+    if track_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        value = func()
+    finally:
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if track_memory else None
+        if track_memory:
+            tracemalloc.stop()
+
+    results[stage] = {'seconds': round(elapsed, 4), 'peak_bytes': peak}
+    print(f"  {stage:<28} {elapsed:9.3f} s" + (f" {peak / 2 ** 20:10.1f} MiB" if peak is not None else ""),
+          file=sys.stderr)
+    return value
+
+
+def _render_chart(results):
+    # The same figure the GUI draws, rendered off screen
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from cdr_plot import ChartRenderer
+
+    chart = ChartRenderer()
+    FigureCanvasAgg(chart.figure)
+    chart.render(results)
+    chart.figure.canvas.draw()
+
+
+def run_benchmark(path, top_n=10, track_memory=True, chart=True):
+    # Times every pipeline stage on one file: load, column mapping, date
+    # filtering, each analysis on raw slices and again on the cube, and
+    # chart rendering
+    results = {}
+    mapping = cdr_core.normalize_mapping(BENCH_MAPPING)
+    df = measure(results, 'load', lambda: read_cdr_file(
+        path, usecols=cdr_core.mapped_columns(mapping), dtypes=read_dtypes(mapping)), track_memory)
+    results['load']['rows'] = len(df)
+
+    dataset, _ = measure(results, 'mapping', lambda: build_dataset(df, mapping), track_memory)
+    del df
+
+    # A window covering the middle half of the data, with partial edge days
+    span = dataset.max_datetime - dataset.min_datetime
+    start = dataset.min_datetime + span / 4 + pd.Timedelta(hours=5)
+    end = dataset.max_datetime - span / 4 + pd.Timedelta(hours=7)
+    measure(results, 'filter_date_range',
+            lambda: cdr_core.filter_date_range(dataset.df, start, end), track_memory)
+    measure(results, 'slice_date_range', lambda: dataset.between(start, end), track_memory)
+
+    analyses = [
+        ('location', {'location_type': 'main_city'}),
+        ('location_cell', {'location_type': 'cell_id'}),
+        ('numbers', {}),
+        ('date', {}),
+    ]
+    last = None
+    for mode in ('raw', 'cube'):
+        if mode == 'cube':
+            measure(results, 'build_cube', dataset.build_cube, track_memory)
+        for name, options in analyses:
+            analysis_type = name.split('_')[0]
+            last = measure(results, f'analyze_{name}_{mode}',
+                           lambda: dataset.analyze(analysis_type, start, end, top_n=top_n, **options), track_memory)
+
+    measure(results, 'analyze_common_contacts', lambda: dataset.analyze(
+        'common', start, end, suspects=['03100000000', '03100000001']), track_memory)
+    measure(results, 'analyze_copresence', lambda: dataset.analyze(
+        'copresence', start, end, location_type='cell_id'), track_memory)
+    # Hourly and talk time analyses always work on the slice's raw records
+    for analysis_type in cdr_core.TEMPORAL_TYPES + cdr_core.TALK_TYPES:
+        measure(results, f'analyze_{analysis_type}',
+                lambda: dataset.analyze(analysis_type, start, end, top_n=top_n), track_memory)
+
+    # Top numbers straight from the file with a bounded-memory sketch, then
+    # with the exact second pass
+    for verify in (False, True):
+        measure(results, 'stream_numbers' + ('_verified' if verify else ''), lambda: stream_top(
+            [path], mapping, 'numbers', start, end, top_n=top_n, verify=verify), track_memory)
+
+    if chart:
+        try:
+            measure(results, 'render_chart', lambda: _render_chart(last), track_memory)
+        except ImportError as e:
+            results['render_chart'] = {'skipped': str(e)}
+    return results
+
+
+def run_startup(budget=STARTUP_BUDGET_SECONDS, repeats=STARTUP_REPEATS):
+    # Time until the GUI can build its window, i.e. importing its script,
+    # and the heavy modules that import drags in. Both count as failures.
+    try:
+        runs = [measure_startup(GUI_SCRIPT) for _ in range(repeats)]
+    except (OSError, subprocess.CalledProcessError) as e:
+        reason = (getattr(e, 'stderr', None) or str(e)).strip().splitlines()[-1]
+        print(f"  {'startup':<28} skipped: {reason}", file=sys.stderr)
+        return {'skipped': reason}
+    seconds, heavy = min(runs)
+    result = {'seconds': round(seconds, 4), 'budget': budget, 'heavy_modules': heavy,
+              'passed': seconds <= budget and not heavy}
+    print(f"  {'startup':<28} {seconds:9.3f} s (budget {budget:.2f} s)"
+          + (f", imports {', '.join(heavy)}" if heavy else ""), file=sys.stderr)
+    return result
+
+
+def compare(current, baseline):
+    # Per-stage time ratios against a previous results file
+    lines = []
+    if current.get('config') != baseline.get('config'):
+        # tracemalloc alone slows allocation-heavy stages several times over
+        lines.append("Warning: the baseline was run with a different configuration")
+    old = baseline.get('startup', {})
+    if current.get('startup', {}).get('seconds') and old.get('seconds'):
+        new = current['startup']['seconds']
+        lines.append(f"{'':>10} {'startup':<28} {old['seconds']:9.3f} s -> {new:9.3f} s  x{new / old['seconds']:.2f}")
+    for rows, stages in current['runs'].items():
+        old_stages = baseline.get('runs', {}).get(rows, {})
+        for stage, result in stages.items():
+            old = old_stages.get(stage, {})
+            if 'seconds' in result and old.get('seconds'):
+                ratio = result['seconds'] / old['seconds']
+                lines.append(f"{rows:>10} {stage:<28} {old['seconds']:9.3f} s -> {result['seconds']:9.3f} s  x{ratio:.2f}")
+    return lines
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Benchmark every CDR pipeline stage on seeded synthetic data"
+    )
+    parser.add_argument('-r', '--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help="Row counts to benchmark, e.g. 1000000 10000000 50000000 (default: 1000000)")
+    parser.add_argument('--seed', type=int, default=0, help="Generator seed (default: 0)")
+    parser.add_argument('--numbers', type=int, default=50_000, help="Distinct B-party numbers (default: 50000)")
+    parser.add_argument('--cells', type=int, default=2_000, help="Distinct cell IDs (default: 2000)")
+    parser.add_argument('--days', type=int, default=30, help="Date span in days (default: 30)")
+    parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv', help="File format (default: csv)")
+    parser.add_argument('--delimiter', default=',', help="CSV delimiter (default: ,)")
+    parser.add_argument('--encoding', default='utf-8', help="CSV encoding (default: utf-8)")
+    parser.add_argument('--data-dir', help="Keep generated files here and reuse them on later runs")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="Skip tracemalloc; times are then closer to a real session, since tracing "
+                             "slows allocation-heavy stages")
+    parser.add_argument('--no-chart', action='store_true', help="Skip chart rendering")
+    parser.add_argument('--startup-only', action='store_true',
+                        help=f"Only check the GUI's startup import time against its budget "
+                             f"({STARTUP_BUDGET_SECONDS} s)")
+    parser.add_argument('-o', '--output', default='benchmark.json', help="Results file (default: benchmark.json)")
+    parser.add_argument('--compare', metavar='BASELINE', help="Previous results file to compare against")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Benchmark runs stay out of the investigators' stage log
+    PROFILER.log_path = None
+    delimiter = args.delimiter.replace('\\t', '\t')
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'config': {
+            'seed': args.seed, 'numbers': args.numbers, 'cells': args.cells, 'days': args.days,
+            'format': args.format, 'delimiter': delimiter, 'encoding': args.encoding,
+            'track_memory': not args.no_memory,
+        },
+        'runs': {},
+    }
+
+    print("Checking GUI startup", file=sys.stderr)
+    report['startup'] = run_startup()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir or tmp_dir
+        os.makedirs(data_dir, exist_ok=True)
+        for rows in ([] if args.startup_only else args.rows):
+            name = f"cdr-v{GENERATOR_VERSION}-{rows}-s{args.seed}-n{args.numbers}-c{args.cells}-d{args.days}-{args.encoding}"
+            path = os.path.join(data_dir, f"{name}.{args.format}")
+            try:
+                if not os.path.exists(path):
+                    print(f"Generating {rows:,} rows -> {path}", file=sys.stderr)
+                    write_cdr(path, rows, args.format, delimiter, args.encoding, seed=args.seed,
+                              numbers=args.numbers, cells=args.cells, days=args.days)
+                print(f"Benchmarking {rows:,} rows", file=sys.stderr)
+                report['runs'][str(rows)] = run_benchmark(path, track_memory=not args.no_memory,
+                                                          chart=not args.no_chart)
+            except (OSError, ValueError, MemoryError) as e:
+                print(f"Error: {rows:,} rows: {e}", file=sys.stderr)
+                report['runs'][str(rows)] = {'error': str(e)}
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            for line in compare(report, json.load(f)):
+                print(line)
+    # A startup over budget fails the run, so scripts notice the regression
+    return 1 if report['startup'].get('passed') is False else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
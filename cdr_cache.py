@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+
+from cdr_dtypes import PhoneTable, concat_frames
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    # The cache is simply disabled without pyarrow
+    pa = feather = None
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'CDR_ANALYSER_CACHE', os.path.join(os.path.expanduser('~'), '.cdr_analyser', 'cache'))
+
+# Total size the cache directory may grow to before old entries are evicted
+DEFAULT_MAX_BYTES = int(os.environ.get('CDR_ANALYSER_CACHE_MAX_BYTES', 20 * 1024 ** 3))
+
+# Bumped whenever the layout of cached frames changes
+CACHE_VERSION = 6
+
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+# appended: content digests of the delta files already folded into the entry
+CachedDataset = namedtuple('CachedDataset', ['df', 'mapping', 'phone_table', 'appended'])
+
+
+def file_digest(file_path):
+    # Key cache entries on file content so renamed or copied exports still hit
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"v{CACHE_VERSION}:".encode())
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def files_digest(file_paths):
+    # Key for a multi-file case: the set of file contents and their names
+    if len(file_paths) == 1:
+        return file_digest(file_paths[0])
+    digest = hashlib.blake2b(digest_size=20)
+    for path in sorted(file_paths):
+        digest.update(os.path.basename(path).encode('utf-8', 'replace'))
+        digest.update(file_digest(path).encode())
+    return digest.hexdigest()
+
+
+def _to_table(df):
+    # Feather needs string column names; the index is never meaningful here
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    return table.rename_columns([str(c) for c in table.column_names])
+
+
+class DatasetCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    @property
+    def available(self):
+        return feather is not None
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.feather', base + '.json', base + '.phones.feather'
+
+    def _part_path(self, key, part):
+        # Appended batches are stored as numbered delta files
+        return os.path.join(self.cache_dir, f"{key}.part-{part}.feather")
+
+    def _files(self, key):
+        prefix = key + '.'
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.startswith(prefix)]
+
+    def _read_meta(self, key):
+        with open(self._paths(key)[1], encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_meta(self, key, meta):
+        meta_path = self._paths(key)[1]
+        tmp_meta = meta_path + '.tmp'
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, meta_path)
+
+    def _write_feather(self, df, path):
+        # Write to a temporary name first so readers never see half a file
+        feather.write_feather(_to_table(df), path + '.tmp', compression='uncompressed')
+        os.replace(path + '.tmp', path)
+
+    def load(self, key):
+        # Returns a CachedDataset, or None on a miss
+        if not self.available:
+            return None
+
+        data_path, meta_path, phones_path = self._paths(key)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None
+
+        try:
+            meta = self._read_meta(key)
+            if meta.get('version') != CACHE_VERSION:
+                return None
+
+            # The frame is copied into pandas memory; uncompressed Feather only
+            # saves decompressing it. Reopening a 2M row case takes about 0.15 s.
+            frames = [feather.read_table(data_path).to_pandas()]
+            for part in range(1, meta.get('parts', 0) + 1):
+                frames.append(feather.read_table(self._part_path(key, part)).to_pandas())
+            df = frames[0] if len(frames) == 1 else concat_frames(frames)
+
+            phone_table = None
+            if meta.get('has_phone_table'):
+                phone_table = PhoneTable.from_frame(feather.read_table(phones_path).to_pandas())
+        except Exception:
+            # A corrupt entry is treated as a miss and rebuilt on the next store
+            self.discard(key)
+            return None
+
+        # Touch the entry so eviction is least-recently-used
+        now = time.time()
+        for path in (data_path, meta_path):
+            os.utime(path, (now, now))
+
+        return CachedDataset(df, meta['mapping'], phone_table, meta.get('appended', []))
+
+    def store(self, key, df, mapping, phone_table=None, source_path=None):
+        if not self.available:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        data_path, meta_path, phones_path = self._paths(key)
+
+        # Any deltas from a previous version of this entry are obsolete
+        for path in self._files(key):
+            if '.part-' in os.path.basename(path):
+                os.remove(path)
+
+        # The metadata file goes last and marks the entry complete
+        self._write_feather(df, data_path)
+        if phone_table is not None:
+            self._write_feather(phone_table.to_frame(), phones_path)
+
+        self._write_meta(key, {
+            'version': CACHE_VERSION,
+            'has_phone_table': phone_table is not None,
+            'mapping': mapping,
+            'source_path': source_path,
+            'rows': len(df),
+            'parts': 0,
+            'appended': [],
+            'created': time.time(),
+        })
+
+        self.evict()
+
+    def append(self, key, new_df, phone_table=None, digest=None):
+        # Adds an appended batch to an existing entry as a delta file, so
+        # the cost is proportional to the batch rather than the whole case
+        if not self.available:
+            return
+
+        meta = self._read_meta(key)
+        part = meta.get('parts', 0) + 1
+        self._write_feather(new_df, self._part_path(key, part))
+        if phone_table is not None:
+            self._write_feather(phone_table.to_frame(), self._paths(key)[2])
+
+        meta['parts'] = part
+        meta['rows'] = meta.get('rows', 0) + len(new_df)
+        meta['has_phone_table'] = meta.get('has_phone_table') or phone_table is not None
+        if digest:
+            meta['appended'] = meta.get('appended', []) + [digest]
+        self._write_meta(key, meta)
+
+        self.evict()
+
+    def discard(self, key):
+        for path in self._files(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _entries(self):
+        entries = {}
+        if not os.path.isdir(self.cache_dir):
+            return []
+
+        # Every file of an entry starts with its key; the metadata file's
+        # mtime is the entry's last use
+        for name in os.listdir(self.cache_dir):
+            key = name.split('.', 1)[0]
+            path = os.path.join(self.cache_dir, name)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            mtime, total = entries.get(key, (None, 0))
+            if name == key + '.json':
+                mtime = os.path.getmtime(path)
+            entries[key] = (mtime, total + size)
+
+        return [(mtime or 0, size, key) for key, (mtime, size) in entries.items()]
+
+    def evict(self):
+        # Drop least recently used entries until the cache fits its budget
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            self.discard(key)
+            total -= size
@@ -0,0 +1,244 @@
+import argparse
+import importlib.util
+import json
+import os
+import sys
+
+# Only the analysis core is imported here; tkinter and matplotlib stay out
+# of batch jobs entirely
+import cdr_core
+from cdr_cache import DatasetCache, files_digest
+from cdr_dataset import CDRDataset, build_dataset
+from cdr_defaults import DEFAULT_BURST_MINUTES, DEFAULT_MEETING_MINUTES
+from cdr_dtypes import read_dtypes
+from cdr_ingest import expand_sources, load_many, read_cdr_file, read_preview
+from cdr_mappings import MappingProfiles
+from cdr_profile import PROFILER, format_record
+from cdr_sketch import DEFAULT_SKETCH_SIZE, STREAM_TYPES, stream_top
+from cdr_store import OutOfCoreDataset
+
+
+def load_mapping(path):
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+
+    if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise SystemExit("Reading YAML mappings requires PyYAML (pip install pyyaml)")
+        mapping = yaml.safe_load(text)
+    else:
+        mapping = json.loads(text)
+
+    if not isinstance(mapping, dict):
+        raise SystemExit(f"Mapping file {path} must contain an object of field: column pairs")
+    return cdr_core.normalize_mapping(mapping)
+
+
+def resolve_mapping(args, paths):
+    # Returns (mapping, extra columns) from --mapping, --mapping-profile or,
+    # with neither, the saved profile matching the first file's header
+    profiles = MappingProfiles()
+    extra_columns = [col.strip() for col in (args.keep_columns or '').split(',') if col.strip()]
+
+    if args.mapping:
+        mapping = load_mapping(args.mapping)
+    else:
+        if args.mapping_profile:
+            profile = profiles.load(args.mapping_profile)
+        else:
+            profile = profiles.match(read_preview(paths[0], nrows=0).columns)
+            if profile is None:
+                raise ValueError("No saved mapping profile matches this file; give --mapping or --mapping-profile")
+            print(f"Using mapping profile {profile['name']}", file=sys.stderr)
+        mapping = profile['mapping']
+        extra_columns = profile['extra_columns'] + extra_columns
+
+    if args.save_mapping_profile:
+        profiles.save(args.save_mapping_profile, mapping, read_preview(paths[0], nrows=0).columns, extra_columns)
+        print(f"Saved mapping profile {args.save_mapping_profile}", file=sys.stderr)
+    return mapping, extra_columns
+
+
+def load_dataset(paths, mapping, use_cache=False, workers=None, appends=(), extra_columns=()):
+    cache = DatasetCache() if use_cache else None
+    key = None
+    dataset = None
+    appended = []
+
+    if cache is not None and cache.available:
+        key = files_digest(paths)
+        cached = cache.load(key)
+        if (cached is not None and cdr_core.normalize_mapping(cached.mapping) == mapping
+                and all(col in cached.df.columns for col in extra_columns)):
+            dataset = CDRDataset(cached.df, cached.mapping, cached.phone_table)
+            appended = cached.appended
+
+    if dataset is None:
+        # Only the mapped columns (and any asked for) are parsed, with
+        # parser dtypes chosen from the mapping
+        usecols = cdr_core.mapped_columns(mapping, extra_columns)
+        dtypes = read_dtypes(mapping)
+        if len(paths) == 1:
+            df = read_cdr_file(paths[0], usecols=usecols, dtypes=dtypes)
+        else:
+            df, errors = load_many(paths, max_workers=workers, usecols=usecols, dtypes=dtypes)
+            for path, error in errors.items():
+                print(f"Warning: skipped {path}: {error}", file=sys.stderr)
+            if df.empty:
+                raise ValueError("None of the input files could be loaded")
+
+        cdr_core.validate_mapping(mapping, df.columns)
+        dataset, failed = build_dataset(df, mapping)
+        if failed:
+            print(f"Warning: {failed} rows had unparseable dates and are ignored", file=sys.stderr)
+
+        if key is not None:
+            cache.store(key, dataset.df, mapping, dataset.phone_table, source_path=os.pathsep.join(paths))
+
+    # Deltas are keyed to the base export; ones already in the cache entry are skipped
+    for path in appends:
+        digest = files_digest([path])
+        if digest in appended:
+            continue
+        new_df = read_cdr_file(path, usecols=cdr_core.mapped_columns(mapping), dtypes=read_dtypes(mapping))
+        added, duplicates, failed = dataset.append(new_df)
+        print(f"Appended {len(added)} records from {path} ({duplicates} duplicates skipped)", file=sys.stderr)
+        if failed:
+            print(f"Warning: {failed} rows had unparseable dates and are ignored", file=sys.stderr)
+        if key is not None and not added.empty:
+            cache.append(key, added, dataset.phone_table, digest=digest)
+        appended.append(digest)
+    return dataset
+
+
+def write_results(data, output):
+    if output is None or output == '-':
+        data.to_csv(sys.stdout, index=False)
+    elif output.lower().endswith('.parquet'):
+        data.to_parquet(output, index=False)
+    else:
+        data.to_csv(output, index=False)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='cdr_cli',
+        description="Run CDR analyses without the graphical interface."
+    )
+    parser.add_argument('files', nargs='+',
+                        help="CDR files (CSV or Excel), folders or glob patterns; several are loaded in parallel")
+    parser.add_argument('-m', '--mapping',
+                        help="JSON or YAML file mapping CDR fields (date_col, phone_col, ...) to column names; "
+                             "without it the saved mapping profile matching the file's header is used")
+    parser.add_argument('--mapping-profile', metavar='NAME',
+                        help="Saved mapping profile to use instead of --mapping")
+    parser.add_argument('--save-mapping-profile', metavar='NAME',
+                        help="Save the mapping (and --keep-columns) as a profile for this file's format")
+    parser.add_argument('--keep-columns',
+                        help="Comma-separated unmapped columns to load as well; others are never parsed")
+    parser.add_argument('-a', '--analysis', choices=cdr_core.ANALYSIS_TYPES, default='location',
+                        help="Analysis to run (default: location)")
+    parser.add_argument('-l', '--location-type', choices=cdr_core.LOCATION_TYPES, default='main_city',
+                        help="Location granularity for location analysis (default: main_city)")
+    parser.add_argument('-n', '--top-n', type=int, default=10, help="Number of top results (default: 10)")
+    parser.add_argument('--suspects',
+                        help="Comma-separated suspect numbers for the common, network, copresence and meetings "
+                             "analyses")
+    parser.add_argument('--hops', type=int, default=1,
+                        help="Neighbourhood depth for the network analysis (default: 1)")
+    parser.add_argument('--burst-minutes', type=int, default=DEFAULT_BURST_MINUTES,
+                        help=f"Window length for the bursts analysis; must divide a day (default: {DEFAULT_BURST_MINUTES})")
+    parser.add_argument('--meeting-minutes', type=int, default=DEFAULT_MEETING_MINUTES,
+                        help=f"Window within which numbers at the same place count as meeting, for the copresence "
+                             f"and meetings analyses; the place is set by --location-type (default: {DEFAULT_MEETING_MINUTES})")
+    parser.add_argument('--start', help="Start of the date range, e.g. 2024-03-01")
+    parser.add_argument('--end', help="End of the date range, e.g. 2024-03-17")
+    parser.add_argument('-o', '--output',
+                        help="Output file; .parquet writes Parquet, anything else CSV (default: stdout)")
+    parser.add_argument('-j', '--workers', type=int,
+                        help="Worker processes for multi-file loads (default: one per CPU)")
+    parser.add_argument('--use-cache', action='store_true',
+                        help="Reuse and populate the on-disk dataset cache")
+    parser.add_argument('--append', action='append', default=[], metavar='FILE',
+                        help="New CDR batch to add to the dataset; repeatable. With --use-cache the "
+                             "batch is stored as a delta of the cached case")
+    parser.add_argument('--timings', action='store_true',
+                        help="Print the time, rows/s and memory of each pipeline stage to stderr")
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'],
+                        help="Capture a profile of the whole run under ~/.cdr_analyser/logs/profiles")
+    parser.add_argument('--out-of-core', action='store_true',
+                        help="Stream records into a local SQLite store and aggregate there, for files larger than memory")
+    parser.add_argument('--streaming', action='store_true',
+                        help=f"Count the top values in one pass over the files with a fixed-size sketch instead of "
+                             f"loading them ({' and '.join(STREAM_TYPES)} analyses only); counts may be overestimated "
+                             f"by up to the reported error")
+    parser.add_argument('--sketch-size', type=int, default=DEFAULT_SKETCH_SIZE,
+                        help=f"Counters kept by --streaming; more give tighter error bounds (default: {DEFAULT_SKETCH_SIZE})")
+    parser.add_argument('--verify', action='store_true',
+                        help="With --streaming, count the candidates exactly in a second pass over the files")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.timings:
+        PROFILER.add_listener(lambda event, record: event == 'end' and print(format_record(record), file=sys.stderr))
+    if not args.profile:
+        return run(args)
+
+    if args.profile == 'pyinstrument' and importlib.util.find_spec('pyinstrument') is None:
+        print("Error: --profile pyinstrument requires pyinstrument (pip install pyinstrument)", file=sys.stderr)
+        return 1
+    with PROFILER.capture('cli', engine=args.profile) as report_path:
+        status = run(args)
+    print(f"Profile written to {report_path}", file=sys.stderr)
+    return status
+
+
+def run(args):
+    try:
+        paths = [path for location in args.files for path in expand_sources(location)]
+        if not paths:
+            raise ValueError("No CDR files found")
+        mapping, extra_columns = resolve_mapping(args, paths)
+        cdr_core.validate_mapping(mapping)
+        if args.streaming:
+            if args.out_of_core or args.append:
+                raise ValueError("--streaming reads the files directly; drop --out-of-core and --append")
+            results = stream_top(paths, mapping, args.analysis, args.start, args.end, args.location_type,
+                                 args.top_n, size=args.sketch_size, verify=args.verify)
+            if not results["exact"]:
+                print(f"Note: approximate counts; a value not listed occurred at most {results['error_bound']} "
+                      f"times", file=sys.stderr)
+            write_results(results["data"], args.output)
+            return 0
+        if args.out_of_core:
+            if args.append:
+                raise ValueError("--append is not available with --out-of-core")
+            dataset, failed = OutOfCoreDataset.open_or_build(paths, mapping)
+            if failed:
+                print(f"Warning: {failed} rows had unparseable dates and are ignored", file=sys.stderr)
+        else:
+            dataset = load_dataset(paths, mapping, use_cache=args.use_cache, workers=args.workers,
+                                   appends=args.append, extra_columns=extra_columns)
+
+        if not dataset.count(args.start, args.end):
+            print("No data found in the specified date range", file=sys.stderr)
+            return 1
+
+        suspects = [number for number in (args.suspects or '').split(',') if number.strip()]
+        results = dataset.analyze(args.analysis, args.start, args.end, args.location_type, args.top_n,
+                                  suspects=suspects, hops=args.hops, burst_minutes=args.burst_minutes,
+                                  meeting_minutes=args.meeting_minutes)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    write_results(results["data"], args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import json
+import os
+import urllib.error
+import urllib.request
+
+import pandas as pd
+
+from cdr_defaults import SERVER_TYPES
+
+# Seconds to wait for the server; the first open of a large case loads it
+TIMEOUT_SECONDS = 600
+
+
+def _request(url, payload=None):
+    data = None if payload is None else json.dumps(payload).encode('utf-8')
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=TIMEOUT_SECONDS) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        # The server explains what was wrong with the request
+        try:
+            message = json.loads(e.read()).get('error') or e.reason
+        except ValueError:
+            message = e.reason
+        raise ValueError(message) from None
+    except urllib.error.URLError as e:
+        raise OSError(f"Cannot reach analysis server at {url}: {e.reason}") from None
+
+
+def _bound(value):
+    return None if value is None else pd.Timestamp(value).isoformat()
+
+
+class RemoteDataset:
+    # A dataset kept loaded by cdr_server, with the parts of CDRDataset's
+    # interface the GUI uses for the analyses the server answers. Nothing
+    # but the results travels between the two processes.
+    def __init__(self, url, info):
+        self.url = url.rstrip('/')
+        self.id = info['id']
+        self.mapping = info['mapping']
+        self.rows = info['rows']
+        self.min_datetime = pd.Timestamp(info['min_datetime']) if info['min_datetime'] else pd.NaT
+        self.max_datetime = pd.Timestamp(info['max_datetime']) if info['max_datetime'] else pd.NaT
+
+    @classmethod
+    def open(cls, url, paths, mapping):
+        # Loads the files on the server, or reuses them if another client
+        # already did. The paths must be readable by the server process.
+        url = url.rstrip('/')
+        info = _request(f'{url}/datasets', {'paths': [os.path.abspath(path) for path in paths], 'mapping': mapping})
+        return cls(url, info)
+
+    def __len__(self):
+        return self.rows
+
+    def count(self, start=None, end=None):
+        return _request(f'{self.url}/datasets/{self.id}/count', {'start': _bound(start), 'end': _bound(end)})['count']
+
+    def analyze(self, analysis_type, start=None, end=None, location_type="main_city", top_n=10, **options):
+        # Options of other analyses (suspects, window lengths) do not apply
+        # to the ones the server answers
+        if analysis_type not in SERVER_TYPES:
+            raise ValueError(f"The analysis server only answers the {', '.join(SERVER_TYPES)} analyses")
+        response = _request(f'{self.url}/datasets/{self.id}/analyze', {
+            'analysis': analysis_type, 'start': _bound(start), 'end': _bound(end),
+            'location_type': location_type, 'top_n': top_n,
+        })
+        data = pd.DataFrame(response['data']['data'], columns=response['data']['columns'])
+        if 'Date' in data.columns:
+            data['Date'] = pd.to_datetime(data['Date']).dt.date
+        results = {'type': response['type'], 'data': data, 'title': response['title']}
+        if response.get('subtype') is not None:
+            results['subtype'] = response['subtype']
+        return results
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+from cdr_defaults import DEFAULT_MEETING_MINUTES
+from cdr_temporal import NS_PER_MINUTE
+
+# Distinct numbers that must share a window and place
+MIN_PRESENT = 2
+
+
+class CoPresence:
+    # Time-bucketed join of records on (window, place). Every record is
+    # reduced to a (window, place, person) key; hashing those keys gives
+    # the distinct sightings, and a window/place seen by two or more people
+    # is a meeting. Consecutive meeting windows at the same place with the
+    # same people present merge into one event, so everyone listed for an
+    # event was there at the same time. The work is a few hash and sort
+    # passes over the records, independent of how many people are compared.
+    def __init__(self, ns, places, people, window_minutes=DEFAULT_MEETING_MINUTES):
+        # ns: int64 timestamps; places, people: int64 codes, -1 when missing
+        if window_minutes <= 0:
+            raise ValueError("Meeting window must be at least one minute")
+        width = window_minutes * NS_PER_MINUTE
+        keep = (places >= 0) & (people >= 0)
+        ns, places, people = ns[keep], places[keep], people[keep]
+        n_places = int(places.max()) + 1 if len(places) else 1
+        n_people = int(people.max()) + 1 if len(people) else 1
+
+        windows = ns // width
+        first = int(windows.min()) if len(windows) else 0
+        slot_codes, slot_keys = pd.factorize((windows - first) * n_places + places)
+        counted = pd.Series(slot_codes.astype(np.int64) * n_people + people).value_counts(sort=False)
+        keys = counted.index.to_numpy()
+
+        # Distinct sightings and the records behind each
+        self.slot = slot = keys // n_people
+        self.person = keys % n_people
+        self.records = counted.to_numpy()
+
+        # Window/places with enough people present, ordered by place, then time
+        present = np.bincount(slot, minlength=len(slot_keys))
+        shared = np.flatnonzero(present >= MIN_PRESENT)
+        self.slot_window, self.slot_place = np.divmod(np.asarray(slot_keys, dtype=np.int64), n_places)
+        window, place = self.slot_window[shared], self.slot_place[shared]
+        order = np.lexsort((window, place))
+        shared, window, place = shared[order], window[order], place[order]
+
+        # A new event starts at a new place, after a window without a
+        # meeting or when someone arrives or leaves
+        same = (place[1:] == place[:-1]) & (window[1:] == window[:-1] + 1)
+        same &= present[shared[1:]] == present[shared[:-1]]
+        same[same] = self._same_people(shared[:-1][same], shared[1:][same], present)
+        new_event = np.ones(len(shared), dtype=bool)
+        new_event[1:] = ~same
+        starts = np.flatnonzero(new_event)
+        event_of_slot = np.full(len(slot_keys), -1, dtype=np.int64)
+        event_of_slot[shared] = np.cumsum(new_event) - 1
+
+        self.first = first
+        self.width = width
+        self.place = place[starts]
+        self.start = (first + window[starts]) * width
+        last = np.r_[starts[1:], len(shared)][:len(starts)] - 1
+        self.end = (first + window[last] + 1) * width
+        self.event = event_of_slot[slot]
+
+    def __len__(self):
+        return len(self.place)
+
+    def _same_people(self, slots_a, slots_b, present):
+        # Whether each slot in slots_a has the same people as the one in
+        # slots_b; both have present[slot] people. The sightings are sorted
+        # by slot and person, so equal sets are equal runs.
+        order = np.lexsort((self.person, self.slot))
+        people = self.person[order]
+        offsets = np.searchsorted(self.slot[order], np.arange(len(present)))
+        sizes = present[slots_a]
+        if not len(sizes):
+            return np.zeros(0, dtype=bool)
+        run_starts = np.cumsum(sizes) - sizes
+        within = np.arange(int(sizes.sum())) - np.repeat(run_starts, sizes)
+        equal = (people[np.repeat(offsets[slots_a], sizes) + within]
+                 == people[np.repeat(offsets[slots_b], sizes) + within])
+        return np.logical_and.reduceat(equal, run_starts)
+
+    def members(self):
+        # (event, person, records) of everyone present at each event, one
+        # row per person and event, ordered by event
+        meeting = self.event >= 0
+        frame = pd.DataFrame({
+            'event': self.event[meeting],
+            'person': self.person[meeting],
+            'records': self.records[meeting],
+        })
+        # The same person can be seen in several windows of one event
+        return frame.groupby(['event', 'person'], sort=True, as_index=False)['records'].sum()
+
+    def pairs(self):
+        # Meetings per pair of people as (person a, person b, meetings,
+        # distinct places, first start, last end), most meetings first.
+        # A meeting is a run of consecutive windows in which the pair shared
+        # a place, whoever else came and went. The self-join on window/place
+        # is a hash join; it grows with the people present at each meeting,
+        # not with everyone compared.
+        meeting = self.event >= 0
+        sightings = pd.DataFrame({'slot': self.slot[meeting], 'person': self.person[meeting]})
+        joined = sightings.merge(sightings, on='slot', suffixes=('_a', '_b'))
+        joined = joined[joined['person_a'] < joined['person_b']]
+        slots = joined['slot'].to_numpy()
+        joined = pd.DataFrame({
+            'a': joined['person_a'].to_numpy(),
+            'b': joined['person_b'].to_numpy(),
+            'place': self.slot_place[slots],
+            'window': self.slot_window[slots],
+        }).sort_values(['a', 'b', 'place', 'window'], kind='stable', ignore_index=True)
+
+        a, b = joined['a'].to_numpy(), joined['b'].to_numpy()
+        place, window = joined['place'].to_numpy(), joined['window'].to_numpy()
+        new_run = np.ones(len(joined), dtype=bool)
+        new_run[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1]) | (place[1:] != place[:-1]) | (window[1:] != window[:-1] + 1)
+        runs = joined.assign(run=np.cumsum(new_run)).groupby('run', sort=False).agg(
+            a=('a', 'first'), b=('b', 'first'), place=('place', 'first'), start=('window', 'min'), end=('window', 'max'))
+        runs['start'] = (self.first + runs['start']) * self.width
+        runs['end'] = (self.first + runs['end'] + 1) * self.width
+        summary = runs.groupby(['a', 'b'], sort=False).agg(
+            events=('place', 'size'), places=('place', 'nunique'), first=('start', 'min'), last=('end', 'max'))
+        summary = summary.reset_index().sort_values(['events', 'first'], ascending=[False, True], kind='stable')
+        return summary.reset_index(drop=True)
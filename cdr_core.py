@@ -0,0 +1,527 @@
+import numpy as np
+import pandas as pd
+
+import cdr_temporal
+from cdr_datetime import parse_datetime, parse_durations
+from cdr_dtypes import normalize_phone_labels, value_codes
+from cdr_ingest import SOURCE_COLUMN
+
+# CDR fields the user maps onto columns of the loaded file, in dialog order
+MAPPING_FIELDS = [
+    ("Date Column", "date_col"),
+    ("Time Column (optional)", "time_col"),
+    ("Phone Number (B Party) Column", "phone_col"),
+    ("Phone Number (A Party) Column (optional)", "a_party_col"),
+    ("Main Location Column", "main_loc_col"),
+    ("Sub Location Column (optional)", "sub_loc_col"),
+    ("Cell ID/Address Column (optional)", "cell_id_col"),
+    ("Call Duration Column (optional)", "duration_col")
+]
+
+REQUIRED_MAPPING_KEYS = ['date_col', 'phone_col', 'main_loc_col']
+
+# Mapped fields that, with DateTime and the duration, identify the same
+# call in two batches
+DEDUPE_KEYS = ['a_party_col', 'phone_col']
+
+# Header keywords suggesting each field, strongest first
+FIELD_KEYWORDS = {
+    'duration_col': ['duration', 'talk time', 'call length', 'seconds', 'secs'],
+    'date_col': ['date', 'day'],
+    'time_col': ['time'],
+    'a_party_col': ['a party', 'aparty', 'calling', 'caller', 'msisdn', 'originating'],
+    'phone_col': ['b party', 'bparty', 'called', 'other party', 'destination', 'number', 'party'],
+    'sub_loc_col': ['sub city', 'sub location', 'sub', 'area', 'district'],
+    'main_loc_col': ['main city', 'main location', 'city', 'location', 'site'],
+    'cell_id_col': ['cell', 'cgi', 'address', 'lac'],
+}
+
+# Headers of device/subscriber identifiers that look like phone numbers
+NOT_PHONE_KEYWORDS = ['imei', 'imsi', 'lrn', 'serial', 'iccid']
+
+# Share of sampled values that must look right before a column is suggested
+MIN_VALUE_MATCH = 0.8
+
+# Sampled values per column when suggesting a mapping
+DETECT_SAMPLE = 200
+
+_DATE_PATTERN = r'^\d{1,4}[-/. ](?:\d{1,2}|[A-Za-z]{3})[-/. ]\d{2,4}'
+_TIME_PATTERN = r'^\d{1,2}:\d{2}(?::\d{2})?(?:\.\d+)?(?:\s?[AaPp][Mm])?$'
+
+ANALYSIS_TYPES = ['location', 'numbers', 'date', 'common', 'network', 'heatmap', 'hours', 'bursts',
+                  'copresence', 'meetings', 'talk_numbers', 'talk_locations', 'talk_dates', 'longest']
+
+# Parsed call durations in whole seconds, added next to DateTime; named so
+# it cannot clash with an operator's own "Duration" column
+DURATION_COLUMN = 'DurationSeconds'
+
+# Analyses of the mapped call durations
+TALK_TYPES = ['talk_numbers', 'talk_locations', 'talk_dates', 'longest']
+
+# Columns of the talk time tables, in seconds
+TALK_COLUMNS = ['Calls', 'Total Talk (s)', 'Mean Talk (s)', 'Max Talk (s)']
+
+# Analyses binning the raw timestamps of the date range
+TEMPORAL_TYPES = ['heatmap', 'hours', 'bursts']
+
+LOCATION_TYPES = ['main_city', 'sub_city', 'cell_id']
+
+
+def normalize_mapping(mapping):
+    # Every known field is present; unmapped ones are empty strings
+    return {key: (mapping.get(key) or '') for _, key in MAPPING_FIELDS}
+
+
+def mapped_columns(mapping, extra_columns=()):
+    # Distinct file columns the mapping uses, in field order, followed by
+    # any unmapped columns explicitly asked for
+    columns = [column for _, key in MAPPING_FIELDS if (column := mapping.get(key))]
+    return list(dict.fromkeys(columns + list(extra_columns)))
+
+
+def _keyword_rank(column, key):
+    # Position of the first keyword found in the header, or None
+    name = str(column).lower().replace('_', ' ').replace('-', ' ')
+    for rank, keyword in enumerate(FIELD_KEYWORDS[key]):
+        if keyword in name:
+            return rank
+    return None
+
+
+def _profile_column(series):
+    # Shares of sampled values that look like dates, times and phone numbers
+    values = series.dropna()
+    if len(values) > DETECT_SAMPLE:
+        values = values.iloc[:DETECT_SAMPLE]
+    if str(series.dtype).startswith('datetime64'):
+        # Excel date cells arrive already typed
+        return {'date': 1.0, 'time': 0.0, 'phone': 0.0, 'distinct': values.nunique()}
+
+    text = values.astype(str).str.strip()
+    text = text[text != '']
+    if text.empty:
+        return {'date': 0.0, 'time': 0.0, 'phone': 0.0, 'distinct': 0}
+
+    digits, numeric = normalize_phone_labels(text)
+    # Mostly digits and long enough for a subscriber number
+    phone = numeric & (digits.str.len() >= 7) & (digits.str.len() >= text.str.len() * 0.8)
+    return {
+        'date': float(text.str.match(_DATE_PATTERN).mean()),
+        'time': float(text.str.match(_TIME_PATTERN).mean()),
+        'phone': float(phone.mean()),
+        'distinct': text.nunique(),
+    }
+
+
+def suggest_mapping(df):
+    # Guesses the column mapping from header keywords and from what a
+    # sample of each column's values looks like. Every column is used at
+    # most once; fields without a convincing candidate stay empty.
+    profiles = {column: _profile_column(df[column]) for column in df.columns}
+    mapping = {key: '' for _, key in MAPPING_FIELDS}
+    used = set()
+
+    def pick(key, looks_right=lambda column: True, by_value=False):
+        # Best keyword match among plausible columns; by_value fields fall
+        # back to the first plausible column when no header matches
+        candidates = [
+            (_keyword_rank(column, key), i, column) for i, column in enumerate(df.columns)
+            if column not in used and looks_right(column)
+        ]
+        named = [c for c in candidates if c[0] is not None]
+        if named or (by_value and candidates):
+            column = min(named)[2] if named else candidates[0][2]
+            mapping[key] = column
+            used.add(column)
+        return [column for _, _, column in candidates if column not in used]
+
+    # Durations go first, by header only: H:M:S values also look like times
+    pick('duration_col')
+    pick('date_col', lambda column: profiles[column]['date'] >= MIN_VALUE_MATCH, by_value=True)
+    pick('time_col', lambda column: profiles[column]['time'] >= MIN_VALUE_MATCH, by_value=True)
+
+    # Phone numbers: headers decide A vs B party; otherwise the column with
+    # fewer distinct numbers is taken as the suspect's (A party) side
+    def is_phone(column):
+        name = str(column).lower()
+        return profiles[column]['phone'] >= MIN_VALUE_MATCH and not any(k in name for k in NOT_PHONE_KEYWORDS)
+
+    pick('a_party_col', is_phone)
+    remaining = pick('phone_col', is_phone)
+    if not mapping['phone_col'] and remaining:
+        remaining.sort(key=lambda column: profiles[column]['distinct'])
+        mapping['phone_col'] = remaining[-1]
+        used.add(remaining[-1])
+        if not mapping['a_party_col'] and len(remaining) > 1:
+            mapping['a_party_col'] = remaining[0]
+            used.add(remaining[0])
+
+    # Locations are matched on headers only, among non-date, non-phone columns
+    def is_text(column):
+        profile = profiles[column]
+        return max(profile['date'], profile['time'], profile['phone']) < MIN_VALUE_MATCH
+
+    pick('cell_id_col', lambda column: max(profiles[column]['date'], profiles[column]['time']) < MIN_VALUE_MATCH)
+    pick('sub_loc_col', is_text)
+    pick('main_loc_col', is_text)
+    return mapping
+
+
+def validate_mapping(mapping, columns=None):
+    if any(not mapping.get(key) for key in REQUIRED_MAPPING_KEYS):
+        raise ValueError("Date, Phone Number, and Main Location columns are required")
+
+    if columns is not None:
+        missing = [col for col in mapping.values() if col and col not in columns]
+        if missing:
+            raise ValueError(f"Mapped columns not found in file: {', '.join(missing)}")
+
+
+def dedupe_columns(mapping, columns=()):
+    # Columns identifying a call: A party, B party, DateTime and the parsed
+    # duration when mapped. Without an A Party column the file a record
+    # came from stands in for the caller, when every frame has one.
+    keys = [mapping[key] for key in DEDUPE_KEYS if mapping.get(key)] + ['DateTime']
+    if not mapping.get('a_party_col') and SOURCE_COLUMN in columns:
+        keys.insert(0, SOURCE_COLUMN)
+    if mapping.get('duration_col'):
+        keys.append(DURATION_COLUMN)
+    return keys
+
+
+def build_datetime(df, mapping):
+    # Returns (DateTime series, number of rows that failed to parse)
+    return parse_datetime(df, mapping['date_col'], mapping.get('time_col') or None)
+
+
+def prepare_dataset(df, mapping):
+    # Adds the parsed DateTime column in place and returns how many rows
+    # could not be parsed
+    df['DateTime'], failed = build_datetime(df, mapping)
+
+    # Check if datetime conversion was successful
+    if failed == len(df):
+        raise ValueError("Could not parse dates. Please check the date format in your file.")
+
+    # Call durations become whole seconds next to the raw column
+    if mapping.get('duration_col'):
+        df[DURATION_COLUMN] = parse_durations(df[mapping['duration_col']])
+    return failed
+
+
+def filter_date_range(df, start_date, end_date):
+    return df[(df['DateTime'] >= start_date) & (df['DateTime'] <= end_date)]
+
+
+def location_column(mapping, location_type):
+    # Map location type to column name
+    if location_type == "sub_city":
+        column = mapping.get("sub_loc_col")
+        if not column:
+            raise ValueError("Sub location column not mapped")
+    elif location_type == "cell_id":
+        column = mapping.get("cell_id_col")
+        if not column:
+            raise ValueError("Cell ID column not mapped")
+    else:
+        column = mapping["main_loc_col"]
+    return column
+
+
+def _top_counts(series, top_n, labels):
+    counts = series.value_counts()
+    # Categorical columns also report values absent from this slice
+    counts = counts[counts > 0].head(top_n).reset_index()
+    counts.columns = labels
+    return counts
+
+
+def location_results(data, location_type, top_n):
+    return {
+        "type": "location",
+        "subtype": location_type,
+        "data": data,
+        "title": f"Top {top_n} Common Locations"
+    }
+
+
+def number_results(data, top_n):
+    return {
+        "type": "numbers",
+        "data": data,
+        "title": f"Top {top_n} Most Called Numbers"
+    }
+
+
+def date_volume_results(data):
+    return {
+        "type": "date",
+        "data": data,
+        "title": "Call Volume by Date"
+    }
+
+
+def common_contact_results(data, n_suspects):
+    return {
+        "type": "common",
+        "data": data,
+        "title": f"Common Contacts of {n_suspects} Suspects"
+    }
+
+
+def network_results(data, hops=None):
+    return {
+        "type": "network",
+        "data": data,
+        "title": f"Contacts Within {hops} Hop{'s' if hops != 1 else ''}" if hops else "Most Connected Numbers"
+    }
+
+
+def heatmap_results(data):
+    return {
+        "type": "heatmap",
+        "data": data,
+        "title": "Calls by Day of Week and Hour"
+    }
+
+
+def active_hours_results(data, top_n):
+    return {
+        "type": "hours",
+        "data": data,
+        "title": f"Active Hours of the Top {top_n} Numbers"
+    }
+
+
+def burst_results(data, window_minutes):
+    return {
+        "type": "bursts",
+        "data": data,
+        "title": f"Call Bursts ({window_minutes}-Minute Windows)"
+    }
+
+
+def copresence_results(data, location_type, window_minutes):
+    return {
+        "type": "copresence",
+        "subtype": location_type,
+        "data": data,
+        "title": f"Co-presence Events ({window_minutes}-Minute Windows)"
+    }
+
+
+def meeting_results(data, location_type, window_minutes):
+    return {
+        "type": "meetings",
+        "subtype": location_type,
+        "data": data,
+        "title": f"Meetings Between Numbers ({window_minutes}-Minute Windows)"
+    }
+
+
+def talk_results(data, analysis_type, top_n, location_type=None):
+    titles = {
+        'talk_numbers': f"Top {top_n} Numbers by Talk Time",
+        'talk_locations': f"Top {top_n} Locations by Talk Time",
+        'talk_dates': "Talk Time by Date",
+        'longest': f"{top_n} Longest Calls",
+    }
+    results = {
+        "type": analysis_type,
+        "data": data,
+        "title": titles[analysis_type]
+    }
+    if location_type:
+        results["subtype"] = location_type
+    return results
+
+
+def analyze_location(df, mapping, location_type, top_n):
+    column = location_column(mapping, location_type)
+    return location_results(_top_counts(df[column], top_n, ['Location', 'Count']), location_type, top_n)
+
+
+def analyze_numbers(df, mapping, top_n, phone_table=None):
+    data = _top_counts(df[mapping['phone_col']], top_n, ['Phone Number', 'Count'])
+    if phone_table is not None:
+        # Turn normalized int64 keys back into the numbers as written
+        data['Phone Number'] = phone_table.format(data['Phone Number'])
+    return number_results(data, top_n)
+
+
+def analyze_date_volume(df):
+    # Records per day from integer day numbers; only the days get a date object
+    ns, valid = cdr_temporal.timestamps(df['DateTime'])
+    first, counts = cdr_temporal.daily_counts(ns[valid])
+    days = np.flatnonzero(counts)
+    date_counts = pd.DataFrame({
+        'Date': (days + first).astype('datetime64[D]').astype(object),
+        'Call Count': counts[days],
+    })
+    return date_volume_results(date_counts)
+
+
+def heatmap_frame(matrix, labels, label_column):
+    # One row per label, one column per hour of day
+    data = pd.DataFrame(matrix, columns=cdr_temporal.HOUR_LABELS)
+    data.insert(0, label_column, labels)
+    return data
+
+
+def analyze_heatmap(df):
+    ns, valid = cdr_temporal.timestamps(df['DateTime'])
+    matrix = cdr_temporal.weekly_heatmap(ns[valid])
+    return heatmap_results(heatmap_frame(matrix, cdr_temporal.WEEKDAYS, 'Day'))
+
+
+def analyze_active_hours(df, mapping, top_n, phone_table=None):
+    # Hour-of-day activity of the most called numbers
+    ns, valid = cdr_temporal.timestamps(df['DateTime'])
+    values = df[mapping['phone_col']]
+    if not valid.all():
+        values, ns = values[valid], ns[valid]
+    labels, calls, matrix = cdr_temporal.hourly_profiles(values, ns, top_n)
+    if phone_table is not None:
+        labels = phone_table.format(labels)
+
+    night = slice(*cdr_temporal.NIGHT_HOURS)
+    data = heatmap_frame(matrix, labels, 'Phone Number')
+    data.insert(1, 'Calls', calls)
+    data.insert(2, 'Active Hours', np.count_nonzero(matrix, axis=1))
+    data.insert(3, 'Peak Hour', [f"{hour:02d}:00" for hour in matrix.argmax(axis=1)])
+    data.insert(4, 'Night Calls', matrix[:, night].sum(axis=1))
+    return active_hours_results(data, top_n)
+
+
+def analyze_bursts(df, mapping, top_n, phone_table=None, window_minutes=cdr_temporal.DEFAULT_BURST_MINUTES):
+    # The top_n strongest bursts, each with the number calling most in it
+    ns, valid = cdr_temporal.timestamps(df['DateTime'])
+    starts, ends, calls, expected, peak = cdr_temporal.detect_bursts(ns[valid], window_minutes)
+
+    # Per-number counts only for the records inside a burst
+    members = cdr_temporal.burst_members(ns, (starts, ends))
+    inside = np.flatnonzero(valid & (members >= 0))
+    pairs = pd.DataFrame({
+        'burst': members[inside],
+        'number': df[mapping['phone_col']].iloc[inside].reset_index(drop=True),
+    })
+    counted = pairs.groupby(['burst', 'number'], observed=True).size().rename('calls')
+    top = counted.sort_values(ascending=False, kind='stable').reset_index().drop_duplicates('burst')
+    top = top.set_index('burst').reindex(np.arange(len(starts)))
+    numbers = counted.groupby(level='burst').size().reindex(np.arange(len(starts)), fill_value=0)
+
+    top_numbers = top['number'].to_numpy()
+    if phone_table is not None:
+        top_numbers = phone_table.format(top_numbers)
+    data = pd.DataFrame({
+        'Start': pd.to_datetime(starts),
+        'End': pd.to_datetime(ends),
+        'Calls': calls,
+        'Expected': np.round(expected, 1),
+        'Peak Z': np.round(peak, 1),
+        'Numbers': numbers.to_numpy(),
+        'Top Number': top_numbers,
+        'Top Number Calls': top['calls'].fillna(0).astype(np.int64).to_numpy(),
+    })
+    data = data.iloc[np.argsort(expected - calls, kind='stable')[:top_n]].reset_index(drop=True)
+    return burst_results(data, window_minutes)
+
+
+def talk_seconds(df):
+    # Call durations as float seconds, NaN where unknown
+    if DURATION_COLUMN not in df.columns:
+        raise ValueError("Call duration column not mapped")
+    return df[DURATION_COLUMN].to_numpy(dtype='float64', na_value=np.nan)
+
+
+def talk_stats(codes, seconds):
+    # Calls, summed seconds, calls with a duration and the longest call per
+    # code, all from one grouped pass: the codes are grouped once and each
+    # statistic is a vectorized reduction over the same groups. Codes below
+    # zero (missing values) are left out.
+    present = codes >= 0
+    grouped = pd.Series(seconds[present]).groupby(codes[present], sort=False)
+    stats = grouped.agg(['size', 'sum', 'count', 'max'])
+    stats.columns = ['calls', 'seconds', 'timed', 'longest']
+    return stats
+
+
+def talk_frame(labels, calls, seconds, timed, longest, label_column):
+    # Mean talk time is over the calls that have a duration
+    timed = np.asarray(timed, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(timed > 0, np.asarray(seconds, dtype=np.float64) / timed, np.nan)
+    data = pd.DataFrame({
+        label_column: labels,
+        'Calls': np.asarray(calls, dtype=np.int64),
+        'Total Talk (s)': np.asarray(seconds, dtype=np.float64).round().astype(np.int64),
+        'Mean Talk (s)': mean.round(1),
+        'Max Talk (s)': pd.array(np.asarray(longest, dtype=np.float64), dtype='Float64').round().astype('Int64'),
+    })
+    return data
+
+
+def top_talk(data, top_n):
+    # Highest total talk time first; ties keep the busier value first
+    return data.sort_values(['Total Talk (s)', 'Calls'], ascending=False, kind='stable').head(top_n).reset_index(drop=True)
+
+
+def longest_calls(df, mapping, top_n, phone_table=None):
+    # The top_n longest calls of the frame, longest first
+    seconds = pd.Series(talk_seconds(df))
+    rows = seconds.nlargest(top_n).index.to_numpy()
+    calls = df.iloc[rows]
+    data = pd.DataFrame({'DateTime': calls['DateTime'].to_numpy()})
+    for label, key in [('A Party', 'a_party_col'), ('B Party', 'phone_col')]:
+        if mapping.get(key):
+            values = calls[mapping[key]].to_numpy()
+            data[label] = phone_table.format(values) if phone_table is not None else values
+    data['Location'] = calls[mapping['main_loc_col']].astype(object).to_numpy()
+    data['Duration (s)'] = seconds.iloc[rows].astype(np.int64).to_numpy()
+    return data
+
+
+def analyze_talk_time(df, mapping, analysis_type, location_type="main_city", top_n=10, phone_table=None):
+    if analysis_type == "longest":
+        return talk_results(longest_calls(df, mapping, top_n, phone_table), analysis_type, top_n)
+
+    seconds = talk_seconds(df)
+    if analysis_type == "talk_dates":
+        ns, valid = cdr_temporal.timestamps(df['DateTime'])
+        days = ns[valid] // cdr_temporal.NS_PER_DAY
+        first = int(days.min()) if len(days) else 0
+        stats = talk_stats(days - first, seconds[valid]).sort_index()
+        labels = (stats.index.to_numpy() + first).astype('datetime64[D]').astype(object)
+        data = talk_frame(labels, *(stats[column] for column in stats.columns), 'Date')
+        return talk_results(data, analysis_type, top_n)
+
+    if analysis_type == "talk_numbers":
+        column, label_column = mapping['phone_col'], 'Phone Number'
+    else:
+        column, label_column = location_column(mapping, location_type), 'Location'
+    codes, uniques = value_codes(df[column])
+    stats = talk_stats(codes, seconds)
+    labels = np.asarray(uniques.take(stats.index.to_numpy()), dtype=object)
+    data = top_talk(talk_frame(labels, *(stats[column] for column in stats.columns), label_column), top_n)
+    if analysis_type == "talk_numbers" and phone_table is not None:
+        data['Phone Number'] = phone_table.format(data['Phone Number'])
+    return talk_results(data, analysis_type, top_n, location_type if analysis_type == "talk_locations" else None)
+
+
+def run_analysis(df, mapping, analysis_type, location_type="main_city", top_n=10, phone_table=None,
+                 burst_minutes=cdr_temporal.DEFAULT_BURST_MINUTES):
+    if analysis_type == "location":
+        return analyze_location(df, mapping, location_type, top_n)
+    if analysis_type == "numbers":
+        return analyze_numbers(df, mapping, top_n, phone_table)
+    if analysis_type == "date":
+        return analyze_date_volume(df)
+    if analysis_type == "heatmap":
+        return analyze_heatmap(df)
+    if analysis_type == "hours":
+        return analyze_active_hours(df, mapping, top_n, phone_table)
+    if analysis_type == "bursts":
+        return analyze_bursts(df, mapping, top_n, phone_table, burst_minutes)
+    if analysis_type in TALK_TYPES:
+        return analyze_talk_time(df, mapping, analysis_type, location_type, top_n, phone_table)
+    raise ValueError(f"Unknown analysis type: {analysis_type}")
@@ -0,0 +1,306 @@
+import numpy as np
+import pandas as pd
+
+from cdr_core import DURATION_COLUMN
+
+# Cube dimension -> mapping key of the column it counts
+CUBE_DIMENSIONS = {
+    'main_city': 'main_loc_col',
+    'sub_city': 'sub_loc_col',
+    'cell_id': 'cell_id_col',
+    'numbers': 'phone_col',
+}
+
+NS_PER_DAY = 86_400 * 10 ** 9
+
+
+def _talk_partitions(keys, calls, seconds, timed, longest):
+    # Calls and talk time of each key in one grouped pass; rows may be
+    # single records (calls = 1) or partitions being merged
+    frame = pd.DataFrame({'calls': calls, 'seconds': seconds, 'timed': timed, 'longest': longest})
+    return frame.groupby(keys, sort=False).agg(
+        {'calls': 'sum', 'seconds': 'sum', 'timed': 'sum', 'longest': 'max'})
+
+
+def _record_talk(seconds):
+    # (calls, seconds, timed, longest) columns of single records
+    return np.ones(len(seconds), dtype=np.int64), np.nan_to_num(seconds), ~np.isnan(seconds), seconds
+
+
+class _DailyCounts:
+    # Per-day partitions of (value code, count) pairs, stored like a CSR
+    # matrix with one row per day, plus the per-record codes for the
+    # partial days at the edges of a query. With call durations each
+    # partition also carries its summed, timed and longest talk time,
+    # counted in the same grouped pass as the calls.
+    def __init__(self, series, day_idx, n_days, seconds=None):
+        codes, uniques = pd.factorize(series)
+        self.labels = np.asarray(uniques, dtype=object)
+        self.row_codes = codes.astype(np.int32 if len(uniques) < 2 ** 31 else np.int64)
+
+        valid = codes >= 0
+        n_values = max(len(uniques), 1)
+        keys = day_idx[valid].astype(np.int64) * n_values + codes[valid]
+
+        if seconds is None:
+            # Hash-count the (day, value) pairs, then sort only the distinct ones
+            self._set_partitions(pd.Series(keys).value_counts(sort=False), n_values, n_days)
+        else:
+            self._set_partitions(_talk_partitions(keys, *_record_talk(seconds[valid])), n_values, n_days)
+
+    def _set_partitions(self, counted, n_values, n_days):
+        # counted: count per (day * n_values + code) key, or a frame of
+        # calls and talk time per key
+        order = np.argsort(counted.index.to_numpy(), kind='stable')
+        keys = counted.index.to_numpy()[order]
+
+        if isinstance(counted, pd.DataFrame):
+            self.part_count = counted['calls'].to_numpy()[order].astype(np.int64)
+            self.part_seconds = counted['seconds'].to_numpy()[order].astype(np.float64)
+            self.part_timed = counted['timed'].to_numpy()[order].astype(np.int64)
+            self.part_longest = counted['longest'].to_numpy()[order].astype(np.float64)
+        else:
+            self.part_count = counted.to_numpy()[order].astype(np.int64)
+            self.part_seconds = self.part_timed = self.part_longest = None
+        self.part_code = (keys % n_values).astype(self.row_codes.dtype)
+        part_day = keys // n_values
+        self.day_ptr = np.searchsorted(part_day, np.arange(n_days + 1))
+
+    def extend(self, series, day_idx, shift, n_days, order, seconds=None):
+        # Folds a new batch in: unseen values get new codes, its (day, value)
+        # counts are merged into the existing partitions, and the per-record
+        # codes follow the dataset's new row order
+        values = np.asarray(series, dtype=object)
+        codes = pd.Index(self.labels).get_indexer(values)
+        unseen = (codes < 0) & pd.notna(values)
+        if unseen.any():
+            new_codes, new_labels = pd.factorize(values[unseen])
+            codes[unseen] = new_codes + len(self.labels)
+            self.labels = np.concatenate([self.labels, np.asarray(new_labels, dtype=object)])
+
+        n_values = max(len(self.labels), 1)
+        old_days = np.repeat(np.arange(len(self.day_ptr) - 1), np.diff(self.day_ptr)) + shift
+        valid = codes >= 0
+        keys = np.concatenate([
+            old_days.astype(np.int64) * n_values + self.part_code,
+            day_idx[valid].astype(np.int64) * n_values + codes[valid],
+        ])
+        if self.part_seconds is not None:
+            talk = _record_talk(seconds[valid])
+            old = (self.part_count, self.part_seconds, self.part_timed, self.part_longest)
+            self._set_partitions(_talk_partitions(keys, *(np.concatenate(pair) for pair in zip(old, talk))),
+                                 n_values, n_days)
+        else:
+            weights = np.concatenate([self.part_count, np.ones(int(valid.sum()), dtype=np.int64)])
+            self._set_partitions(pd.Series(weights).groupby(keys).sum(), n_values, n_days)
+
+        row_codes = np.concatenate([self.row_codes, codes.astype(self.row_codes.dtype)])
+        self.row_codes = row_codes if order is None else row_codes[order]
+
+    def counts(self, day_lo, day_hi, edge_ranges):
+        # Sum the whole days, then add raw records in the partial edge days
+        parts = slice(self.day_ptr[day_lo], self.day_ptr[day_hi]) if day_hi > day_lo else slice(0, 0)
+        totals = np.bincount(self.part_code[parts], weights=self.part_count[parts],
+                             minlength=len(self.labels)).astype(np.int64)
+        for lo, hi in edge_ranges:
+            codes = self.row_codes[lo:hi]
+            totals += np.bincount(codes[codes >= 0], minlength=len(self.labels))
+        return totals
+
+    def talk(self, day_lo, day_hi, edge_ranges, edge_seconds):
+        # (calls, seconds, timed, longest) per value code: the whole days'
+        # partitions and the edge records are reduced together.
+        # edge_seconds(lo, hi) gives the durations of records lo..hi.
+        parts = slice(self.day_ptr[day_lo], self.day_ptr[day_hi]) if day_hi > day_lo else slice(0, 0)
+        codes = [self.part_code[parts].astype(np.int64)]
+        columns = [[self.part_count[parts]], [self.part_seconds[parts]], [self.part_timed[parts]],
+                   [self.part_longest[parts]]]
+        for lo, hi in edge_ranges:
+            row_codes = self.row_codes[lo:hi]
+            present = row_codes >= 0
+            codes.append(row_codes[present].astype(np.int64))
+            for column, values in zip(columns, _record_talk(edge_seconds(lo, hi)[present])):
+                column.append(values)
+        codes = np.concatenate(codes)
+        calls, seconds, timed, longest = (np.concatenate(column) for column in columns)
+
+        n = len(self.labels)
+        longest_by_code = np.full(n, np.nan)
+        np.fmax.at(longest_by_code, codes, longest)
+        return (np.bincount(codes, weights=calls, minlength=n).astype(np.int64),
+                np.bincount(codes, weights=seconds, minlength=n),
+                np.bincount(codes, weights=timed, minlength=n).astype(np.int64),
+                longest_by_code)
+
+    def top(self, day_lo, day_hi, edge_ranges, top_n):
+        totals = self.counts(day_lo, day_hi, edge_ranges)
+        nonzero = np.flatnonzero(totals)
+        if len(nonzero) > top_n:
+            nonzero = nonzero[np.argpartition(-totals[nonzero], top_n - 1)[:top_n]]
+        nonzero = nonzero[np.argsort(-totals[nonzero], kind='stable')]
+        return self.labels[nonzero], totals[nonzero]
+
+
+class AggregateCube:
+    # Daily counts per main city, sub city, cell ID and B-party number,
+    # built once from a time-sorted CDRDataset. Date-range queries sum the
+    # precomputed days instead of rescanning the raw records. When call
+    # durations are mapped, every count carries its talk time as well.
+    def __init__(self, dataset):
+        self.dataset = dataset
+        df = dataset.df.iloc[:dataset.valid_rows]
+
+        days = self._day_index(df)
+        self.day0 = int(days[0]) if len(days) else 0
+        day_idx = (days - self.day0).astype(np.int32)
+        self.n_days = int(day_idx[-1]) + 1 if len(day_idx) else 0
+
+        # Rows per day; the dataset is sorted so each day is a contiguous run
+        self.day_rows = np.bincount(day_idx, minlength=self.n_days)
+        self.day_start_row = np.concatenate([[0], np.cumsum(self.day_rows)])
+
+        seconds = self._seconds(df)
+        self.day_seconds = self.day_timed = self.day_longest = None
+        if seconds is not None:
+            self._add_day_talk(day_idx, seconds, self.n_days)
+
+        self.dimensions = {}
+        for dimension, key in CUBE_DIMENSIONS.items():
+            column = dataset.mapping.get(key)
+            if column and column in df.columns:
+                self.dimensions[dimension] = _DailyCounts(df[column], day_idx, self.n_days, seconds)
+
+    def _day_index(self, df):
+        ns = df['DateTime'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        return ns // NS_PER_DAY
+
+    def _seconds(self, df):
+        # Call durations as float seconds (NaN when unknown), or None
+        if DURATION_COLUMN not in df.columns:
+            return None
+        return df[DURATION_COLUMN].to_numpy(dtype='float64', na_value=np.nan)
+
+    @property
+    def has_talk(self):
+        return self.day_seconds is not None
+
+    def _add_day_talk(self, day_idx, seconds, n_days, shift=0):
+        # Adds records' talk time to the per-day totals, moving the existing
+        # days right by shift when the cube now starts earlier
+        old = (self.day_seconds, self.day_timed, self.day_longest)
+        self.day_seconds = np.zeros(n_days)
+        self.day_timed = np.zeros(n_days, dtype=np.int64)
+        self.day_longest = np.full(n_days, np.nan)
+        if old[0] is not None:
+            for new, values in zip((self.day_seconds, self.day_timed, self.day_longest), old):
+                new[shift:shift + len(values)] = values
+
+        _, total, timed, longest = _record_talk(seconds)
+        self.day_seconds += np.bincount(day_idx, weights=total, minlength=n_days)
+        self.day_timed += np.bincount(day_idx, weights=timed, minlength=n_days).astype(np.int64)
+        np.fmax.at(self.day_longest, day_idx, longest)
+
+    def extend(self, new_df, order=None):
+        # Updates the cube after CDRDataset.append. new_df holds the appended
+        # records with a valid DateTime, sorted; order is the permutation the
+        # dataset applied to its valid rows when they were not simply appended.
+        days = self._day_index(new_df)
+        if not len(days):
+            return
+
+        day0 = min(self.day0, int(days[0])) if self.n_days else int(days[0])
+        shift = self.day0 - day0 if self.n_days else 0
+        n_days = max(self.n_days + shift, int(days[-1]) - day0 + 1)
+        day_idx = (days - day0).astype(np.int32)
+
+        day_rows = np.zeros(n_days, dtype=np.int64)
+        day_rows[shift:shift + self.n_days] = self.day_rows
+        day_rows += np.bincount(day_idx, minlength=n_days)
+
+        self.day0, self.n_days, self.day_rows = day0, n_days, day_rows
+        self.day_start_row = np.concatenate([[0], np.cumsum(day_rows)])
+
+        seconds = self._seconds(new_df) if self.has_talk else None
+        if seconds is not None:
+            self._add_day_talk(day_idx, seconds, n_days, shift)
+
+        for dimension, key in CUBE_DIMENSIONS.items():
+            if dimension in self.dimensions:
+                self.dimensions[dimension].extend(new_df[self.dataset.mapping[key]], day_idx, shift, n_days, order,
+                                                  seconds)
+
+    def _plan(self, start, end):
+        # Split [start, end] into whole cube days and raw edge row ranges
+        lo, hi = self.dataset.row_range(start, end)
+        if hi <= lo or not self.n_days:
+            return 0, 0, []
+
+        start_ns = pd.Timestamp(start).value if start is not None else self.day0 * NS_PER_DAY
+        end_ns = pd.Timestamp(end).value if end is not None else (self.day0 + self.n_days) * NS_PER_DAY - 1
+
+        # First day that starts inside the range, first day that ends after it
+        day_lo = min(max(-(-start_ns // NS_PER_DAY) - self.day0, 0), self.n_days)
+        day_hi = min(max((end_ns + 1) // NS_PER_DAY - self.day0, 0), self.n_days)
+
+        if day_hi <= day_lo:
+            return 0, 0, [(lo, hi)]
+
+        edges = []
+        if lo < self.day_start_row[day_lo]:
+            edges.append((lo, self.day_start_row[day_lo]))
+        if self.day_start_row[day_hi] < hi:
+            edges.append((self.day_start_row[day_hi], hi))
+        return day_lo, day_hi, edges
+
+    def top(self, dimension, start, end, top_n):
+        day_lo, day_hi, edges = self._plan(start, end)
+        return self.dimensions[dimension].top(day_lo, day_hi, edges, top_n)
+
+    def daily_volume(self, start, end):
+        day_lo, day_hi, edges = self._plan(start, end)
+        counts = np.zeros(self.n_days, dtype=np.int64)
+        counts[day_lo:day_hi] = self.day_rows[day_lo:day_hi]
+
+        # Edge rows are contiguous, so their per-day counts come from offsets
+        for lo, hi in edges:
+            first = np.searchsorted(self.day_start_row, lo, side='right') - 1
+            last = np.searchsorted(self.day_start_row, hi - 1, side='right') - 1
+            for day in range(first, last + 1):
+                counts[day] += min(hi, self.day_start_row[day + 1]) - max(lo, self.day_start_row[day])
+
+        days = np.flatnonzero(counts)
+        dates = (days + self.day0).astype('datetime64[D]').astype(object)
+        return dates, counts[days]
+
+    def _edge_seconds(self, lo, hi):
+        return self._seconds(self.dataset.df.iloc[lo:hi])
+
+    def talk(self, dimension, start, end):
+        # (labels, calls, seconds, timed, longest) of every value with calls
+        day_lo, day_hi, edges = self._plan(start, end)
+        dim = self.dimensions[dimension]
+        calls, seconds, timed, longest = dim.talk(day_lo, day_hi, edges, self._edge_seconds)
+        present = np.flatnonzero(calls)
+        return dim.labels[present], calls[present], seconds[present], timed[present], longest[present]
+
+    def daily_talk(self, start, end):
+        # (dates, calls, seconds, timed, longest) per day with calls
+        day_lo, day_hi, edges = self._plan(start, end)
+        whole = np.zeros(self.n_days, dtype=bool)
+        whole[day_lo:day_hi] = True
+        calls = np.where(whole, self.day_rows, 0)
+        seconds = np.where(whole, self.day_seconds, 0.0)
+        timed = np.where(whole, self.day_timed, 0)
+        longest = np.where(whole, self.day_longest, np.nan)
+
+        for lo, hi in edges:
+            days = np.searchsorted(self.day_start_row, np.arange(lo, hi), side='right') - 1
+            _, edge_seconds, edge_timed, edge_longest = _record_talk(self._edge_seconds(lo, hi))
+            calls += np.bincount(days, minlength=self.n_days)
+            seconds += np.bincount(days, weights=edge_seconds, minlength=self.n_days)
+            timed += np.bincount(days, weights=edge_timed, minlength=self.n_days).astype(np.int64)
+            np.fmax.at(longest, days, edge_longest)
+
+        days = np.flatnonzero(calls)
+        dates = (days + self.day0).astype('datetime64[D]').astype(object)
+        return dates, calls[days], seconds[days], timed[days], longest[days]
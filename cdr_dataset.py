@@ -0,0 +1,304 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import cdr_core
+from cdr_copresence import DEFAULT_MEETING_MINUTES, CoPresence
+from cdr_cube import AggregateCube
+from cdr_dtypes import compact_frame, concat_frames, value_codes
+from cdr_graph import ContactGraph, caller_keys
+from cdr_profile import stage
+from cdr_temporal import DEFAULT_BURST_MINUTES, timestamps
+
+# Date windows whose slices are kept around for repeated analyses
+DEFAULT_SLICE_CACHE_SIZE = 8
+
+
+def sort_by_datetime(df):
+    # Stable sort so records with equal timestamps keep their file order;
+    # unparseable dates (NaT) end up at the back
+    times = df['DateTime']
+    valid_rows = int(times.notna().sum())
+    if times.iloc[:valid_rows].notna().all() and times.iloc[:valid_rows].is_monotonic_increasing:
+        return df
+    return df.sort_values('DateTime', kind='stable', na_position='last', ignore_index=True)
+
+
+def build_dataset(df, mapping):
+    # Everything that happens once the column mapping is confirmed: parse
+    # DateTime, shrink the mapped columns and sort. Returns the dataset and
+    # the number of rows whose dates could not be parsed.
+    with stage('parse_datetime', rows=len(df)) as record:
+        failed = cdr_core.prepare_dataset(df, mapping)
+        record['failed'] = failed
+    with stage('compact', rows=len(df)):
+        phone_table = compact_frame(df, mapping)
+    return CDRDataset(df, mapping, phone_table), failed
+
+
+class CDRDataset:
+    def __init__(self, df, mapping, phone_table=None, slice_cache_size=DEFAULT_SLICE_CACHE_SIZE):
+        with stage('sort', rows=len(df)):
+            self.df = sort_by_datetime(df)
+        self.mapping = mapping
+        self.phone_table = phone_table
+        self.slice_cache_size = slice_cache_size
+        self._slices = OrderedDict()
+        # Analyses may run on several threads, e.g. in cdr_server
+        self._slices_lock = threading.Lock()
+        self.cube = None
+        self._graph = None
+        self._reindex()
+
+    def _reindex(self):
+        times = self.df['DateTime']
+        # Only the parsed prefix is searchable; NaT rows never match a range
+        self._valid_rows = int(times.notna().sum())
+        self._times = times.array[:self._valid_rows]
+        with self._slices_lock:
+            self._slices.clear()
+        self._graph = None
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def valid_rows(self):
+        # Records with a parsed DateTime; they form a sorted prefix of df
+        return self._valid_rows
+
+    @property
+    def min_datetime(self):
+        return self._times[0] if self._valid_rows else pd.NaT
+
+    @property
+    def max_datetime(self):
+        return self._times[-1] if self._valid_rows else pd.NaT
+
+    def row_range(self, start, end):
+        # Positions [lo, hi) of records with start <= DateTime <= end
+        lo = 0 if start is None else int(self._times.searchsorted(pd.Timestamp(start), side='left'))
+        hi = self._valid_rows if end is None else int(self._times.searchsorted(pd.Timestamp(end), side='right'))
+        return lo, max(lo, hi)
+
+    def count(self, start=None, end=None):
+        lo, hi = self.row_range(start, end)
+        return hi - lo
+
+    def between(self, start, end):
+        # Zero-copy view of the records in the date range, memoized per window
+        key = (None if start is None else pd.Timestamp(start), None if end is None else pd.Timestamp(end))
+        with self._slices_lock:
+            view = self._slices.get(key)
+            if view is not None:
+                self._slices.move_to_end(key)
+                return view
+
+        lo, hi = self.row_range(*key)
+        view = self.df.iloc[lo:hi]
+        with self._slices_lock:
+            self._slices[key] = view
+            if len(self._slices) > self.slice_cache_size:
+                self._slices.popitem(last=False)
+        return view
+
+    def build_cube(self):
+        # Pre-aggregate daily counts so date-range analyses skip raw records
+        with stage('aggregate', rows=self.valid_rows):
+            self.cube = AggregateCube(self)
+        return self.cube
+
+    def contact_graph(self, start=None, end=None):
+        # A-party/B-party graph of the date range; the last one is kept
+        key = (None if start is None else pd.Timestamp(start), None if end is None else pd.Timestamp(end))
+        if self._graph is None or self._graph[0] != key:
+            self._graph = (key, ContactGraph.from_frame(self.between(*key), self.mapping))
+        return self._graph[1]
+
+    def _phone_labels(self, keys):
+        return self.phone_table.format(keys) if self.phone_table is not None else keys
+
+    def _analyze_contacts(self, analysis_type, start, end, top_n, suspects, hops):
+        graph = self.contact_graph(start, end)
+        keys = self.phone_table.lookup(suspects) if self.phone_table is not None else np.asarray(suspects, dtype=np.int64)
+
+        if analysis_type == "common":
+            if len(set(keys)) < 2:
+                raise ValueError("Enter at least two suspect numbers")
+            found, shared, calls = graph.common_contacts(keys)
+            data = pd.DataFrame({'Phone Number': self._phone_labels(found), 'Suspects': shared, 'Calls': calls})
+            return cdr_core.common_contact_results(data, len(set(keys)))
+
+        if not len(keys):
+            # No seeds: rank the whole graph
+            found, degree, strength = graph.ranking(top_n)
+            data = pd.DataFrame({'Phone Number': self._phone_labels(found), 'Contacts': degree, 'Calls': strength})
+            return cdr_core.network_results(data)
+
+        found, distance = graph.neighbourhood(keys, hops)
+        ids = graph.node_ids(found)
+        data = pd.DataFrame({
+            'Phone Number': self._phone_labels(found),
+            'Hops': distance,
+            'Contacts': graph.degree()[ids],
+            'Calls': graph.strength()[ids],
+        })
+        return cdr_core.network_results(data, hops)
+
+    def _analyze_copresence(self, analysis_type, start, end, location_type, suspects, meeting_minutes):
+        # Numbers seen at the same place in the same window; the place of a
+        # record is where its A party was
+        df = self.between(start, end)
+        places, place_labels = value_codes(df[cdr_core.location_column(self.mapping, location_type)])
+        callers, present = caller_keys(df, self.mapping)
+        if len(suspects):
+            keys = self.phone_table.lookup(suspects) if self.phone_table is not None else np.asarray(suspects, dtype=np.int64)
+            if len(set(keys)) < 2:
+                raise ValueError("Enter at least two suspect numbers, or none to compare every A party")
+            present &= np.isin(callers, keys)
+
+        # Without suspects every A party in the range is compared
+        people = np.full(len(callers), -1, dtype=np.int64)
+        people[present], numbers = pd.factorize(callers[present])
+        events = CoPresence(timestamps(df['DateTime'])[0], places, people, meeting_minutes)
+        labels = np.asarray(self._phone_labels(numbers), dtype=object)
+        place_labels = np.asarray(place_labels, dtype=object)
+
+        if analysis_type == "meetings":
+            pairs = events.pairs()
+            data = pd.DataFrame({
+                'Number A': labels[pairs['a'].to_numpy()],
+                'Number B': labels[pairs['b'].to_numpy()],
+                'Meetings': pairs['events'].to_numpy(),
+                'Locations': pairs['places'].to_numpy(),
+                'First Met': pd.to_datetime(pairs['first'].to_numpy()),
+                'Last Met': pd.to_datetime(pairs['last'].to_numpy()),
+            })
+            return cdr_core.meeting_results(data, location_type, meeting_minutes)
+
+        # Members come ordered by event, so each event is a run of rows;
+        # only the per-event label lists are built in Python
+        members = events.members()
+        bounds = np.searchsorted(members['event'].to_numpy(), np.arange(len(events) + 1))
+        names = labels[members['person'].to_numpy()].tolist()
+        data = pd.DataFrame({
+            'Start': pd.to_datetime(events.start),
+            'End': pd.to_datetime(events.end),
+            'Location': place_labels[events.place],
+            'Numbers Present': np.diff(bounds),
+            'Numbers': [', '.join(names[lo:hi]) for lo, hi in zip(bounds[:-1], bounds[1:])],
+            'Records': np.add.reduceat(members['records'].to_numpy(), bounds[:-1]) if len(events) else [],
+        })
+        data = data.sort_values(['Start', 'Location'], kind='stable', ignore_index=True)
+        return cdr_core.copresence_results(data, location_type, meeting_minutes)
+
+    def _analyze_talk(self, cube, analysis_type, start, end, location_type, top_n):
+        # Talk time from the cube's per-day sums; the longest calls need records
+        if analysis_type == "talk_dates":
+            dates, *stats = cube.daily_talk(start, end)
+            return cdr_core.talk_results(cdr_core.talk_frame(dates, *stats, 'Date'), analysis_type, top_n)
+
+        if analysis_type == "talk_numbers":
+            labels, *stats = cube.talk('numbers', start, end)
+            data = cdr_core.top_talk(cdr_core.talk_frame(labels, *stats, 'Phone Number'), top_n)
+            data['Phone Number'] = self._phone_labels(data['Phone Number'].to_numpy())
+            return cdr_core.talk_results(data, analysis_type, top_n)
+
+        # Raises for unmapped sub city / cell ID columns
+        cdr_core.location_column(self.mapping, location_type)
+        labels, *stats = cube.talk(location_type, start, end)
+        data = cdr_core.top_talk(cdr_core.talk_frame(labels, *stats, 'Location'), top_n)
+        return cdr_core.talk_results(data, analysis_type, top_n, location_type)
+
+    def analyze(self, analysis_type, start=None, end=None, location_type="main_city", top_n=10, suspects=(), hops=1,
+                burst_minutes=DEFAULT_BURST_MINUTES, meeting_minutes=DEFAULT_MEETING_MINUTES):
+        with stage('analyze', rows=self.count(start, end), analysis=analysis_type, cube=self.cube is not None):
+            return self._analyze(analysis_type, start, end, location_type, top_n, suspects, hops, burst_minutes,
+                                 meeting_minutes)
+
+    def _analyze(self, analysis_type, start, end, location_type, top_n, suspects, hops, burst_minutes,
+                 meeting_minutes):
+        if analysis_type in ("common", "network"):
+            return self._analyze_contacts(analysis_type, start, end, top_n, suspects, hops)
+        if analysis_type in ("copresence", "meetings"):
+            return self._analyze_copresence(analysis_type, start, end, location_type, suspects, meeting_minutes)
+
+        cube = self.cube
+        if analysis_type in cdr_core.TALK_TYPES and cube is not None and cube.has_talk and analysis_type != "longest":
+            return self._analyze_talk(cube, analysis_type, start, end, location_type, top_n)
+        if cube is None or analysis_type in cdr_core.TEMPORAL_TYPES or analysis_type in cdr_core.TALK_TYPES:
+            # The cube only has daily counts; hourly analyses bin the slice's timestamps
+            return cdr_core.run_analysis(self.between(start, end), self.mapping, analysis_type, location_type, top_n,
+                                         self.phone_table, burst_minutes)
+
+        if analysis_type == "location":
+            # Raises for unmapped sub city / cell ID columns
+            cdr_core.location_column(self.mapping, location_type)
+            labels, counts = cube.top(location_type, start, end, top_n)
+            data = pd.DataFrame({'Location': labels, 'Count': counts})
+            return cdr_core.location_results(data, location_type, top_n)
+        if analysis_type == "numbers":
+            labels, counts = cube.top('numbers', start, end, top_n)
+            if self.phone_table is not None:
+                labels = self.phone_table.format(labels)
+            data = pd.DataFrame({'Phone Number': labels, 'Count': counts})
+            return cdr_core.number_results(data, top_n)
+        if analysis_type == "date":
+            dates, counts = cube.daily_volume(start, end)
+            data = pd.DataFrame({'Date': dates, 'Call Count': counts})
+            return cdr_core.date_volume_results(data)
+        raise ValueError(f"Unknown analysis type: {analysis_type}")
+
+    def _drop_known(self, new_df):
+        # Removes records already in the dataset (or repeated in the batch),
+        # comparing only against the existing rows in the batch's time window
+        keys = cdr_core.dedupe_columns(self.mapping, set(self.df.columns) & set(new_df.columns))
+        before = len(new_df)
+        new_df = new_df.drop_duplicates(subset=keys, ignore_index=True)
+
+        times = new_df['DateTime'].dropna()
+        if len(times):
+            existing = self.between(times.iloc[0], times.iloc[-1])[keys]
+            if len(existing):
+                seen = pd.MultiIndex.from_frame(new_df[keys]).isin(pd.MultiIndex.from_frame(existing))
+                new_df = new_df[~seen].reset_index(drop=True)
+
+        return new_df, before - len(new_df)
+
+    def append(self, new_df):
+        # Adds a new batch mapped with this dataset's mapping. Parsing,
+        # deduplication and cube updates only touch the new records.
+        # Returns (added rows as a frame, duplicates dropped, unparseable dates).
+        failed = cdr_core.prepare_dataset(new_df, self.mapping)
+        self.phone_table = compact_frame(new_df, self.mapping, self.phone_table)
+        new_df, duplicates = self._drop_known(sort_by_datetime(new_df))
+        if new_df.empty:
+            return new_df, duplicates, failed
+
+        old_valid = self.valid_rows
+        new_valid = int(new_df['DateTime'].notna().sum())
+        old_times = self._times
+        new_first = new_df['DateTime'].iat[0] if new_valid else None
+
+        # Valid rows of both batches first, then the unparseable tails
+        combined = concat_frames([
+            self.df.iloc[:old_valid], new_df.iloc[:new_valid],
+            self.df.iloc[old_valid:], new_df.iloc[new_valid:],
+        ])
+
+        # Deltas normally start after the existing records; otherwise merge
+        # the two sorted runs with a stable sort of the valid prefix
+        order = None
+        if old_valid and new_valid and new_first < old_times[-1]:
+            valid_rows = old_valid + new_valid
+            order = np.argsort(combined['DateTime'].to_numpy()[:valid_rows], kind='stable')
+            combined = combined.take(np.concatenate([order, np.arange(valid_rows, len(combined))]))
+            combined = combined.reset_index(drop=True)
+
+        self.df = combined
+        self._reindex()
+        if self.cube is not None:
+            self.cube.extend(new_df.iloc[:new_valid], order)
+        return new_df, duplicates, failed
@@ -0,0 +1,222 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+# Date layouts seen in operator exports. ISO first, then day-first as used by
+# most operators; a sample that only fits month-first still picks it.
+DATE_FORMATS = [
+    '%Y-%m-%d', '%Y/%m/%d', '%Y%m%d',
+    '%d-%m-%Y', '%d/%m/%Y', '%d.%m.%Y',
+    '%m-%d-%Y', '%m/%d/%Y',
+    '%d-%m-%y', '%d/%m/%y',
+    '%d-%b-%Y', '%d-%b-%y', '%d %b %Y', '%b %d %Y',
+]
+
+TIME_FORMATS = [
+    '%H:%M:%S', '%H:%M:%S.%f', '%H:%M', '%H%M%S',
+    '%I:%M:%S %p', '%I:%M %p',
+]
+
+# Date columns sometimes already carry the time of day
+DATETIME_FORMATS = (
+    [f'{d} {t}' for d in DATE_FORMATS for t in TIME_FORMATS]
+    + [f'{d}T{t}' for d in DATE_FORMATS[:2] for t in TIME_FORMATS[:2]]
+    + DATE_FORMATS
+)
+
+# Rows looked at when choosing a format
+SAMPLE_SIZE = 1000
+
+# Share of the sample a format must parse before it is trusted; rows it
+# cannot parse are reported as failures rather than guessed one by one
+MIN_FORMAT_MATCH = 0.5
+
+_TIME_EPOCH = pd.Timestamp('1900-01-01')
+
+# Durations written with units, e.g. 1h 2m 3s, 4 min 5 sec, 95s
+_DURATION_UNITS = (r'^\s*(?:(?P<h>\d+(?:\.\d+)?)\s*h(?:rs?|ours?)?)?\s*(?:(?P<m>\d+(?:\.\d+)?)\s*m(?:in(?:s|utes?)?)?)?'
+                   r'\s*(?:(?P<s>\d+(?:\.\d+)?)\s*s(?:ecs?|econds?)?)?\s*$')
+
+# Longest duration kept, in seconds; anything longer is a parse error
+MAX_DURATION = 2 ** 31 - 1
+
+
+def _sample(series, size=SAMPLE_SIZE):
+    values = series.dropna()
+    if len(values) > size:
+        values = values.sample(size, random_state=0)
+    values = values.astype(str).str.strip()
+    return values[values != '']
+
+
+def infer_format(series, candidates):
+    # Pick the candidate that parses the largest share of a sample
+    sample = _sample(series)
+    if sample.empty:
+        return None
+
+    best_format, best_rate = None, 0.0
+    for fmt in candidates:
+        parsed = pd.to_datetime(sample, format=fmt, errors='coerce')
+        rate = parsed.notna().mean()
+        if rate > best_rate:
+            best_format, best_rate = fmt, rate
+            if rate == 1.0:
+                break
+
+    return best_format if best_rate >= MIN_FORMAT_MATCH else None
+
+
+def _as_text(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    if not pd.api.types.is_string_dtype(series):
+        series = series.astype(str)
+
+    # Only pay for a stripped copy when the values are actually padded
+    head = series.dropna().head(SAMPLE_SIZE).astype(str)
+    if (head != head.str.strip()).any():
+        series = series.str.strip()
+    return series
+
+
+def _per_category(parse, series, *args):
+    # Dictionary-encoded columns are parsed once per distinct value and
+    # expanded through the codes; missing values (code -1) become NaT/NaN
+    categories = pd.Series(series.cat.categories.astype(object))
+    parsed = parse(categories, *args).to_numpy()
+    codes = series.cat.codes.to_numpy()
+    values = parsed.take(codes, mode='clip')
+    values[codes < 0] = {'M': np.datetime64('NaT'), 'm': np.timedelta64('NaT')}.get(values.dtype.kind, np.nan)
+    return pd.Series(values, index=series.index)
+
+
+def parse_dates(series, formats=DATETIME_FORMATS):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return _per_category(parse_dates, series, formats)
+
+    text = _as_text(series)
+    fmt = infer_format(text, formats)
+    if fmt is None:
+        # Unrecognised layout: let pandas guess element by element
+        return pd.to_datetime(text, errors='coerce', format='mixed')
+    return pd.to_datetime(text, format=fmt, errors='coerce')
+
+
+def parse_times(series):
+    # Time of day as a timedelta since midnight
+    if pd.api.types.is_timedelta64_dtype(series):
+        return series
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series - series.dt.normalize()
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return _per_category(parse_times, series)
+
+    first = series.dropna()
+    if len(first) and isinstance(first.iloc[0], datetime.time):
+        # Excel time cells arrive as datetime.time objects
+        series = series.map(lambda t: t.strftime('%H:%M:%S') if isinstance(t, datetime.time) else t)
+
+    text = _as_text(series)
+    fmt = infer_format(text, TIME_FORMATS)
+    if fmt is None:
+        return pd.to_timedelta(text, errors='coerce')
+    return pd.to_datetime(text, format=fmt, errors='coerce') - _TIME_EPOCH
+
+
+def parse_datetime(df, date_col, time_col=None):
+    # Returns (DateTime series, number of rows that failed to parse)
+    dates = parse_dates(df[date_col])
+
+    if time_col:
+        # Combine numerically instead of concatenating strings per row
+        result = dates.dt.normalize() + parse_times(df[time_col])
+    else:
+        result = dates
+
+    return result, int(result.isna().sum())
+
+
+class ChunkDateTimeParser:
+    # parse_datetime for a stream of chunks read with dictionary-encoded
+    # date and time columns. Parsed values are remembered across chunks, so
+    # each distinct date and time is parsed once per file set instead of
+    # once per chunk. Columns with more distinct values than max_cached,
+    # e.g. dates that carry the time, start over rather than grow.
+    def __init__(self, date_col, time_col=None, max_cached=1_000_000):
+        self.date_col = date_col
+        self.time_col = time_col
+        self.max_cached = max_cached
+        self._parsed = {}
+
+    def _parse(self, parse, series):
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            return parse(series)
+        categories = series.cat.categories.astype(object)
+        known = self._parsed.get(parse)
+        if known is not None and len(known) <= self.max_cached:
+            new = categories[~categories.isin(known.index)]
+        else:
+            known, new = None, categories
+        if len(new):
+            parsed = pd.Series(parse(pd.Series(new)).to_numpy(), index=new)
+            known = parsed if known is None else pd.concat([known, parsed])
+            self._parsed[parse] = known
+        return _per_category(lambda _categories: known.reindex(categories), series)
+
+    def parse(self, df):
+        # Returns (DateTime series, number of rows that failed to parse)
+        dates = self._parse(parse_dates, df[self.date_col])
+        if self.time_col:
+            result = dates.dt.normalize() + self._parse(parse_times, df[self.time_col])
+        else:
+            result = dates
+        return result, int(result.isna().sum())
+
+
+def _duration_seconds(series):
+    # Float seconds of [[H:]M:]S clock values, plain seconds and values
+    # with h/m/s units, in any mix within one column; NaN when unparseable
+    if pd.api.types.is_timedelta64_dtype(series):
+        return series.dt.total_seconds()
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype('float64')
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return _per_category(_duration_seconds, series)
+
+    first = series.dropna()
+    if len(first) and isinstance(first.iloc[0], datetime.time):
+        # Excel duration cells formatted as times
+        series = series.map(lambda t: t.strftime('%H:%M:%S') if isinstance(t, datetime.time) else t)
+
+    text = _as_text(series)
+    seconds = pd.to_numeric(text, errors='coerce').astype('float64')
+
+    # Clock values, right aligned: M:S or H:M:S
+    clock = seconds.isna() & text.str.contains(':', regex=False, na=False)
+    if clock.any():
+        parts = text[clock].str.split(':', n=2, expand=True).apply(pd.to_numeric, errors='coerce')
+        colons = text[clock].str.count(':')
+        total = parts[0] * 60 + parts[1]
+        if parts.shape[1] > 2:
+            total = total.where(colons == 1, parts[0] * 3600 + parts[1] * 60 + parts[2])
+        seconds[clock] = total
+
+    rest = seconds.isna() & text.str.contains(r'\d', na=False)
+    if rest.any():
+        units = text[rest].str.lower().str.extract(_DURATION_UNITS).apply(pd.to_numeric, errors='coerce')
+        matched = units.notna().any(axis=1)
+        seconds[rest] = (units['h'].fillna(0) * 3600 + units['m'].fillna(0) * 60
+                         + units['s'].fillna(0)).where(matched)
+    return seconds
+
+
+def parse_durations(series):
+    # Call durations as whole seconds (nullable Int32); negative or
+    # unparseable values are missing
+    seconds = _duration_seconds(series)
+    seconds = seconds.where((seconds >= 0) & (seconds <= MAX_DURATION))
+    return seconds.round().astype('Int32')
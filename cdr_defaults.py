@@ -0,0 +1,13 @@
+# Analysis defaults shown by the GUI and the command line. Kept free of
+# numpy and pandas so the window can be built before they are imported.
+
+# Burst windows in minutes; a window must divide a day so every window
+# falls on the same clock time each day
+DEFAULT_BURST_MINUTES = 60
+
+# Records of two numbers at the same place within one window of this many
+# minutes count as a meeting
+DEFAULT_MEETING_MINUTES = 30
+
+# Analyses answered by cdr_server; its thin clients offer only these
+SERVER_TYPES = ["location", "numbers", "date"]
@@ -0,0 +1,200 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Mapped columns stored as categoricals (dictionary codes + one copy of each value)
+CATEGORICAL_KEYS = ('main_loc_col', 'sub_loc_col', 'cell_id_col', 'date_col', 'time_col', 'duration_col')
+
+# Mapped columns holding phone numbers, encoded as int64 keys
+PHONE_KEYS = ('phone_col', 'a_party_col')
+
+# Phone keys hold the value of the digits shifted left by these bits, with
+# the digit count in the low bits, so leading zeros are kept
+DIGIT_COUNT_BITS = 5
+
+# Longest digit string whose key still fits an int64
+MAX_MSISDN_DIGITS = 17
+
+
+def read_dtypes(mapping):
+    # Parser dtypes for the mapped columns: low-cardinality fields are
+    # dictionary encoded while the file is read, instead of being built as
+    # one string per row and compacted afterwards; phone numbers stay text
+    # so leading zeros survive until they are encoded
+    dtypes = {}
+    for key in PHONE_KEYS:
+        if mapping.get(key):
+            dtypes[mapping[key]] = str
+    for key in CATEGORICAL_KEYS:
+        column = mapping.get(key)
+        if column and column not in dtypes:
+            dtypes[column] = 'category'
+    return dtypes
+
+
+def value_codes(series):
+    # Dense int codes of a column (-1 for missing) and the values they stand for
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy().astype(np.int64), series.cat.categories
+    codes, uniques = pd.factorize(series)
+    return codes.astype(np.int64), uniques
+
+
+class PhoneTable:
+    # Reversible formatting table for normalized phone numbers. Numbers are
+    # stored as int64 keys of their digits (see phone_keys); the table maps
+    # each key back to the first spelling seen in the file. Values without
+    # usable digits, like short codes with letters, get negative keys.
+    def __init__(self, keys, labels):
+        order = np.argsort(keys, kind='stable')
+        self.keys = np.asarray(keys, dtype=np.int64)[order]
+        self.labels = np.asarray(labels, dtype=object)[order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def format(self, keys):
+        # Display strings for an array of keys; missing keys become None
+        keys = pd.array(keys, dtype='Int64')
+        present = ~np.asarray(keys.isna())
+        values = keys[present].to_numpy(dtype=np.int64)
+
+        labels = values.astype(str).astype(object)
+        labels[values >= 0] = phone_digits(values[values >= 0])
+        if len(self.keys):
+            idx = np.minimum(np.searchsorted(self.keys, values), len(self.keys) - 1)
+            found = self.keys[idx] == values
+            labels[found] = self.labels[idx[found]]
+
+        result = np.full(len(keys), None, dtype=object)
+        result[present] = labels
+        return result
+
+    def lookup(self, numbers):
+        # Keys of numbers typed by the user, in any spelling of the digits;
+        # non-numeric values must match a stored label exactly
+        labels = pd.Series([str(number).strip() for number in numbers], dtype=object)
+        keys, numeric = phone_keys(labels)
+
+        negative = self.keys < 0
+        named = dict(zip(self.labels[negative], self.keys[negative]))
+        for i in np.flatnonzero(~numeric):
+            if labels.iat[i] not in named:
+                raise ValueError(f"Unknown phone number: {labels.iat[i]}")
+            keys[i] = named[labels.iat[i]]
+        return keys
+
+    def to_frame(self):
+        return pd.DataFrame({'key': self.keys, 'label': self.labels.astype(str)})
+
+    @classmethod
+    def from_frame(cls, frame):
+        return cls(frame['key'].to_numpy(dtype=np.int64), frame['label'].to_numpy(dtype=object))
+
+
+def normalize_phone_labels(labels):
+    # Returns (digit strings, mask of values that are usable numbers)
+    digits = labels.str.replace(r'\D', '', regex=True)
+    numeric = (digits.str.len() > 0) & (digits.str.len() <= MAX_MSISDN_DIGITS)
+    return digits, numeric
+
+
+def phone_keys(labels):
+    # Returns (int64 keys, mask of values that are usable numbers); keys of
+    # other values are 0. The key packs the digits and their count, so
+    # 0300123 and 300123 stay apart and phone_digits gives the digits back.
+    # Every mode keys numbers this way: in memory, out-of-core and streaming.
+    digits, numeric = normalize_phone_labels(labels)
+    numeric = numeric.to_numpy()
+    keys = np.zeros(len(labels), dtype=np.int64)
+    usable = digits[numeric]
+    keys[numeric] = (usable.astype(np.int64).to_numpy() << DIGIT_COUNT_BITS) | usable.str.len().to_numpy()
+    return keys, numeric
+
+
+def phone_digits(keys):
+    # Digit strings of non-negative phone keys, leading zeros included
+    keys = np.asarray(keys, dtype=np.int64)
+    values = (keys >> DIGIT_COUNT_BITS).astype(str)
+    widths = keys & ((1 << DIGIT_COUNT_BITS) - 1)
+    return np.array([value.zfill(width) for value, width in zip(values, widths)], dtype=object)
+
+
+def encode_phone_numbers(series, table=None):
+    # Returns (nullable Int64 array of keys, PhoneTable). Only the distinct
+    # values are normalized; rows are mapped through their factor codes.
+    # An existing table is extended so keys stay consistent across columns
+    # and appended batches.
+    codes, uniques = pd.factorize(series)
+    labels = pd.Series(np.asarray(uniques, dtype=object)).astype(str).str.strip()
+    unique_keys, numeric = phone_keys(labels)
+
+    # Non-numeric values get negative keys, reusing the ones already issued
+    known = {}
+    next_key = -1
+    if table is not None and len(table):
+        negative = table.keys < 0
+        known = dict(zip(table.labels[negative], table.keys[negative]))
+        next_key = min(int(table.keys[0]), 0) - 1
+    for i in np.flatnonzero(~numeric):
+        label = labels.iat[i]
+        if label not in known:
+            known[label] = next_key
+            next_key -= 1
+        unique_keys[i] = known[label]
+
+    # Spellings that normalize to the same number share a key; the first wins
+    all_keys = unique_keys if table is None else np.concatenate([table.keys, unique_keys])
+    all_labels = labels.to_numpy() if table is None else np.concatenate([table.labels, labels.to_numpy()])
+    first = ~pd.Series(all_keys).duplicated().to_numpy()
+    table = PhoneTable(all_keys[first], all_labels[first])
+
+    keys = pd.array(np.where(codes >= 0, unique_keys[np.maximum(codes, 0)], 0), dtype='Int64')
+    keys[codes < 0] = pd.NA
+    return keys, table
+
+
+def compact_frame(df, mapping, phone_table=None):
+    # Shrinks the mapped columns in place right after mapping:
+    # categoricals for locations and raw date/time text, int64 keys for
+    # A- and B-party numbers. Returns the PhoneTable shared by both number
+    # columns, extending phone_table when one is given.
+    for key in CATEGORICAL_KEYS:
+        column = mapping.get(key)
+        if column and column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+
+    for key in PHONE_KEYS:
+        column = mapping.get(key)
+        if column and column in df.columns:
+            df[column], phone_table = encode_phone_numbers(df[column], phone_table)
+    return phone_table
+
+
+def _missing_column(like, length):
+    # Stand-in for a column one of the frames does not have
+    if isinstance(like.dtype, pd.CategoricalDtype):
+        return pd.Series(pd.Categorical([None] * length, categories=like.cat.categories))
+    try:
+        return pd.Series(pd.array([None] * length, dtype=like.dtype))
+    except (TypeError, ValueError):
+        # Plain numpy integer columns cannot hold missing values
+        return pd.Series([None] * length, dtype=object)
+
+
+def concat_frames(frames):
+    # Row-wise concat that keeps categoricals dictionary encoded even when
+    # the frames saw different values
+    columns = list(dict.fromkeys(column for frame in frames for column in frame.columns))
+    result = {}
+    for column in columns:
+        like = next(frame[column] for frame in frames if column in frame.columns)
+        parts = [
+            frame[column].reset_index(drop=True) if column in frame.columns else _missing_column(like, len(frame))
+            for frame in frames
+        ]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            result[column] = pd.Series(union_categoricals(parts, ignore_order=True))
+        else:
+            result[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(result)
@@ -0,0 +1,208 @@
+import datetime
+import os
+from itertools import zip_longest
+
+import pandas as pd
+
+# Rust-based reader; much faster than openpyxl and also reads .xls/.xlsb/.ods
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Formats openpyxl can stream; the rest need calamine or a pandas engine
+OPENPYXL_EXTENSIONS = ['.xlsx', '.xlsm']
+
+# Rows converted to a frame at a time when streaming a sheet
+EXCEL_CHUNK_ROWS = 250_000
+
+
+def _header(row):
+    # Column names as pandas would give them: text, Unnamed: i for blanks,
+    # .1/.2 suffixes for repeats
+    names = []
+    seen = {}
+    for i, cell in enumerate(row):
+        text = _cell_text(cell)
+        name = f"Unnamed: {i}" if text is None else text.strip()
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _cell_text(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, float) and value.is_integer():
+        # Numbers typed into Excel come back as floats; 3001234567.0 is a phone number
+        return str(int(value))
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _convert_column(values):
+    # Cells of one column -> the same text values a CSV export would give,
+    # except whole date columns, which become datetime64 straight away
+    column = pd.Series(values, dtype=object)
+    # Empty cells come back as '' from calamine and None from openpyxl
+    column = column.where(column != '', None)
+    kind = pd.api.types.infer_dtype(column, skipna=True)
+    if kind in ('string', 'empty'):
+        return column
+    if kind in ('date', 'datetime'):
+        return pd.to_datetime(column, errors='coerce')
+    return column.map(_cell_text)
+
+
+def _frame(header, rows, positions):
+    # Short rows are padded so every column lines up with the header; only
+    # the columns at positions are converted
+    columns = list(zip_longest(*rows)) if rows else []
+    df = pd.DataFrame({
+        header[i]: _convert_column(columns[i] if i < len(columns) else (None,) * len(rows)) for i in positions
+    })
+
+    # Blank rows at the end of a sheet are formatting, not records
+    blank = df.isna().all(axis=1)
+    if blank.any():
+        df = df[~blank].reset_index(drop=True)
+    return df
+
+
+class _CalamineBook:
+    def __init__(self, file_path):
+        self.book = CalamineWorkbook.from_path(file_path)
+
+    def sheets(self):
+        # (name, row count including header, row iterator factory)
+        for name in self.book.sheet_names:
+            sheet = self.book.get_sheet_by_name(name)
+            yield name, sheet.height, sheet.iter_rows
+
+    def close(self):
+        self.book.close()
+
+
+class _OpenpyxlBook:
+    def __init__(self, file_path):
+        # Read-only mode streams rows from the XML instead of building a cell grid
+        self.book = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+
+    def sheets(self):
+        for sheet in self.book.worksheets:
+            # max_row comes from the sheet's dimension tag; some writers omit it
+            rows = sheet.max_row if sheet.max_row is not None else 1
+
+            def iter_rows(sheet=sheet):
+                return sheet.iter_rows(values_only=True)
+
+            yield sheet.title, rows, iter_rows
+
+    def close(self):
+        self.book.close()
+
+
+def _open_book(file_path):
+    if CalamineWorkbook is not None:
+        return _CalamineBook(file_path)
+    if openpyxl is not None and os.path.splitext(file_path)[1].lower() in OPENPYXL_EXTENSIONS:
+        return _OpenpyxlBook(file_path)
+    return None
+
+
+def iter_excel_chunks(file_path, chunksize=EXCEL_CHUNK_ROWS, progress=None, nrows=None, sheet_info=None,
+                      usecols=None):
+    # Streams the records of every sheet as text frames of at most
+    # chunksize rows. Operators split large exports across sheets with the
+    # same header; the largest sheet decides the header, and sheets with a
+    # different one (cover pages, summaries) are skipped. With nrows set,
+    # reading stops after that many records, e.g. for the mapping preview;
+    # with usecols only those columns are converted. sheet_info, if given,
+    # is filled with the sheets used and skipped.
+    book = _open_book(file_path)
+    if book is None:
+        # No streaming reader for this format: pandas with xlrd, odf or
+        # pyxlsb, whichever is installed
+        df = pd.read_excel(file_path, sheet_name=0, nrows=nrows, dtype=str, usecols=usecols)
+        if progress:
+            progress(1.0, len(df))
+        yield df
+        return
+
+    try:
+        sheets = list(book.sheets())
+        total = sum(rows for _, rows, _ in sheets) or 1
+        largest = max(sheets, key=lambda sheet: sheet[1], default=None)
+        if largest is None or not largest[1]:
+            return
+        header_row = next(iter(largest[2]()), None)
+        header = _header(header_row)
+        if usecols is None:
+            positions = range(len(header))
+        else:
+            missing = [col for col in usecols if col not in header]
+            if missing:
+                raise ValueError(f"Mapped columns not found in file: {', '.join(missing)}")
+            positions = [header.index(col) for col in usecols]
+        if nrows == 0:
+            yield _frame(header, [], positions)
+            return
+
+        done = 0
+        remaining = nrows
+        for name, rows, iter_rows in sheets:
+            row_iter = iter(iter_rows())
+            first = next(row_iter, None)
+            if first is None or _header(first) != header:
+                if sheet_info is not None and first is not None:
+                    sheet_info.setdefault('skipped', []).append(name)
+                done += rows
+                continue
+            if sheet_info is not None:
+                sheet_info.setdefault('used', []).append(name)
+
+            block = []
+            for row in row_iter:
+                block.append(row)
+                if len(block) < chunksize and (remaining is None or len(block) < remaining):
+                    continue
+                done += len(block)
+                if remaining is not None:
+                    remaining -= len(block)
+                if progress:
+                    progress(min(done / total, 1.0), done)
+                yield _frame(header, block, positions)
+                block = []
+                if remaining is not None and remaining <= 0:
+                    return
+            if block:
+                done += len(block)
+                if remaining is not None:
+                    remaining -= len(block)
+                if progress:
+                    progress(min(done / total, 1.0), done)
+                yield _frame(header, block, positions)
+    finally:
+        book.close()
+
+
+def read_excel_file(file_path, progress=None, nrows=None, sheet_info=None, usecols=None):
+    chunks = list(iter_excel_chunks(file_path, progress=progress, nrows=nrows, sheet_info=sheet_info,
+                                    usecols=usecols))
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,148 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from cdr_dtypes import phone_keys
+from cdr_ingest import SOURCE_COLUMN
+
+
+def _key_array(series):
+    # int64 phone keys and a mask of the rows that have one
+    keys = pd.array(series, dtype='Int64')
+    present = ~np.asarray(keys.isna())
+    return np.asarray(keys.fillna(0), dtype=np.int64), present
+
+
+def _source_keys(df):
+    # Without an A Party column each file is one suspect's CDR, named
+    # after their number (e.g. 03001234567.csv)
+    sources = df[SOURCE_COLUMN].astype('category')
+    stems = pd.Series([os.path.splitext(name)[0] for name in sources.cat.categories.astype(str)], dtype=object)
+    category_keys, numeric = phone_keys(stems)
+    if not numeric.any():
+        raise ValueError("A Party column not mapped and the file names are not phone numbers")
+
+    codes = sources.cat.codes.to_numpy()
+    present = codes >= 0
+    present[present] = numeric[codes[present]]
+    return category_keys[np.maximum(codes, 0)], present
+
+
+def caller_keys(df, mapping):
+    # A-party keys of each record: the mapped column, else the file name
+    column = mapping.get('a_party_col')
+    if column:
+        return _key_array(df[column])
+    if SOURCE_COLUMN in df.columns:
+        return _source_keys(df)
+    raise ValueError("A Party column not mapped")
+
+
+class ContactGraph:
+    # Undirected, weighted contact graph between phone numbers. Nodes are
+    # int64 phone keys; edges are stored once per direction in CSR form
+    # (indptr/indices/weights) so neighbour lookups are array slices.
+    def __init__(self, a_keys, b_keys):
+        a_keys = np.asarray(a_keys, dtype=np.int64)
+        b_keys = np.asarray(b_keys, dtype=np.int64)
+        keep = a_keys != b_keys
+        a_keys, b_keys = a_keys[keep], b_keys[keep]
+
+        # Dense node ids; factorize hashes instead of sorting every endpoint
+        codes, self.nodes = pd.factorize(np.concatenate([a_keys, b_keys]))
+        self.nodes = np.asarray(self.nodes, dtype=np.int64)
+        self._node_index = pd.Index(self.nodes)
+        n = len(self.nodes)
+        u, v = codes[:len(a_keys)], codes[len(a_keys):]
+
+        # Every call is an edge in both directions. Sorting the (src, dst)
+        # keys groups repeated calls into weighted edges and orders them by
+        # source in one pass, which is all CSR needs.
+        width = max(n, 1)
+        keys = np.sort(np.concatenate([u.astype(np.int64) * width + v, v.astype(np.int64) * width + u]))
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]])) if len(keys) else np.zeros(0, dtype=np.int64)
+        self.weights = np.diff(np.append(starts, len(keys)))
+        keys = keys[starts]
+
+        self.indices = keys % width
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(keys // width, minlength=n))])
+
+    @classmethod
+    def from_frame(cls, df, mapping):
+        a_keys, a_present = caller_keys(df, mapping)
+        b_keys, b_present = _key_array(df[mapping['phone_col']])
+        present = a_present & b_present
+        return cls(a_keys[present], b_keys[present])
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def n_edges(self):
+        return len(self.indices) // 2
+
+    def degree(self):
+        # Distinct contacts per node
+        return np.diff(self.indptr)
+
+    def strength(self):
+        # Calls per node
+        return np.add.reduceat(self.weights, self.indptr[:-1]) if len(self.weights) else np.zeros(len(self), np.int64)
+
+    def node_ids(self, keys):
+        # Node ids of phone keys; numbers absent from the graph raise
+        keys = np.asarray(keys, dtype=np.int64)
+        ids = self._node_index.get_indexer(keys)
+        if (ids < 0).any():
+            missing = ", ".join(str(key) for key in keys[ids < 0])
+            raise ValueError(f"Numbers not found in the selected date range: {missing}")
+        return ids
+
+    def _neighbours(self, ids):
+        # Concatenated neighbour lists of several nodes, with the edge weights
+        starts = self.indptr[ids]
+        lengths = self.indptr[ids + 1] - starts
+        offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        positions = offsets + np.arange(lengths.sum())
+        return self.indices[positions], self.weights[positions]
+
+    def common_contacts(self, keys, min_shared=None):
+        # Numbers in contact with at least min_shared of the given suspects
+        # (all of them by default). Returns (keys, suspects shared, calls
+        # with those suspects), most shared first.
+        ids = np.unique(self.node_ids(keys))
+        min_shared = len(ids) if min_shared is None else min_shared
+        neighbours, weights = self._neighbours(ids)
+
+        shared = np.bincount(neighbours, minlength=len(self))
+        calls = np.bincount(neighbours, weights=weights, minlength=len(self)).astype(np.int64)
+        shared[ids] = 0
+        found = np.flatnonzero(shared >= min_shared)
+        found = found[np.lexsort((-calls[found], -shared[found]))]
+        return self.nodes[found], shared[found], calls[found]
+
+    def ranking(self, top_n, by='strength'):
+        # Most connected numbers by calls ('strength') or distinct contacts ('degree')
+        values = self.strength() if by == 'strength' else self.degree()
+        top = np.argsort(-values, kind='stable')[:top_n]
+        return self.nodes[top], self.degree()[top], self.strength()[top]
+
+    def neighbourhood(self, keys, hops=1):
+        # Breadth-first expansion of whole frontiers at a time. Returns
+        # (keys, hop distance) for every number within `hops` of the seeds.
+        ids = np.unique(self.node_ids(keys))
+        distance = np.full(len(self), -1, dtype=np.int64)
+        distance[ids] = 0
+        frontier = ids
+        for hop in range(1, hops + 1):
+            if not len(frontier):
+                break
+            neighbours, _ = self._neighbours(frontier)
+            neighbours = np.unique(neighbours)
+            frontier = neighbours[distance[neighbours] < 0]
+            distance[frontier] = hop
+
+        found = np.flatnonzero(distance >= 0)
+        found = found[np.argsort(distance[found], kind='stable')]
+        return self.nodes[found], distance[found]
@@ -0,0 +1,289 @@
+import codecs
+import csv
+import glob
+import os
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from cdr_dtypes import concat_frames
+from cdr_excel import iter_excel_chunks, read_excel_file
+from cdr_profile import stage
+
+# Encodings tried, in order, when sniffing a CSV sample
+CANDIDATE_ENCODINGS = ['utf-8', 'latin-1', 'iso-8859-1', 'cp1252', 'utf-16']
+
+# Delimiters operators actually use in CDR exports
+CANDIDATE_DELIMITERS = ',;\t|'
+
+# Bytes read up front to detect encoding and delimiter
+SNIFF_BYTES = 64 * 1024
+
+# Rows parsed per chunk when streaming a CSV
+DEFAULT_CHUNKSIZE = 250_000
+
+# Rows read when only previewing a file
+PREVIEW_ROWS = 1000
+
+EXCEL_EXTENSIONS = ['.xlsx', '.xlsm', '.xls', '.xlsb', '.ods']
+
+# File types picked up when a whole case directory is loaded
+CDR_EXTENSIONS = EXCEL_EXTENSIONS + ['.csv', '.txt', '.tsv']
+
+# Column tagging each record with the file (suspect/operator) it came from.
+# Reserved so it never replaces an operator column that is also called Source.
+SOURCE_COLUMN = '__source__'
+
+CSVFormat = namedtuple('CSVFormat', ['encoding', 'delimiter'])
+
+
+def _detect_encoding(sample):
+    # Byte order marks are unambiguous
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith(codecs.BOM_UTF16_LE) or sample.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16'
+
+    # UTF-16 without a BOM shows up as lots of NUL bytes
+    if sample and sample.count(b'\x00') > len(sample) // 4:
+        return 'utf-16'
+
+    for encoding in CANDIDATE_ENCODINGS:
+        if encoding == 'utf-16':
+            continue
+        try:
+            # The sample may end in the middle of a multi-byte character
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+
+    return 'latin-1'
+
+
+def _detect_delimiter(text):
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return ','
+
+    # Drop the last line as the sample may have cut it short
+    if len(lines) > 1:
+        lines = lines[:-1]
+
+    try:
+        return csv.Sniffer().sniff('\n'.join(lines), delimiters=CANDIDATE_DELIMITERS).delimiter
+    except csv.Error:
+        # Fall back to whichever candidate is most common in the header
+        header = lines[0]
+        counts = {d: header.count(d) for d in CANDIDATE_DELIMITERS}
+        best = max(counts, key=counts.get)
+        return best if counts[best] else ','
+
+
+def sniff_csv(file_path, sample_bytes=SNIFF_BYTES):
+    # Detect encoding and delimiter once from a small sample of the file
+    with stage('sniff', file=os.path.basename(file_path)) as record:
+        with open(file_path, 'rb') as f:
+            sample = f.read(sample_bytes)
+
+        encoding = _detect_encoding(sample)
+        text = codecs.getincrementaldecoder(encoding)(errors='replace').decode(sample, final=False)
+        record.update(encoding=encoding, delimiter=_detect_delimiter(text))
+        return CSVFormat(record['encoding'], record['delimiter'])
+
+
+def _check_usecols(file_path, csv_format, usecols):
+    # Fail with the mapping dialog's wording rather than the parser's. Only
+    # the header line is parsed, with the format already sniffed; the Excel
+    # reader checks its header itself.
+    columns = pd.read_csv(file_path, sep=csv_format.delimiter, encoding=csv_format.encoding,
+                          encoding_errors='replace', dtype=str, nrows=0).columns
+    missing = [col for col in usecols if col not in columns]
+    if missing:
+        raise ValueError(f"Mapped columns not found in file: {', '.join(missing)}")
+
+
+def iter_csv_chunks(file_path, csv_format=None, chunksize=DEFAULT_CHUNKSIZE, progress=None,
+                    usecols=None, dtype=str):
+    # Yields DataFrame chunks of at most chunksize rows
+    if csv_format is None:
+        csv_format = sniff_csv(file_path)
+    if usecols is not None:
+        _check_usecols(file_path, csv_format, usecols)
+
+    total_bytes = os.path.getsize(file_path) or 1
+    rows = 0
+
+    with open(file_path, 'rb') as f:
+        # Everything is read as text by default so chunks agree on dtypes
+        # and leading zeros in phone numbers survive
+        reader = pd.read_csv(
+            f,
+            sep=csv_format.delimiter,
+            encoding=csv_format.encoding,
+            encoding_errors='replace',
+            engine='c',
+            dtype=dtype,
+            usecols=usecols,
+            chunksize=chunksize,
+            low_memory=False,
+        )
+        with reader:
+            for chunk in reader:
+                rows += len(chunk)
+                if progress:
+                    progress(min(f.tell() / total_bytes, 1.0), rows)
+                yield chunk
+
+
+def read_csv_chunked(file_path, csv_format=None, chunksize=DEFAULT_CHUNKSIZE, progress=None,
+                     usecols=None, dtype=str):
+    chunks = list(iter_csv_chunks(file_path, csv_format, chunksize, progress, usecols, dtype))
+
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        return chunks[0]
+    # Chunks parsed as categoricals each saw their own set of values
+    return concat_frames(chunks)
+
+
+def _csv_dtype(dtypes):
+    # Columns without an explicit dtype are still read as text
+    return defaultdict(lambda: str, dtypes) if dtypes else str
+
+
+def _apply_dtypes(df, dtypes):
+    # Excel cells arrive already converted; only text columns are encoded
+    for column, dtype in (dtypes or {}).items():
+        if dtype == 'category' and column in df.columns and df[column].dtype == object:
+            df[column] = df[column].astype('category')
+    return df
+
+
+def iter_cdr_chunks(file_path, progress=None, chunksize=DEFAULT_CHUNKSIZE, usecols=None, dtypes=None):
+    # Streams any CDR file, all sheets of a workbook included. With usecols
+    # only those columns are parsed at all; dtypes maps columns to parser
+    # dtypes (see cdr_dtypes.read_dtypes), everything else is text.
+    if os.path.splitext(file_path)[1].lower() in EXCEL_EXTENSIONS:
+        for chunk in iter_excel_chunks(file_path, chunksize=chunksize, progress=progress, usecols=usecols):
+            yield _apply_dtypes(chunk, dtypes)
+    else:
+        yield from iter_csv_chunks(file_path, chunksize=chunksize, progress=progress, usecols=usecols,
+                                   dtype=_csv_dtype(dtypes))
+
+
+def read_cdr_file(file_path, progress=None, chunksize=DEFAULT_CHUNKSIZE, usecols=None, dtypes=None):
+    with stage('load', file=os.path.basename(file_path), columns=len(usecols) if usecols else None) as record:
+        df = _read_cdr_file(file_path, progress, chunksize, usecols, dtypes)
+        record['rows'] = len(df)
+        return df
+
+
+def _read_cdr_file(file_path, progress, chunksize, usecols, dtypes):
+    # Determine file type and load accordingly
+    file_ext = os.path.splitext(file_path)[1].lower()
+
+    if file_ext in EXCEL_EXTENSIONS:
+        return _apply_dtypes(read_excel_file(file_path, progress=progress, usecols=usecols), dtypes)
+
+    # CSV, and anything else treated as delimited text
+    return read_csv_chunked(file_path, chunksize=chunksize, progress=progress, usecols=usecols,
+                            dtype=_csv_dtype(dtypes))
+
+
+def read_preview(file_path, nrows=PREVIEW_ROWS):
+    # Header and first rows only, for mapping a file without loading it
+    if os.path.splitext(file_path)[1].lower() in EXCEL_EXTENSIONS:
+        return read_excel_file(file_path, nrows=nrows)
+
+    csv_format = sniff_csv(file_path)
+    return pd.read_csv(
+        file_path,
+        sep=csv_format.delimiter,
+        encoding=csv_format.encoding,
+        encoding_errors='replace',
+        dtype=str,
+        nrows=nrows,
+    )
+
+
+def expand_sources(location):
+    # A directory, a glob pattern or a single file, resolved to sorted file paths
+    if os.path.isdir(location):
+        paths = [
+            os.path.join(location, name) for name in os.listdir(location)
+            if os.path.splitext(name)[1].lower() in CDR_EXTENSIONS
+        ]
+    elif any(ch in location for ch in '*?['):
+        paths = glob.glob(location)
+    else:
+        paths = [location] if os.path.exists(location) else []
+    return sorted(p for p in paths if os.path.isfile(p))
+
+
+def source_id(file_path):
+    # The file name with its extension, so a.csv and a.xlsx in one case
+    # folder stay apart
+    return os.path.basename(file_path)
+
+
+def _load_source(file_path, chunksize, usecols, dtypes):
+    # Runs in a worker process, so it must stay a module-level function
+    return read_cdr_file(file_path, chunksize=chunksize, usecols=usecols, dtypes=dtypes)
+
+
+def load_many(paths, max_workers=None, progress=None, chunksize=DEFAULT_CHUNKSIZE, usecols=None, dtypes=None):
+    # Load every file on its own core and stack them into one frame.
+    # Returns (df, errors) where errors maps a failed path to its message;
+    # one unreadable file never aborts the rest of the batch.
+    paths = list(paths)
+    with stage('load_many', files=len(paths)) as record:
+        df, errors = _load_many(paths, max_workers, progress, chunksize, usecols, dtypes)
+        record.update(rows=len(df), failed_files=len(errors))
+        return df, errors
+
+
+def _load_many(paths, max_workers, progress, chunksize, usecols, dtypes):
+    frames = {}
+    errors = {}
+
+    if not paths:
+        return pd.DataFrame(), errors
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(paths))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_load_source, path, chunksize, usecols, dtypes): path for path in paths}
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                path = futures[future]
+                error = None
+                try:
+                    frames[path] = future.result()
+                except Exception as e:
+                    error = str(e)
+                    errors[path] = error
+                if progress:
+                    progress(done, len(paths), path, error)
+        except BaseException:
+            # A progress callback may abort the batch (e.g. a cancelled
+            # job); files not started yet are dropped rather than loaded
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    # Keep the input order so the result does not depend on scheduling
+    tagged = []
+    for path in paths:
+        df = frames.get(path)
+        if df is None or df.empty:
+            continue
+        df[SOURCE_COLUMN] = source_id(path)
+        tagged.append(df)
+
+    if not tagged:
+        return pd.DataFrame(), errors
+
+    df = concat_frames(tagged)
+    df[SOURCE_COLUMN] = df[SOURCE_COLUMN].astype('category')
+    return df, errors
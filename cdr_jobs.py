@@ -0,0 +1,199 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Worker threads shared by every job; loads and analyses mostly wait on
+# pandas/numpy, which release the GIL
+DEFAULT_WORKERS = 4
+
+
+class JobCancelled(BaseException):
+    # Raised inside a job once it has been cancelled. A BaseException, like
+    # KeyboardInterrupt, so the pipeline's own `except Exception` handlers
+    # do not swallow it.
+    pass
+
+
+class Job:
+    # Handle a running job gets as its first argument. The job calls
+    # check() between chunks or stages and report() for progress; both
+    # are cheap enough to call per chunk.
+    def __init__(self, scheduler, group, exclusive, func, args, on_done, on_error, on_cancel, on_progress):
+        self.scheduler = scheduler
+        self.group = group
+        self.exclusive = exclusive
+        self.func = func
+        self.args = args
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self.on_progress = on_progress
+        self.superseded = False
+        self._cancelled = threading.Event()
+        self._progress_lock = threading.Lock()
+        self._progress = None
+        self._progress_posted = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise JobCancelled(self.group)
+
+    def report(self, *args):
+        # Progress is coalesced: however often a job reports, at most one
+        # update is queued on the UI loop, and it shows the latest values
+        self.check()
+        if self.on_progress is None:
+            return
+        with self._progress_lock:
+            self._progress = args
+            if self._progress_posted:
+                return
+            self._progress_posted = True
+        self.scheduler.post(self._flush_progress)
+
+    def _flush_progress(self):
+        with self._progress_lock:
+            args, self._progress_posted = self._progress, False
+        if not self.cancelled:
+            self.on_progress(*args)
+
+
+class _ReadWriteLock:
+    # Exclusive jobs (those replacing or changing the dataset) wait for the
+    # running ones and block new ones; the rest run side by side
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire(self, exclusive, job):
+        with self._cond:
+            if exclusive:
+                self._writers_waiting += 1
+                try:
+                    while self._writer or self._readers:
+                        self._wait(job)
+                finally:
+                    self._writers_waiting -= 1
+                self._writer = True
+            else:
+                while self._writer or self._writers_waiting:
+                    self._wait(job)
+                self._readers += 1
+
+    def _wait(self, job):
+        # Woken up periodically so a cancelled job stops waiting
+        self._cond.wait(0.2)
+        job.check()
+
+    def release(self, exclusive):
+        with self._cond:
+            if exclusive:
+                self._writer = False
+            else:
+                self._readers -= 1
+            self._cond.notify_all()
+
+
+class JobScheduler:
+    # Runs background jobs on a worker pool and delivers their outcome on
+    # the UI thread. Jobs of the same group (e.g. 'load', 'analysis') run
+    # one after another in submission order; exclusive jobs additionally
+    # never overlap any other job. post(callback) must run callback on the
+    # UI thread, e.g. lambda callback: root.after(0, callback).
+    def __init__(self, post, max_workers=DEFAULT_WORKERS):
+        self.post = post
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='cdr-job')
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._running = {}
+        self._access = _ReadWriteLock()
+
+    def submit(self, group, func, *args, on_done=None, on_error=None, on_cancel=None, on_progress=None,
+               exclusive=False, supersede=False):
+        # Queues func(job, *args). on_done(result), on_error(exception) and
+        # on_cancel() run on the UI thread. With supersede the group's
+        # queued and running jobs are cancelled first and whatever they
+        # still produce is dropped, so a stale result never overwrites a
+        # newer one. Returns the Job.
+        job = Job(self, group, exclusive, func, args, on_done, on_error, on_cancel, on_progress)
+        with self._lock:
+            if supersede:
+                self._cancel_group(group, superseded=True)
+            self._queues.setdefault(group, deque()).append(job)
+            if group not in self._running:
+                self._start_next(group)
+        return job
+
+    def _start_next(self, group):
+        # Called with self._lock held
+        queue = self._queues.get(group)
+        if not queue:
+            self._running.pop(group, None)
+            return
+        job = queue.popleft()
+        self._running[group] = job
+        self._pool.submit(self._run, job)
+
+    def _run(self, job):
+        outcome = None
+        try:
+            job.check()
+            self._access.acquire(job.exclusive, job)
+            try:
+                result = job.func(job, *job.args)
+            finally:
+                self._access.release(job.exclusive)
+            if job.on_done:
+                outcome = lambda: job.on_done(result)
+        except JobCancelled:
+            outcome = job.on_cancel
+        except Exception as e:
+            if job.on_error:
+                outcome = lambda error=e: job.on_error(error)
+        finally:
+            with self._lock:
+                self._start_next(job.group)
+
+        if outcome is not None:
+            self.post(lambda: self._deliver(job, outcome))
+
+    def _deliver(self, job, outcome):
+        # Checked again on the UI thread: the job may have been superseded
+        # while its result was waiting in the event queue. A job cancelled
+        # after it finished still delivers; its work is done.
+        if not job.superseded:
+            outcome()
+
+    def _cancel_group(self, group, superseded=False):
+        # Called with self._lock held
+        jobs = list(self._queues.pop(group, ()))
+        if group in self._running:
+            jobs.append(self._running[group])
+        for job in jobs:
+            job.superseded = job.superseded or superseded
+            job.cancel()
+
+    def cancel(self, group=None):
+        # Cancels the given group, or every job when group is None
+        with self._lock:
+            for name in ([group] if group else list(set(self._queues) | set(self._running))):
+                self._cancel_group(name)
+
+    def busy(self, group=None):
+        with self._lock:
+            if group:
+                return group in self._running
+            return bool(self._running)
+
+    def shutdown(self):
+        self.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
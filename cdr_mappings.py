@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import re
+import time
+
+import cdr_core
+
+# Saved column mappings, one JSON file per operator export format
+DEFAULT_PROFILE_DIR = os.environ.get(
+    'CDR_ANALYSER_PROFILES', os.path.join(os.path.expanduser('~'), '.cdr_analyser', 'profiles'))
+
+
+def header_signature(columns):
+    # Identifies an export format by its header, ignoring case and padding
+    digest = hashlib.blake2b(digest_size=12)
+    for column in columns:
+        digest.update(str(column).strip().lower().encode('utf-8', 'replace') + b'\x1f')
+    return digest.hexdigest()
+
+
+def profile_columns(profile):
+    # Columns a load with this profile parses: the mapped fields plus any
+    # unmapped columns the investigator asked to keep
+    return cdr_core.mapped_columns(profile['mapping'], profile.get('extra_columns', ()))
+
+
+class MappingProfiles:
+    # Column mappings saved per operator format. A profile records the
+    # mapping, the header it was made for and the unmapped columns to load
+    # as well, so the next export in the same format is read with only
+    # those columns and without going through the mapping dialog by hand.
+    def __init__(self, profile_dir=DEFAULT_PROFILE_DIR):
+        self.profile_dir = profile_dir
+
+    def _path(self, name):
+        # Profile names become file names; anything unsafe is replaced
+        return os.path.join(self.profile_dir, re.sub(r'[^\w.-]+', '_', name.strip()) + '.json')
+
+    def _read(self, path):
+        with open(path, encoding='utf-8') as f:
+            profile = json.load(f)
+        if not isinstance(profile.get('name'), str):
+            raise ValueError(f"Mapping profile has no name: {os.path.basename(path)}")
+        profile['mapping'] = cdr_core.normalize_mapping(profile.get('mapping', {}))
+        profile['extra_columns'] = list(profile.get('extra_columns', []))
+        return profile
+
+    def profiles(self):
+        # Every readable profile, sorted by name; broken files are skipped
+        if not os.path.isdir(self.profile_dir):
+            return []
+        profiles = []
+        for name in sorted(os.listdir(self.profile_dir)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                profiles.append(self._read(os.path.join(self.profile_dir, name)))
+            except (OSError, ValueError, AttributeError):
+                continue
+        return sorted(profiles, key=lambda profile: profile['name'].lower())
+
+    def names(self):
+        return [profile['name'] for profile in self.profiles()]
+
+    def load(self, name):
+        path = self._path(name)
+        if not os.path.exists(path):
+            raise ValueError(f"Unknown mapping profile: {name}")
+        return self._read(path)
+
+    def save(self, name, mapping, columns, extra_columns=()):
+        if not name.strip():
+            raise ValueError("Profile name is empty")
+        mapping = cdr_core.normalize_mapping(mapping)
+        cdr_core.validate_mapping(mapping, columns)
+        missing = [col for col in extra_columns if col not in columns]
+        if missing:
+            raise ValueError(f"Columns not found in file: {', '.join(missing)}")
+
+        profile = {
+            'name': name.strip(),
+            'mapping': mapping,
+            'extra_columns': [col for col in extra_columns if col not in mapping.values()],
+            'header': [str(col) for col in columns],
+            'signature': header_signature(columns),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = self._path(name)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(profile, f, indent=2)
+        os.replace(path + '.tmp', path)
+        return profile
+
+    def match(self, columns):
+        # The profile for a file with this header: one saved for exactly
+        # this header, else the one using the most of its columns. Returns
+        # None when no profile fits.
+        signature = header_signature(columns)
+        columns = set(columns)
+        best, best_size = None, 0
+        for profile in self.profiles():
+            if profile.get('signature') == signature:
+                return profile
+            needed = profile_columns(profile)
+            if all(col in columns for col in needed) and len(needed) > best_size:
+                best, best_size = profile, len(needed)
+        return best
@@ -0,0 +1,213 @@
+import numpy as np
+import pandas as pd
+import matplotlib
+from matplotlib import dates as mdates
+from matplotlib.figure import Figure
+
+from cdr_temporal import HOUR_LABELS
+
+# Points per pixel column kept when a series is wider than the plot;
+# min and max of each column are enough to draw the same line
+POINTS_PER_PIXEL = 2
+
+# Above this many points a line is drawn without per-point markers
+MAX_MARKERS = 100
+
+# Bars drawn for ranked results; longer results show their head
+MAX_BARS = 50
+
+# Bar labels are cut to this many characters
+MAX_LABEL_CHARS = 28
+
+BAR_COLORMAP = 'viridis'
+
+HEATMAP_COLORMAP = 'YlOrRd'
+
+# Value and label column of each bar chart; a pair of label columns is
+# shown joined
+BAR_COLUMNS = {
+    'location': ('Count', 'Location'),
+    'numbers': ('Count', 'Phone Number'),
+    'common': ('Calls', 'Phone Number'),
+    'network': ('Calls', 'Phone Number'),
+    'bursts': ('Calls', 'Start'),
+    'copresence': ('Numbers Present', 'Start'),
+    'meetings': ('Meetings', ('Number A', 'Number B')),
+    'talk_numbers': ('Total Talk (s)', 'Phone Number'),
+    'talk_locations': ('Total Talk (s)', 'Location'),
+    'longest': ('Duration (s)', 'DateTime'),
+}
+
+# Value column of each per-date line chart
+SERIES_COLUMNS = {
+    'date': 'Call Count',
+    'talk_dates': 'Total Talk (s)',
+}
+
+# Row label column of each hour-of-day heatmap; the value columns are the
+# 24 hour columns
+HEATMAP_COLUMNS = {
+    'heatmap': 'Day',
+    'hours': 'Phone Number',
+}
+
+
+def minmax_downsample(y, buckets):
+    # Positions of the points to draw for y on `buckets` pixel columns:
+    # the first and last point and, per column, its minimum and maximum,
+    # in their original order. Peaks and dips survive, unlike striding.
+    n = len(y)
+    if n <= buckets * POINTS_PER_PIXEL:
+        return np.arange(n)
+
+    # Equal-sized columns as rows of a matrix; the last one is padded
+    size = -(-n // buckets)
+    rows = -(-n // size)
+    padded = np.full(rows * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(rows, size)
+    offsets = np.arange(rows) * size
+    extremes = np.concatenate([offsets + np.nanargmin(padded, axis=1), offsets + np.nanargmax(padded, axis=1)])
+    return np.unique(np.concatenate([[0], extremes, [n - 1]]))
+
+
+def _label(value):
+    text = str(value)
+    return text if len(text) <= MAX_LABEL_CHARS else text[:MAX_LABEL_CHARS - 1] + '…'
+
+
+class ChartRenderer:
+    # Draws analysis results into one long-lived Figure. The axes and,
+    # where the chart kind stays the same, the line or bars are updated in
+    # place instead of building a new figure per analysis. Results are
+    # already aggregated, so matplotlib is used directly rather than
+    # through seaborn's statistics layer.
+    def __init__(self, figsize=(10, 6), dpi=100):
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.ax = self.figure.add_subplot()
+        self._kind = None
+        self._empty = None
+        self._line = None
+        self._bars = None
+        self._image = None
+
+    def width_pixels(self):
+        # Width of the plotting area on screen
+        return max(int(self.ax.get_position().width * self.figure.get_figwidth() * self.figure.dpi), 1)
+
+    def render(self, results):
+        if results["data"].empty:
+            self._render_empty()
+        elif results["type"] in SERIES_COLUMNS:
+            self._render_series(results["data"], SERIES_COLUMNS[results["type"]])
+        elif results["type"] in HEATMAP_COLUMNS:
+            data = results["data"].head(MAX_BARS)
+            self._render_heatmap(data[HEATMAP_COLUMNS[results["type"]]], data[HOUR_LABELS].to_numpy())
+        else:
+            value_col, label_col = BAR_COLUMNS[results["type"]]
+            data = results["data"].head(MAX_BARS)
+            if isinstance(label_col, tuple):
+                labels = data[list(label_col)].astype(str).agg(' & '.join, axis=1)
+                label_col = ' & '.join(label_col)
+            else:
+                labels = data[label_col]
+            self._render_bars(labels, data[value_col], value_col, label_col)
+        self.ax.set_title(results["title"], fontsize=14, fontweight='bold')
+        return self.figure
+
+    def _reset(self, kind):
+        # Switching between line and bar charts starts from clean axes
+        if self._kind == kind:
+            return
+        if self._image is not None:
+            self._image.colorbar.remove()
+        self.ax.clear()
+        self._line = self._bars = self._image = self._empty = None
+        self._kind = kind
+
+    def _render_empty(self):
+        # Nothing to plot, e.g. no bursts in the range: blank axes with a
+        # note instead of bars on singular limits
+        self._reset('empty')
+        if self._empty is None:
+            self.ax.set_axis_off()
+            self._empty = self.ax.text(0.5, 0.5, 'No data', ha='center', va='center', fontsize=14, color='gray',
+                                       transform=self.ax.transAxes)
+
+    def _render_series(self, data, value_column):
+        self._reset('series')
+        x = mdates.date2num(pd.to_datetime(data['Date']).to_numpy())
+        y = data[value_column].to_numpy(dtype=float)
+        keep = minmax_downsample(y, self.width_pixels())
+        x, y = x[keep], y[keep]
+        marker = 'o' if len(x) <= MAX_MARKERS else ''
+
+        if self._line is None:
+            (self._line,) = self.ax.plot(x, y, marker=marker, markersize=4, linewidth=1.5)
+            locator = mdates.AutoDateLocator()
+            self.ax.xaxis.set_major_locator(locator)
+            self.ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+            self.ax.set_xlabel('Date')
+            self.ax.grid(True, alpha=0.3)
+        else:
+            self._line.set_data(x, y)
+            self._line.set_marker(marker)
+        self.ax.set_ylabel(value_column)
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.figure.subplots_adjust(left=0.08, right=0.97, top=0.92, bottom=0.12)
+
+    def _render_bars(self, labels, values, value_label, label_label):
+        self._reset('bars')
+        labels = [_label(value) for value in labels]
+        values = np.asarray(values, dtype=float)
+        positions = np.arange(len(values))
+        colors = matplotlib.colormaps[BAR_COLORMAP](np.linspace(0, 1, max(len(values), 1)))
+
+        if self._bars is not None and len(self._bars) == len(values):
+            # Same number of bars: only their lengths change
+            for bar, value in zip(self._bars, values):
+                bar.set_width(value)
+        else:
+            if self._bars is not None:
+                self._bars.remove()
+            self._bars = self.ax.barh(positions, values, color=colors, height=0.8)
+            self.ax.set_yticks(positions)
+            self.ax.set_ylim(len(values) - 0.5, -0.5)
+            self.ax.grid(True, axis='x', alpha=0.3)
+        self.ax.set_yticklabels(labels)
+        self.ax.set_xlabel(value_label)
+        self.ax.set_ylabel(label_label)
+        self.ax.set_xlim(0, (values.max() if len(values) else 1) * 1.05)
+
+        # A fixed margin sized to the longest label instead of tight_layout,
+        # which measures every text artist on each draw
+        longest = max((len(label) for label in labels), default=0)
+        left = min(0.45, 0.06 + longest * 7 / (self.figure.get_figwidth() * self.figure.dpi))
+        self.figure.subplots_adjust(left=left, right=0.97, top=0.92, bottom=0.1)
+
+    def _render_heatmap(self, labels, matrix):
+        self._reset('heatmap')
+        labels = [_label(value) for value in labels]
+        limit = max(int(matrix.max()) if matrix.size else 0, 1)
+
+        if self._image is not None and self._image.get_array().shape == matrix.shape:
+            # Same grid: only the cell values and the colour scale change
+            self._image.set_data(matrix)
+            self._image.set_clim(0, limit)
+        else:
+            if self._image is not None:
+                self._image.colorbar.remove()
+                self._image.remove()
+            self._image = self.ax.imshow(matrix, aspect='auto', cmap=HEATMAP_COLORMAP, vmin=0, vmax=limit,
+                                         interpolation='nearest')
+            self.figure.colorbar(self._image, ax=self.ax, label='Calls')
+            self.ax.set_xticks(np.arange(24))
+            self.ax.set_xticklabels(HOUR_LABELS, fontsize=8)
+            self.ax.set_xlabel('Hour of Day')
+            self.ax.set_yticks(np.arange(len(labels)))
+        self.ax.set_yticklabels(labels)
+
+        longest = max((len(label) for label in labels), default=0)
+        left = min(0.45, 0.06 + longest * 7 / (self.figure.get_figwidth() * self.figure.dpi))
+        self.figure.subplots_adjust(left=left, right=0.97, top=0.92, bottom=0.1)
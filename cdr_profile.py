@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Structured stage log, one JSON object per line
+DEFAULT_LOG_PATH = os.environ.get(
+    'CDR_ANALYSER_LOG', os.path.join(os.path.expanduser('~'), '.cdr_analyser', 'logs', 'stages.jsonl')
+)
+
+# Size the stage log may reach before it is rotated to stages.jsonl.1,
+# replacing the previous rotation
+DEFAULT_LOG_MAX_BYTES = int(os.environ.get('CDR_ANALYSER_LOG_MAX_BYTES', 10 * 1024 ** 2))
+
+# Reports from opt-in cProfile / pyinstrument captures
+DEFAULT_PROFILE_DIR = os.path.join(os.path.dirname(DEFAULT_LOG_PATH), 'profiles')
+
+
+def _rss():
+    # Resident set size in bytes, or None where it cannot be read cheaply
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def format_record(record):
+    # One-line summary for the status bar and the command line
+    text = f"{record['stage']}: {record['seconds']:.2f} s"
+    if record.get('rows') is not None:
+        text += f", {record['rows']:,} rows"
+        if record.get('rows_per_sec'):
+            text += f" ({record['rows_per_sec']:,.0f} rows/s)"
+    if record.get('memory_delta') is not None:
+        text += f", {record['memory_delta'] / 2 ** 20:+.0f} MB"
+    if record.get('error'):
+        text += " (failed)"
+    return text
+
+
+class Profiler:
+    # Times named pipeline stages. Each finished stage becomes a record with
+    # wall time, rows, rows/s and the change in resident memory; records are
+    # appended to a JSON-lines log and passed to listeners, e.g. the status bar.
+    # Nothing is kept in memory, so long-running processes do not grow.
+    def __init__(self, log_path=DEFAULT_LOG_PATH, max_log_bytes=DEFAULT_LOG_MAX_BYTES):
+        self.log_path = log_path
+        self.max_log_bytes = max_log_bytes
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def add_listener(self, listener):
+        # listener(event, record) with event 'start' or 'end'; may be called
+        # from worker threads
+        self.listeners.append(listener)
+
+    def _notify(self, event, record):
+        for listener in self.listeners:
+            try:
+                listener(event, record)
+            except Exception:
+                # Reporting must never break the stage it reports on
+                pass
+
+    def _write(self, record):
+        if not self.log_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.log_path) or '.', exist_ok=True)
+            with self._lock:
+                if (self.max_log_bytes and os.path.exists(self.log_path)
+                        and os.path.getsize(self.log_path) >= self.max_log_bytes):
+                    os.replace(self.log_path, self.log_path + '.1')
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, default=str) + '\n')
+        except OSError:
+            pass
+
+    @contextmanager
+    def stage(self, name, rows=None, **fields):
+        # The yielded record can be updated inside the block, typically to
+        # set 'rows' once they are known
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        record = {'stage': name, 'rows': rows, **fields}
+        if stack:
+            record['parent'] = stack[-1]['stage']
+        stack.append(record)
+        self._notify('start', record)
+
+        rss_before = _rss()
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record['error'] = str(e)
+            raise
+        finally:
+            stack.pop()
+            seconds = time.perf_counter() - start
+            rss_after = _rss()
+            record['seconds'] = round(seconds, 4)
+            if record.get('rows') is not None and seconds > 0:
+                record['rows_per_sec'] = round(record['rows'] / seconds, 1)
+            if rss_before is not None and rss_after is not None:
+                record['memory_delta'] = rss_after - rss_before
+                record['rss'] = rss_after
+            record['time'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+            record['thread'] = threading.current_thread().name
+
+            self._write(record)
+            self._notify('end', record)
+
+    @contextmanager
+    def capture(self, label, profile_dir=DEFAULT_PROFILE_DIR, engine='cprofile'):
+        # Profiles the calling thread for the duration of the block. cProfile
+        # writes a .prof file for pstats/snakeviz; pyinstrument, when
+        # installed, writes an HTML call tree. Yields the report path.
+        os.makedirs(profile_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+
+        if engine == 'pyinstrument':
+            from pyinstrument import Profiler as Sampler
+            path = os.path.join(profile_dir, f"{label}-{stamp}.html")
+            sampler = Sampler()
+            sampler.start()
+            try:
+                yield path
+            finally:
+                sampler.stop()
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(sampler.output_html())
+            return
+
+        import cProfile
+        path = os.path.join(profile_dir, f"{label}-{stamp}.prof")
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield path
+        finally:
+            profile.disable()
+            profile.dump_stats(path)
+
+
+# Shared by the pipeline modules, the GUI and the command line
+PROFILER = Profiler()
+
+
+def stage(name, rows=None, **fields):
+    return PROFILER.stage(name, rows, **fields)
@@ -0,0 +1,336 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pandas as pd
+
+import cdr_core
+from cdr_cli import load_dataset
+from cdr_defaults import SERVER_TYPES
+from cdr_profile import PROFILER, format_record, stage
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Requests answered at once; further ones queue for a free thread
+DEFAULT_WORKERS = 4
+
+# Datasets kept loaded; opening one more drops the least recently used
+DEFAULT_MAX_DATASETS = 4
+
+# Analysis responses kept per server, keyed by dataset and parameters
+DEFAULT_RESULT_CACHE_SIZE = 256
+
+# Largest request body accepted, in bytes
+MAX_REQUEST_BYTES = 1 << 20
+
+
+def dataset_id(paths, mapping):
+    # Files are identified by path, size and modification time, so a warm
+    # dataset is found without reading them; a changed file gets a new id
+    files = []
+    for path in sorted(paths):
+        info = os.stat(path)
+        files.append([path, info.st_size, info.st_mtime_ns])
+    text = json.dumps([files, mapping], sort_keys=True)
+    return hashlib.blake2b(text.encode(), digest_size=10).hexdigest()
+
+
+def frame_json(data):
+    # {"columns": [...], "data": [[...], ...]} with dates as ISO strings
+    return json.loads(data.to_json(orient='split', index=False, date_format='iso'))
+
+
+def _timestamp(value):
+    # Request bounds as one canonical form, so equal windows share a cache entry
+    return None if value in (None, '') else pd.Timestamp(value).isoformat()
+
+
+class UnknownDataset(LookupError):
+    # A dataset id the server has not loaded, or has evicted since
+    pass
+
+
+class AnalysisService:
+    # Datasets kept loaded, with their sorted index and daily aggregates,
+    # for every client of one server process. Each dataset is loaded once,
+    # however many clients open it at the same time, and the least recently
+    # used one is dropped beyond max_datasets. Only files under data_root
+    # can be opened. Analysis responses are cached until evicted, since a
+    # loaded dataset never changes.
+    def __init__(self, data_root, max_datasets=DEFAULT_MAX_DATASETS, result_cache_size=DEFAULT_RESULT_CACHE_SIZE):
+        if max_datasets < 1:
+            raise ValueError("The server must keep at least one dataset")
+        self.data_root = os.path.realpath(data_root)
+        self.max_datasets = max_datasets
+        self.result_cache_size = result_cache_size
+        self._datasets = OrderedDict()
+        self._loading = {}
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _resolve(self, path):
+        # Absolute path of a file under the data root; relative paths are
+        # taken from the root
+        if not isinstance(path, str):
+            raise ValueError("CDR file paths must be strings")
+        resolved = os.path.realpath(os.path.join(self.data_root, path))
+        if os.path.commonpath([resolved, self.data_root]) != self.data_root:
+            raise PermissionError(f"{path} is outside the server's data root")
+        return resolved
+
+    def open(self, paths, mapping):
+        if not paths or not isinstance(paths, list):
+            raise ValueError("No CDR files given")
+        paths = sorted(self._resolve(path) for path in paths)
+        mapping = cdr_core.normalize_mapping(mapping)
+        cdr_core.validate_mapping(mapping)
+        key = dataset_id(paths, mapping)
+
+        with self._lock:
+            entry = self._datasets.get(key)
+            load_lock = self._loading.setdefault(key, threading.Lock()) if entry is None else None
+        if entry is None:
+            # Other requests for the same files wait for this load
+            with load_lock:
+                entry = self._datasets.get(key)
+                if entry is None:
+                    try:
+                        with stage('server_load', files=len(paths)):
+                            dataset = load_dataset(paths, mapping, use_cache=True)
+                            dataset.build_cube()
+                        entry = {'dataset': dataset, 'paths': paths}
+                        with self._lock:
+                            self._datasets[key] = entry
+                            self._evict()
+                    finally:
+                        # A failed load must not leave its lock behind; a
+                        # request that came in meanwhile may own a newer one
+                        with self._lock:
+                            if self._loading.get(key) is load_lock:
+                                del self._loading[key]
+        return self.info(key)
+
+    def _evict(self):
+        # Drops the least recently used datasets and their cached responses;
+        # requests already running on one keep their reference until done
+        while len(self._datasets) > self.max_datasets:
+            evicted, _ = self._datasets.popitem(last=False)
+            for request in [request for request in self._results if request[0] == evicted]:
+                del self._results[request]
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._datasets.get(key)
+            if entry is None:
+                raise UnknownDataset(key)
+            self._datasets.move_to_end(key)
+        return entry
+
+    def info(self, key):
+        entry = self._entry(key)
+        dataset = entry['dataset']
+        return {
+            'id': key,
+            'paths': entry['paths'],
+            'mapping': dataset.mapping,
+            'rows': len(dataset),
+            'min_datetime': _timestamp(dataset.min_datetime) if pd.notna(dataset.min_datetime) else None,
+            'max_datetime': _timestamp(dataset.max_datetime) if pd.notna(dataset.max_datetime) else None,
+        }
+
+    def datasets(self):
+        with self._lock:
+            keys = list(self._datasets)
+        return [self.info(key) for key in keys]
+
+    def count(self, key, params):
+        dataset = self._entry(key)['dataset']
+        return {'count': dataset.count(_timestamp(params.get('start')), _timestamp(params.get('end')))}
+
+    def _analysis_request(self, key, params):
+        # Validated parameters as the cache key; bad values raise ValueError
+        analysis_type = params.get('analysis', 'location')
+        if analysis_type not in SERVER_TYPES:
+            raise ValueError(f"The {analysis_type} analysis is not available from the analysis server")
+        location_type = params.get('location_type', 'main_city')
+        if location_type not in cdr_core.LOCATION_TYPES:
+            raise ValueError(f"Unknown location type: {location_type}")
+        top_n = params.get('top_n', 10)
+        if isinstance(top_n, bool) or not isinstance(top_n, int) or top_n < 1:
+            raise ValueError("top_n must be a positive whole number")
+        return key, analysis_type, _timestamp(params.get('start')), _timestamp(params.get('end')), location_type, top_n
+
+    def analyze(self, key, params):
+        # Returns the results as JSON text, from the cache when the same
+        # analysis of the same dataset was asked for before
+        dataset = self._entry(key)['dataset']
+        request = self._analysis_request(key, params)
+
+        with self._lock:
+            body = self._results.get(request)
+            if body is not None:
+                self._results.move_to_end(request)
+                return body
+
+        _, analysis_type, start, end, location_type, top_n = request
+        results = dataset.analyze(analysis_type, start, end, location_type=location_type, top_n=top_n)
+        body = json.dumps({
+            'type': results['type'],
+            'subtype': results.get('subtype'),
+            'title': results['title'],
+            'rows': dataset.count(start, end),
+            'data': frame_json(results['data']),
+        })
+        with self._lock:
+            # Not kept if the dataset was evicted meanwhile
+            if key in self._datasets:
+                self._results[request] = body
+                if len(self._results) > self.result_cache_size:
+                    self._results.popitem(last=False)
+        return body
+
+
+class PooledHTTPServer(HTTPServer):
+    # Requests are answered by a fixed pool of worker threads instead of
+    # a new thread per connection
+    def __init__(self, address, handler, service, workers=DEFAULT_WORKERS):
+        super().__init__(address, handler)
+        self.service = service
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cdr-server')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+class AnalysisHandler(BaseHTTPRequestHandler):
+    # JSON API:
+    #   GET  /datasets                     loaded datasets
+    #   POST /datasets                     {"paths": [...], "mapping": {...}}: load or reuse
+    #   GET  /datasets/<id>                one dataset
+    #   POST /datasets/<id>/count          {"start": ..., "end": ...}
+    #   POST /datasets/<id>/analyze        {"analysis", "start", "end", "location_type", "top_n"}
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        service = self.server.service
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        try:
+            params = self._read_json() if method == 'POST' else {}
+            if parts == ['datasets'] and method == 'GET':
+                body = json.dumps(service.datasets())
+            elif parts == ['datasets'] and method == 'POST':
+                body = json.dumps(service.open(params.get('paths') or [], params.get('mapping') or {}))
+            elif len(parts) == 2 and parts[0] == 'datasets' and method == 'GET':
+                body = json.dumps(service.info(parts[1]))
+            elif len(parts) == 3 and parts[0] == 'datasets' and parts[2] == 'count' and method == 'POST':
+                body = json.dumps(service.count(parts[1], params))
+            elif len(parts) == 3 and parts[0] == 'datasets' and parts[2] == 'analyze' and method == 'POST':
+                body = service.analyze(parts[1], params)
+            else:
+                return self._send(404, json.dumps({'error': f"Unknown endpoint {method} {self.path}"}))
+        except UnknownDataset as e:
+            return self._send(404, json.dumps({'error': f"Unknown dataset {e}; open it again"}))
+        except PermissionError as e:
+            return self._send(403, json.dumps({'error': str(e)}))
+        except KeyError as e:
+            return self._send(400, json.dumps({'error': f"Missing field: {e}"}))
+        except (ValueError, TypeError, OSError) as e:
+            return self._send(400, json.dumps({'error': str(e)}))
+        self._send(200, body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_REQUEST_BYTES:
+            raise ValueError("Request body too large")
+        params = json.loads(self.rfile.read(length) or b'{}')
+        if not isinstance(params, dict):
+            raise ValueError("Request body must be a JSON object")
+        return params
+
+    def _send(self, status, body):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(data_root, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=DEFAULT_WORKERS, max_datasets=DEFAULT_MAX_DATASETS,
+          result_cache_size=DEFAULT_RESULT_CACHE_SIZE, verbose=False):
+    service = AnalysisService(data_root, max_datasets, result_cache_size)
+    server = PooledHTTPServer((host, port), AnalysisHandler, service, workers)
+    server.verbose = verbose
+    return server
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='cdr_server',
+        description="Keep CDR datasets loaded in one process and answer analyses over HTTP, "
+                    "so several investigators share one warm copy of a case."
+    )
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help=f"Address to listen on; the default only accepts local connections (default: {DEFAULT_HOST})")
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT, help=f"Port (default: {DEFAULT_PORT})")
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"Requests handled at the same time (default: {DEFAULT_WORKERS})")
+    parser.add_argument('--data-root', default=os.getcwd(),
+                        help="Only CDR files under this folder can be opened; relative paths are taken from it "
+                             "(default: the current folder)")
+    parser.add_argument('--max-datasets', type=int, default=DEFAULT_MAX_DATASETS,
+                        help=f"Datasets kept loaded; the least recently used is dropped beyond this "
+                             f"(default: {DEFAULT_MAX_DATASETS})")
+    parser.add_argument('--result-cache', type=int, default=DEFAULT_RESULT_CACHE_SIZE,
+                        help=f"Analysis responses kept in memory (default: {DEFAULT_RESULT_CACHE_SIZE})")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log every request and pipeline stage to stderr")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.verbose:
+        PROFILER.add_listener(lambda event, record: event == 'end' and print(format_record(record), file=sys.stderr))
+    server = serve(args.data_root, args.host, args.port, args.workers, args.max_datasets, args.result_cache, args.verbose)
+    print(f"Serving CDR analyses of files under {server.service.data_root} on "
+          f"http://{args.host}:{server.server_address[1]}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
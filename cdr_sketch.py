@@ -0,0 +1,183 @@
+import numpy as np
+import pandas as pd
+
+import cdr_core
+from cdr_datetime import ChunkDateTimeParser
+from cdr_dtypes import phone_keys, read_dtypes
+from cdr_ingest import iter_cdr_chunks
+from cdr_profile import stage
+
+# Counters kept by a sketch; more counters give tighter error bounds
+DEFAULT_SKETCH_SIZE = 10_000
+
+STREAM_TYPES = ["numbers", "location"]
+
+
+class SpaceSaving:
+    # Space-Saving heavy hitters with at most `size` counters. Every chunk
+    # is counted exactly and merged in: tracked keys add their chunk count,
+    # new keys start from `bound`, the most an untracked key can have been
+    # seen, which becomes their error. When there are too many keys the
+    # smallest counts are evicted and `bound` rises to the largest of them.
+    # An estimate never undercounts and overcounts by at most its error;
+    # a key no longer tracked occurred at most `bound` times.
+    def __init__(self, size=DEFAULT_SKETCH_SIZE):
+        if size < 1:
+            raise ValueError("Sketch size must be at least 1")
+        self.size = size
+        self.keys = np.zeros(0, dtype=object)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.errors = np.zeros(0, dtype=np.int64)
+        self.bound = 0
+        self.total = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def update(self, chunk):
+        # chunk: exact counts of one chunk as a Series indexed by key
+        chunk_counts = chunk.to_numpy(dtype=np.int64)
+        self.total += int(chunk_counts.sum())
+
+        position = pd.Index(self.keys).get_indexer(chunk.index)
+        tracked = position >= 0
+        np.add.at(self.counts, position[tracked], chunk_counts[tracked])
+
+        new = ~tracked
+        keys = np.concatenate([self.keys, np.asarray(chunk.index, dtype=object)[new]])
+        counts = np.concatenate([self.counts, chunk_counts[new] + self.bound])
+        errors = np.concatenate([self.errors, np.full(int(new.sum()), self.bound, dtype=np.int64)])
+
+        if len(keys) > self.size:
+            order = np.argpartition(-counts, self.size - 1)
+            keep, evicted = order[:self.size], order[self.size:]
+            self.bound = max(self.bound, int(counts[evicted].max()))
+            keys, counts, errors = keys[keep], counts[keep], errors[keep]
+        self.keys, self.counts, self.errors = keys, counts, errors
+
+    def top(self, n):
+        # Positions of the n largest estimates, largest first
+        return np.argsort(-self.counts, kind='stable')[:n]
+
+    def threshold(self, n):
+        # The n-th largest guaranteed count (estimate minus error); every
+        # key at or above it in truth has an estimate at least as large
+        lower = np.sort(self.counts - self.errors)[::-1]
+        return int(lower[n - 1]) if len(lower) >= n else 0
+
+    def candidates(self, n):
+        # Tracked keys that may be among the n most frequent. The result is
+        # complete unless an untracked key could reach the threshold, i.e.
+        # bound >= threshold(n).
+        return self.keys[self.counts >= self.threshold(n)]
+
+
+def _chunk_counts(paths, mapping, column, start, end, phone, progress):
+    # Yields, per chunk, a frame indexed by key with the count and first
+    # spelling of every value of the column among records with a parseable
+    # date in [start, end]. Phone numbers get the same keys as in memory,
+    # normalizing each distinct spelling once.
+    lo = None if start is None else pd.Timestamp(start)
+    hi = None if end is None else pd.Timestamp(end)
+    time_col = mapping.get('time_col') or None
+    usecols = list(dict.fromkeys(col for col in (mapping['date_col'], time_col, column) if col))
+    # Dates and locations are dictionary encoded as they are read, and
+    # each distinct date and time is parsed once for all chunks
+    dtypes = {col: dtype for col, dtype in read_dtypes(mapping).items() if col in usecols}
+    parser = ChunkDateTimeParser(mapping['date_col'], time_col)
+
+    for i, path in enumerate(paths):
+        def file_progress(fraction, rows, i=i):
+            if progress:
+                progress((i + fraction) / len(paths), rows)
+
+        for chunk in iter_cdr_chunks(path, progress=file_progress, usecols=usecols, dtypes=dtypes):
+            datetimes, _ = parser.parse(chunk)
+            keep = datetimes.notna()
+            if lo is not None:
+                keep &= datetimes >= lo
+            if hi is not None:
+                keep &= datetimes <= hi
+            values = chunk[column][keep.to_numpy()]
+            if phone:
+                codes, uniques = pd.factorize(values)
+                labels = pd.Series(np.asarray(uniques, dtype=object)).astype(str).str.strip()
+                keys, numeric = phone_keys(labels)
+                counts = pd.DataFrame({
+                    'key': pd.Series(keys, dtype=object).where(numeric, labels),
+                    'count': np.bincount(codes[codes >= 0], minlength=len(uniques)),
+                    'label': labels,
+                }).groupby('key', sort=False).agg(count=('count', 'sum'), label=('label', 'first'))
+            else:
+                counts = values.value_counts(sort=False)
+                counts = counts[counts > 0]
+                counts = pd.DataFrame({'count': counts.to_numpy(), 'label': counts.index.to_numpy(dtype=object)},
+                                      index=counts.index.astype(object))
+            yield counts
+
+
+def _remember_labels(spelling, counts, wanted):
+    # Adds the first spelling of each wanted key not yet in spelling
+    new = counts.index.isin(wanted) & ~counts.index.isin(list(spelling))
+    spelling.update(zip(counts.index[new], counts['label'].to_numpy()[new]))
+
+
+def stream_top(paths, mapping, analysis_type, start=None, end=None, location_type="main_city", top_n=10,
+               size=DEFAULT_SKETCH_SIZE, verify=False, progress=None):
+    # Top-N numbers or locations in one chunked pass over the files, without
+    # loading them: memory is bounded by the sketch size and one chunk. With
+    # verify, a second pass counts the sketch's candidates exactly. Returns
+    # the analysis results plus 'error_bound', the most times a value
+    # missing from the list can occur, and 'exact'.
+    if analysis_type not in STREAM_TYPES:
+        raise ValueError(f"Streaming is only available for the {' and '.join(STREAM_TYPES)} analyses")
+    phone = analysis_type == "numbers"
+    column = mapping['phone_col'] if phone else cdr_core.location_column(mapping, location_type)
+    label_column = 'Phone Number' if phone else 'Location'
+
+    sketch = SpaceSaving(size)
+    spelling = {}
+    sketch_progress = (lambda fraction, rows: progress(fraction / 2, rows)) if progress and verify else progress
+    with stage('sketch', rows=0, analysis=analysis_type) as record:
+        for counts in _chunk_counts(paths, mapping, column, start, end, phone, sketch_progress):
+            sketch.update(counts['count'])
+            if not verify:
+                _remember_labels(spelling, counts, sketch.keys)
+                if len(spelling) > 2 * size:
+                    spelling = {key: spelling[key] for key in sketch.keys if key in spelling}
+        record['rows'] = sketch.total
+
+    if not verify:
+        top = sketch.top(top_n)
+        data = pd.DataFrame({
+            label_column: [spelling.get(key, key) for key in sketch.keys[top]],
+            'Count': sketch.counts[top],
+            'Max Error': sketch.errors[top],
+        })
+        exact = sketch.bound == 0
+    else:
+        candidates = sketch.candidates(top_n)
+        counts = pd.Series(dtype=np.int64)
+        verify_progress = (lambda fraction, rows: progress(0.5 + fraction / 2, rows)) if progress else None
+        with stage('sketch_verify', rows=sketch.total, candidates=len(candidates)):
+            for chunk in _chunk_counts(paths, mapping, column, start, end, phone, verify_progress):
+                chunk = chunk[chunk.index.isin(candidates)]
+                counts = counts.add(chunk['count'], fill_value=0)
+                _remember_labels(spelling, chunk, candidates)
+        counts = counts.astype(np.int64).sort_values(ascending=False, kind='stable').head(top_n)
+        data = pd.DataFrame({
+            label_column: [spelling.get(key, key) for key in counts.index],
+            'Count': counts.to_numpy(),
+        })
+        # Exact when no value outside the candidates could have made the list
+        exact = sketch.bound < sketch.threshold(top_n) or sketch.bound == 0
+
+    if phone:
+        results = cdr_core.number_results(data, top_n)
+    else:
+        results = cdr_core.location_results(data, location_type, top_n)
+    if not exact:
+        results["title"] += " (approximate)"
+    results["error_bound"] = sketch.bound
+    results["exact"] = exact
+    return results
@@ -0,0 +1,61 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+
+from cdr_profile import stage
+
+# Imported by the GUI in the background once its window is up, data stack
+# first. Plotting is left to the first chart.
+WARM_MODULES = (
+    'numpy', 'pandas', 'cdr_core', 'cdr_dtypes', 'cdr_ingest', 'cdr_dataset',
+    'cdr_cache', 'cdr_mappings', 'cdr_store', 'cdr_table',
+)
+
+# Modules that must not be imported before the window is shown
+HEAVY_MODULES = ('numpy', 'pandas', 'pyarrow', 'matplotlib', 'seaborn')
+
+# Seconds the GUI script may take to import, i.e. until it can build its
+# window; cdr_bench fails a run that goes over
+STARTUP_BUDGET_SECONDS = 0.5
+
+
+class LazyModule:
+    # Stands in for a module until one of its attributes is first used.
+    # If the warm-up job is importing the module at that moment, Python's
+    # per-module import lock makes the caller wait for that import rather
+    # than start a second one.
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def import_modules(job, modules=WARM_MODULES):
+    # Job importing modules ahead of their first use
+    with stage('imports'):
+        for name in modules:
+            job.check()
+            importlib.import_module(name)
+
+
+def measure_startup(script, python=sys.executable):
+    # Imports the GUI script in a fresh interpreter without running its
+    # main block. Returns (seconds, heavy modules it pulled in); raises
+    # CalledProcessError when the script cannot be imported.
+    code = (
+        "import json, runpy, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"runpy.run_path({script!r}, run_name='cdr_startup_check')\n"
+        "print(json.dumps([time.perf_counter() - start, sorted(sys.modules)]))\n"
+    )
+    # Run from the script's folder so its modules import as when launched
+    output = subprocess.run([python, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(script))).stdout
+    seconds, loaded = json.loads(output.splitlines()[-1])
+    return seconds, [name for name in HEAVY_MODULES if name in loaded]
@@ -0,0 +1,315 @@
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+import cdr_core
+from cdr_cache import DEFAULT_CACHE_DIR, files_digest
+from cdr_datetime import parse_datetime, parse_durations
+from cdr_dtypes import phone_keys
+from cdr_ingest import iter_cdr_chunks
+from cdr_profile import stage
+from cdr_temporal import EPOCH_WEEKDAY, NS_PER_HOUR, WEEKDAYS
+
+# SQLite stores live next to the Feather cache
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(DEFAULT_CACHE_DIR), 'stores')
+
+# Bumped whenever the table layout changes
+STORE_VERSION = 4
+
+# Store column -> mapping key of the location column it holds
+STORE_COLUMNS = {
+    'main_city': 'main_loc_col',
+    'sub_city': 'sub_loc_col',
+    'cell_id': 'cell_id_col',
+}
+
+# Store column -> mapping key of the phone number column it holds; both
+# share the phones table of display spellings
+PHONE_COLUMNS = {
+    'phone': 'phone_col',
+    'a_party': 'a_party_col',
+}
+
+NS_PER_DAY = 86_400 * 10 ** 9
+
+_MIN_TS = -2 ** 63
+_MAX_TS = 2 ** 63 - 1
+
+
+def _floor_div(expr, divisor):
+    # SQLite's integer division truncates toward zero, which would put
+    # records before 1970 in the following day; this rounds down instead
+    return f"(({expr}) - ((({expr}) % {divisor}) + {divisor}) % {divisor}) / {divisor}"
+
+
+def store_path(paths, mapping, store_dir=DEFAULT_STORE_DIR):
+    # One store per set of input files and column mapping
+    mapping_digest = hashlib.blake2b(json.dumps(mapping, sort_keys=True).encode(), digest_size=6).hexdigest()
+    return os.path.join(store_dir, f"{files_digest(paths)}-{mapping_digest}.sqlite")
+
+
+def _text_column(series):
+    # Stripped text with missing values as None, ready for sqlite3
+    text = series.astype(object)
+    present = text.notna()
+    text[present] = text[present].astype(str).str.strip()
+    return text.where(present, None)
+
+
+def _phone_column(con, series):
+    # Phones are grouped by the same keys as in memory, and the first
+    # spelling of each number is kept for display
+    labels = _text_column(series)
+    present = labels.notna()
+    keys, numeric = phone_keys(labels[present].astype(str))
+    normalized = pd.Series(keys.astype(str), index=labels[present].index, dtype=object).where(numeric, labels[present])
+    con.executemany(
+        "INSERT OR IGNORE INTO phones (phone, label) VALUES (?, ?)",
+        pd.DataFrame({'phone': normalized, 'label': labels[present]}).drop_duplicates('phone').itertuples(index=False)
+    )
+    phones = labels.copy()
+    phones[present] = normalized
+    return phones.tolist()
+
+
+def _insert_chunk(con, chunk, mapping):
+    cdr_core.validate_mapping(mapping, chunk.columns)
+    datetimes, failed = parse_datetime(chunk, mapping['date_col'], mapping.get('time_col') or None)
+
+    # Records without a parseable date can never match a range; drop them
+    valid = datetimes.notna().to_numpy()
+    chunk = chunk[valid]
+    ts = datetimes[valid].to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+    columns = {'ts': ts.tolist()}
+    for name, key in STORE_COLUMNS.items():
+        column = mapping.get(key)
+        columns[name] = _text_column(chunk[column]).tolist() if column else [None] * len(chunk)
+    for name, key in PHONE_COLUMNS.items():
+        column = mapping.get(key)
+        columns[name] = _phone_column(con, chunk[column]) if column else [None] * len(chunk)
+
+    if mapping.get('duration_col'):
+        durations = parse_durations(chunk[mapping['duration_col']]).astype(object)
+        columns['duration'] = durations.where(durations.notna(), None).tolist()
+    else:
+        columns['duration'] = [None] * len(chunk)
+
+    con.executemany(
+        "INSERT INTO cdr (ts, phone, a_party, main_city, sub_city, cell_id, duration) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        zip(columns['ts'], columns['phone'], columns['a_party'], columns['main_city'], columns['sub_city'],
+            columns['cell_id'], columns['duration'])
+    )
+    return len(ts), failed
+
+
+class OutOfCoreDataset:
+    # CDR records kept in a local SQLite file instead of memory. Analyses
+    # run as GROUP BY queries with the date range pushed down to an index
+    # on the timestamp; only the top-N rows come back into pandas.
+    def __init__(self, db_path):
+        self.db_path = db_path
+        meta = dict(self._query("SELECT key, value FROM meta"))
+        if int(meta.get('version', 0)) != STORE_VERSION:
+            raise ValueError(f"Unsupported store version in {db_path}")
+        self.mapping = json.loads(meta['mapping'])
+        self.rows = int(meta['rows'])
+
+    def _query(self, sql, params=()):
+        # A connection per query keeps the store usable from any thread
+        with closing(sqlite3.connect(self.db_path)) as con:
+            return con.execute(sql, params).fetchall()
+
+    @classmethod
+    def build(cls, paths, mapping, db_path, progress=None):
+        # Streams every file chunk by chunk into a new store.
+        # Returns (dataset, number of rows whose dates could not be parsed).
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        tmp_path = db_path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        con = sqlite3.connect(tmp_path)
+        try:
+            con.execute("PRAGMA journal_mode = OFF")
+            con.execute("PRAGMA synchronous = OFF")
+            con.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            con.execute("CREATE TABLE cdr (ts INTEGER NOT NULL, phone TEXT, a_party TEXT, main_city TEXT, sub_city TEXT, "
+                        "cell_id TEXT, duration INTEGER)")
+            con.execute("CREATE TABLE phones (phone TEXT PRIMARY KEY, label TEXT) WITHOUT ROWID")
+
+            rows = failed = 0
+            for i, path in enumerate(paths):
+                def file_progress(fraction, _rows, i=i):
+                    if progress:
+                        progress((i + fraction) / len(paths), rows)
+
+                for chunk in iter_cdr_chunks(path, progress=file_progress, usecols=cdr_core.mapped_columns(mapping)):
+                    with stage('store_insert', rows=len(chunk)):
+                        inserted, chunk_failed = _insert_chunk(con, chunk, mapping)
+                    rows += inserted
+                    failed += chunk_failed
+
+            if not rows:
+                raise ValueError("Could not parse dates. Please check the date format in your file.")
+
+            # Indexed after the bulk insert, which is much faster than maintaining it
+            with stage('store_index', rows=rows):
+                con.execute("CREATE INDEX cdr_ts ON cdr (ts)")
+            con.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+                ('version', str(STORE_VERSION)),
+                ('mapping', json.dumps(mapping)),
+                ('rows', str(rows)),
+            ])
+            con.commit()
+        finally:
+            con.close()
+
+        os.replace(tmp_path, db_path)
+        return cls(db_path), failed
+
+    @classmethod
+    def open_or_build(cls, paths, mapping, store_dir=DEFAULT_STORE_DIR, progress=None):
+        db_path = store_path(paths, mapping, store_dir)
+        if os.path.exists(db_path):
+            try:
+                return cls(db_path), 0
+            except (sqlite3.Error, ValueError, KeyError):
+                os.remove(db_path)
+        return cls.build(paths, mapping, db_path, progress)
+
+    def __len__(self):
+        return self.rows
+
+    def _bounds(self, start, end):
+        lo = _MIN_TS if start is None else pd.Timestamp(start).value
+        hi = _MAX_TS if end is None else pd.Timestamp(end).value
+        return lo, hi
+
+    def _timestamp(self, aggregate):
+        value = self._query(f"SELECT {aggregate}(ts) FROM cdr")[0][0]
+        return pd.NaT if value is None else pd.Timestamp(value)
+
+    @property
+    def min_datetime(self):
+        return self._timestamp('MIN')
+
+    @property
+    def max_datetime(self):
+        return self._timestamp('MAX')
+
+    def count(self, start=None, end=None):
+        return self._query("SELECT COUNT(*) FROM cdr WHERE ts BETWEEN ? AND ?", self._bounds(start, end))[0][0]
+
+    def _top(self, column, start, end, top_n):
+        query = f"""
+            SELECT {column}, COUNT(*) AS n FROM cdr
+            WHERE ts BETWEEN ? AND ? AND {column} IS NOT NULL
+            GROUP BY {column} ORDER BY n DESC LIMIT ?
+        """
+        if column == 'phone':
+            # Display the first spelling seen for each normalized number
+            query = f"SELECT p.label, t.n FROM ({query}) AS t JOIN phones AS p USING (phone) ORDER BY t.n DESC"
+        return self._query(query, (*self._bounds(start, end), top_n))
+
+    def _talk(self, column, start, end, top_n=None):
+        # Calls and talk time per value in one GROUP BY, most talk first
+        query = f"""
+            SELECT {column} AS value, COUNT(*), COALESCE(SUM(duration), 0), COUNT(duration), MAX(duration) FROM cdr
+            WHERE ts BETWEEN ? AND ? AND {column} IS NOT NULL
+            GROUP BY value
+        """
+        params = self._bounds(start, end)
+        if top_n is None:
+            return self._query(query + " ORDER BY value", params)
+        query += " ORDER BY 3 DESC, 2 DESC LIMIT ?"
+        if column == 'phone':
+            query = f"SELECT p.label, t.* FROM ({query}) AS t JOIN phones AS p ON p.phone = t.value ORDER BY 4 DESC, 3 DESC"
+            return [(label, *stats) for label, _, *stats in self._query(query, (*params, top_n))]
+        return self._query(query, (*params, top_n))
+
+    def _analyze_talk(self, analysis_type, start, end, location_type, top_n):
+        if not self.mapping.get('duration_col'):
+            raise ValueError("Call duration column not mapped")
+        if analysis_type == "longest":
+            # Same columns as in memory: the A party only when it is mapped
+            rows = self._query(
+                """SELECT c.ts, a.label, b.label, c.main_city, c.duration FROM cdr AS c
+                   LEFT JOIN phones AS a ON a.phone = c.a_party LEFT JOIN phones AS b ON b.phone = c.phone
+                   WHERE c.ts BETWEEN ? AND ? AND c.duration IS NOT NULL ORDER BY c.duration DESC LIMIT ?""",
+                (*self._bounds(start, end), top_n)
+            )
+            data = pd.DataFrame(rows, columns=['DateTime', 'A Party', 'B Party', 'Location', 'Duration (s)'])
+            data['DateTime'] = pd.to_datetime(data['DateTime'])
+            if not self.mapping.get('a_party_col'):
+                data = data.drop(columns='A Party')
+            return cdr_core.talk_results(data, analysis_type, top_n)
+
+        if analysis_type == "talk_dates":
+            rows = self._talk(_floor_div('ts', NS_PER_DAY), start, end)
+            days = np.array([row[0] for row in rows], dtype=np.int64)
+            labels, label_column = days.astype('datetime64[D]').astype(object), 'Date'
+        elif analysis_type == "talk_numbers":
+            rows = self._talk('phone', start, end, top_n)
+            labels, label_column = [row[0] for row in rows], 'Phone Number'
+        else:
+            # Raises for unmapped sub city / cell ID columns
+            cdr_core.location_column(self.mapping, location_type)
+            column = location_type if location_type in STORE_COLUMNS else 'main_city'
+            rows = self._talk(column, start, end, top_n)
+            labels, label_column = [row[0] for row in rows], 'Location'
+
+        stats = [np.array([row[i] for row in rows], dtype=np.float64) for i in range(1, 5)]
+        data = cdr_core.talk_frame(labels, *stats, label_column)
+        return cdr_core.talk_results(data, analysis_type, top_n,
+                                     location_type if analysis_type == "talk_locations" else None)
+
+    def analyze(self, analysis_type, start=None, end=None, location_type="main_city", top_n=10, suspects=(), hops=1,
+                burst_minutes=None, meeting_minutes=None):
+        with stage('analyze', analysis=analysis_type, out_of_core=True):
+            return self._analyze(analysis_type, start, end, location_type, top_n)
+
+    def _analyze(self, analysis_type, start, end, location_type, top_n):
+        if analysis_type == "location":
+            # Raises for unmapped sub city / cell ID columns
+            cdr_core.location_column(self.mapping, location_type)
+            column = location_type if location_type in STORE_COLUMNS else 'main_city'
+            data = pd.DataFrame(self._top(column, start, end, top_n), columns=['Location', 'Count'])
+            return cdr_core.location_results(data, location_type, top_n)
+        if analysis_type == "numbers":
+            data = pd.DataFrame(self._top('phone', start, end, top_n), columns=['Phone Number', 'Count'])
+            return cdr_core.number_results(data, top_n)
+        if analysis_type == "date":
+            rows = self._query(
+                f"SELECT {_floor_div('ts', NS_PER_DAY)} AS day, COUNT(*) FROM cdr WHERE ts BETWEEN ? AND ? GROUP BY day ORDER BY day",
+                self._bounds(start, end)
+            )
+            days = np.array([day for day, _ in rows], dtype=np.int64)
+            data = pd.DataFrame({
+                'Date': days.astype('datetime64[D]').astype(object),
+                'Call Count': [n for _, n in rows],
+            })
+            return cdr_core.date_volume_results(data)
+        if analysis_type == "heatmap":
+            day, hour = _floor_div('ts', NS_PER_DAY), _floor_div('ts', NS_PER_HOUR)
+            rows = self._query(
+                f"""SELECT (({day} + {EPOCH_WEEKDAY}) % 7 + 7) % 7 AS weekday, ({hour} % 24 + 24) % 24 AS hour,
+                           COUNT(*) FROM cdr WHERE ts BETWEEN ? AND ? GROUP BY weekday, hour""",
+                self._bounds(start, end)
+            )
+            matrix = np.zeros((7, 24), dtype=np.int64)
+            for weekday, hour, n in rows:
+                matrix[weekday, hour] = n
+            return cdr_core.heatmap_results(cdr_core.heatmap_frame(matrix, WEEKDAYS, 'Day'))
+        if analysis_type in ("common", "network", "copresence", "meetings"):
+            raise ValueError("Contact analyses are not available in out-of-core mode")
+        if analysis_type in cdr_core.TALK_TYPES:
+            return self._analyze_talk(analysis_type, start, end, location_type, top_n)
+        if analysis_type in ("hours", "bursts"):
+            raise ValueError("Active hour and burst analyses are not available in out-of-core mode")
+        raise ValueError(f"Unknown analysis type: {analysis_type}")
@@ -0,0 +1,129 @@
+import tkinter as tk
+from tkinter import ttk
+
+import numpy as np
+import pandas as pd
+
+# Pixels per row when the theme does not say
+DEFAULT_ROW_HEIGHT = 20
+
+DEFAULT_COLUMN_WIDTH = 110
+
+
+class VirtualTable(ttk.Frame):
+    # Sortable results grid over a DataFrame. The Treeview only ever holds
+    # the rows that fit on screen; scrolling rewrites those items from the
+    # frame, so showing 100k result rows costs the same as showing 20.
+    # Sorting reorders an index array, never the frame itself.
+    def __init__(self, master, height=20, column_width=DEFAULT_COLUMN_WIDTH, **kwargs):
+        super().__init__(master, **kwargs)
+        self.column_width = column_width
+        self.frame = pd.DataFrame()
+        self.order = np.zeros(0, dtype=np.int64)
+        self.offset = 0
+        self.visible = height
+        self.sort_column = None
+        self.ascending = True
+
+        self.tree = ttk.Treeview(self, show='headings', height=height, selectmode='browse')
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self._on_scrollbar)
+        self.tree.grid(row=0, column=0, sticky='nsew')
+        self.scrollbar.grid(row=0, column=1, sticky='ns')
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.tree.bind('<Configure>', self._on_resize)
+        self.tree.bind('<MouseWheel>', self._on_wheel)
+        self.tree.bind('<Button-4>', lambda e: self.scroll(-3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll(3))
+        self.tree.bind('<Prior>', lambda e: self.scroll(-self.visible))
+        self.tree.bind('<Next>', lambda e: self.scroll(self.visible))
+        self.tree.bind('<Home>', lambda e: self.scroll(-len(self.order)))
+        self.tree.bind('<End>', lambda e: self.scroll(len(self.order)))
+
+    def set_frame(self, frame):
+        # Shows a new result; the previous sort is dropped
+        self.frame = frame.reset_index(drop=True)
+        self.order = np.arange(len(self.frame))
+        self.offset = 0
+        self.sort_column = None
+        self.ascending = True
+
+        columns = [str(column) for column in self.frame.columns]
+        self.tree.delete(*self.tree.get_children())
+        self.tree['columns'] = columns
+        for i, column in enumerate(columns):
+            self.tree.heading(column, text=column, command=lambda i=i: self.sort(i))
+            self.tree.column(column, width=self.column_width, stretch=True,
+                             anchor=tk.E if pd.api.types.is_numeric_dtype(self.frame.iloc[:, i]) else tk.W)
+        self._render()
+
+    def clear(self):
+        self.set_frame(pd.DataFrame())
+
+    def sort(self, column_index):
+        # Clicking the sorted column again flips the direction
+        if self.sort_column == column_index:
+            self.ascending = not self.ascending
+        else:
+            self.sort_column, self.ascending = column_index, True
+        values = self.frame.iloc[:, column_index]
+        self.order = values.sort_values(ascending=self.ascending, kind='stable', na_position='last').index.to_numpy()
+
+        columns = self.tree['columns']
+        for i, column in enumerate(columns):
+            arrow = (' ▲' if self.ascending else ' ▼') if i == column_index else ''
+            self.tree.heading(column, text=column + arrow)
+        self.offset = 0
+        self._render()
+
+    def scroll(self, rows):
+        self._scroll_to(self.offset + rows)
+
+    def _scroll_to(self, offset):
+        offset = max(0, min(int(offset), max(len(self.order) - self.visible, 0)))
+        if offset != self.offset:
+            self.offset = offset
+            self._render()
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == 'moveto':
+            self._scroll_to(float(value) * len(self.order))
+        elif action == 'scroll':
+            step = self.visible if unit == 'pages' else 1
+            self.scroll(int(value) * step)
+
+    def _on_wheel(self, event):
+        # Windows reports multiples of 120, macOS small deltas
+        self.scroll(-int(event.delta / 120) * 3 if abs(event.delta) >= 120 else -event.delta)
+        return 'break'
+
+    def _on_resize(self, event):
+        # As many rows as fit below the heading
+        style = ttk.Style(self)
+        row_height = int(style.lookup('Treeview', 'rowheight') or DEFAULT_ROW_HEIGHT)
+        visible = max(1, event.height // row_height - 1)
+        if visible != self.visible:
+            self.visible = visible
+            self._scroll_to(self.offset)
+            self._render()
+
+    def _render(self):
+        # Rewrites the on-screen items from the current window of the order
+        positions = self.order[self.offset:self.offset + self.visible]
+        rows = self.frame.iloc[positions].astype(str).to_numpy() if len(positions) else []
+
+        items = self.tree.get_children()
+        for i, row in enumerate(rows):
+            if i < len(items):
+                self.tree.item(items[i], values=list(row))
+            else:
+                self.tree.insert('', tk.END, values=list(row))
+        if len(items) > len(rows):
+            self.tree.delete(*items[len(rows):])
+
+        total = len(self.order)
+        if total:
+            self.scrollbar.set(self.offset / total, min((self.offset + len(rows)) / total, 1.0))
+        else:
+            self.scrollbar.set(0.0, 1.0)
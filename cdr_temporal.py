@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+from cdr_defaults import DEFAULT_BURST_MINUTES
+
+NS_PER_MINUTE = 60 * 10 ** 9
+NS_PER_HOUR = 60 * NS_PER_MINUTE
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+# 1970-01-01 was a Thursday; weekdays count from Monday = 0
+EPOCH_WEEKDAY = 3
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+# Column labels of the 24 hour-of-day bins
+HOUR_LABELS = [f"{hour:02d}" for hour in range(24)]
+
+# Hours of day [start, end) counted as night calls
+NIGHT_HOURS = (0, 6)
+
+# A window is a burst when its calls exceed the usual count for that time
+# of day by this many standard deviations (Poisson), and are at least
+# MIN_BURST_CALLS
+DEFAULT_BURST_THRESHOLD = 3.0
+MIN_BURST_CALLS = 5
+
+
+def timestamps(times):
+    # int64 nanoseconds of a DateTime column and the mask of parsed rows.
+    # Every analysis below bins these integers; no per-row date or
+    # Timestamp objects are created.
+    ns = np.asarray(times.to_numpy(dtype='datetime64[ns]')).view(np.int64)
+    valid = ns != np.iinfo(np.int64).min
+    return ns, valid
+
+
+def hour_of_day(ns):
+    return (ns // NS_PER_HOUR % 24).astype(np.int8)
+
+
+def day_of_week(ns):
+    # Floor division keeps days before 1970 on the right weekday
+    return ((ns // NS_PER_DAY + EPOCH_WEEKDAY) % 7).astype(np.int8)
+
+
+def daily_counts(ns):
+    # (first day since the epoch, records per day from there on)
+    if not len(ns):
+        return 0, np.zeros(0, dtype=np.int64)
+    days = ns // NS_PER_DAY
+    first = int(days.min())
+    return first, np.bincount(days - first)
+
+
+def weekly_heatmap(ns):
+    # 7 x 24 matrix of records per weekday (rows, Monday first) and hour
+    slots = day_of_week(ns).astype(np.int64) * 24 + hour_of_day(ns)
+    return np.bincount(slots, minlength=7 * 24).reshape(7, 24)
+
+
+def hourly_profiles(values, ns, top_n):
+    # Hour-of-day profile of the top_n most frequent values (phone numbers)
+    # as (labels, calls, top_n x 24 matrix). Values are factorized once;
+    # only the chosen values' records are binned by hour.
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    present = codes >= 0
+    calls = np.bincount(codes[present], minlength=len(uniques))
+
+    top = np.argsort(-calls, kind='stable')[:top_n]
+    top = top[calls[top] > 0]
+    rank = np.full(len(uniques) + 1, -1, dtype=np.int64)
+    rank[top] = np.arange(len(top))
+    # Code -1 (missing) looks up the trailing -1
+    row = rank[codes]
+    chosen = row >= 0
+    cells = row[chosen] * 24 + hour_of_day(ns[chosen])
+    matrix = np.bincount(cells, minlength=len(top) * 24).reshape(len(top), 24)
+    return np.asarray(uniques)[top], calls[top], matrix
+
+
+def detect_bursts(ns, window_minutes=DEFAULT_BURST_MINUTES, threshold=DEFAULT_BURST_THRESHOLD):
+    # Windows with far more records than usual for their time of day.
+    # Records are counted per window with one bincount; the expected count
+    # of a window is the mean of all windows at the same clock time over
+    # the span. Consecutive flagged windows are merged into one burst.
+    # Returns (first window, last window, calls, expected calls, peak z)
+    # arrays, one entry per burst, with windows as int64 ns starts.
+    if window_minutes <= 0 or (24 * 60) % window_minutes:
+        raise ValueError("Burst window must divide a day, e.g. 5, 15, 30 or 60 minutes")
+    width = window_minutes * NS_PER_MINUTE
+    empty = np.zeros(0, dtype=np.int64)
+    if not len(ns):
+        return empty, empty, empty, np.zeros(0), np.zeros(0)
+
+    windows = ns // width
+    first = int(windows.min())
+    counts = np.bincount(windows - first)
+
+    # Time-of-day slot of every window in the span
+    per_day = NS_PER_DAY // width
+    slots = (np.arange(len(counts)) + first) % per_day
+    expected = (np.bincount(slots, weights=counts, minlength=per_day)
+                / np.maximum(np.bincount(slots, minlength=per_day), 1))[slots]
+    z = (counts - expected) / np.sqrt(np.maximum(expected, 1.0))
+    flagged = np.flatnonzero((z >= threshold) & (counts >= MIN_BURST_CALLS))
+    if not len(flagged):
+        return empty, empty, empty, np.zeros(0), np.zeros(0)
+
+    # Runs of consecutive windows
+    starts = np.flatnonzero(np.diff(flagged, prepend=-2) != 1)
+    run_first = flagged[starts]
+    run_last = flagged[np.r_[starts[1:], len(flagged)] - 1]
+    calls = np.add.reduceat(counts[flagged], starts)
+    expected_calls = np.add.reduceat(expected[flagged], starts)
+    peak = np.maximum.reduceat(z[flagged], starts)
+    return (first + run_first) * width, (first + run_last + 1) * width, calls, expected_calls, peak
+
+
+def burst_members(ns, bounds):
+    # Burst index of every record (-1 outside all bursts); bounds are the
+    # sorted, non-overlapping [start, end) ns ranges of the bursts
+    starts, ends = bounds
+    position = np.searchsorted(starts, ns, side='right') - 1
+    inside = position >= 0
+    inside[inside] = ns[inside] < ends[position[inside]]
+    return np.where(inside, position, -1)